@@ -1,51 +1,20 @@
 # %%
+import sys
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-import plotly.express as px
+from pathlib import Path
 
+# run from COMSOL/ or anywhere else: modules/ lives in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from modules.comsol_data import load_stress_nodes
 
-def load_txt_file_to_df(file_path, column_names):
-    data = np.loadtxt(file_path, comments='%', unpack=True)
-    data_dict = dict(zip(column_names, data))
-    df = pd.DataFrame(data_dict)
-    # for column in column_names:
-    #     df[column] = df[column].astype(np.float32)
-    return df
 
-file_path = 'sxx.txt'
-column_names = ['X', 'Y', 'sxx', 'u', 'v']
-df_sxx = load_txt_file_to_df(file_path, column_names)
-print(df_sxx.describe())
-print(df_sxx.info())
-print(df_sxx.tail())
-
-
-file_path = 'sxy.txt'
-column_names = ['X', 'Y', 'sxy', 'u', 'v']
-df_sxy = load_txt_file_to_df(file_path, column_names)
-print(df_sxy.describe())
-print(df_sxy.info())
-print(df_sxy.tail())
-
-
-file_path = 'syy.txt'
-column_names = ['X', 'Y', 'syy', 'u', 'v']
-df_syy = load_txt_file_to_df(file_path, column_names)
-print(df_syy.describe())
-print(df_syy.info())
-print(df_syy.tail())
-
-
-# %%
-# Merge the dataframes on X and Y coordinates
-df_merged = df_sxx.merge(df_sxy, on=['X', 'Y'], suffixes=('', '_sxy'), how='left')
-# print(df_merged.head())
-df_merged = df_merged.drop(['u_sxy', 'v_sxy'], axis=1)
-# print(df_merged.head())
-df_merged = df_merged.merge(df_syy, on=['X', 'Y'], suffixes=('', '_syy'), how='left')
-# print(df_merged.head())
-df_merged = df_merged.drop(['u_syy', 'v_syy'], axis=1)
+# parsed in one pass per file, aligned by node and cached in stress_nodes.sir
+nodes = load_stress_nodes(Path(__file__).parent)
+df_merged = pd.DataFrame(nodes._asdict())
+df_merged = df_merged.rename(columns={'x': 'X', 'y': 'Y'})
+df_merged = df_merged.dropna()  # the few nodes missing from one of the exports
 
 # Reorder columns to desired order
 df_merged = df_merged[['X', 'Y', 'u', 'v', 'sxx', 'sxy', 'syy']]
@@ -74,12 +43,6 @@ df_merged['theta'] = principal_angles(df_merged['sxx'], df_merged['sxy'], df_mer
 
 print(df_merged.head())
 # %%
-# save the df_merged to a csv file
-df_merged.to_csv('COMSOL_simulation_stresses.csv', index=False)
-
-# %%
-
-df_merged = pd.read_csv('COMSOL_simulation_stresses.csv')
 color_map = 'jet'
 fig, ax = plt.subplots(3, 1, figsize=(10, 15))
 ax[0].tricontourf(df_merged['X'], df_merged['Y'], df_merged['s1'], cmap=color_map)
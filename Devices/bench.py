@@ -0,0 +1,121 @@
+"""
+The polariscope bench: LED, camera and the four rotation mounts, either the real
+devices or simulated ones, behind the same methods.
+
+    bench = open_bench(config, simulate=True)
+    bench.polarizer.move_to_position(45)
+    bench.camera.save_image_png_typewrite("I1_CZT.png", save_path="SIMULATED")
+
+The real device classes load Windows DLLs or drive the camera GUI when created,
+so they are only imported when a real bench is opened.
+"""
+from loguru import logger
+from modules.acquisition_planner import MotionProfile
+
+MOUNT_NAMES = ("polarizer", "qwp1", "qwp2", "analyzer")
+MOUNT_LABELS = {"polarizer": "Polarizer", "qwp1": "QWP1", "qwp2": "QWP2", "analyzer": "Analyzer"}
+MIRRORED_MOUNTS = ("qwp1", "analyzer")
+
+
+class Bench:
+    def __init__(self, led, camera, polarizer, qwp1, qwp2, analyzer, optics=None):
+        self.led = led
+        self.camera = camera
+        self.polarizer = polarizer
+        self.qwp1 = qwp1
+        self.qwp2 = qwp2
+        self.analyzer = analyzer
+        self.optics = optics  # SimulatedPolariscope, None for the real bench
+        self.open_mounts = []
+
+    @property
+    def simulated(self):
+        return self.optics is not None
+
+    @property
+    def rotation_mounts(self):
+        return [self.polarizer, self.qwp1, self.qwp2, self.analyzer]
+
+    def open(self, mounts=MOUNT_NAMES):
+        """Open the named mounts, e.g. only ("polarizer", "analyzer") without the QWPs."""
+        self.open_mounts = [getattr(self, name) for name in mounts]
+        for mount in self.open_mounts:
+            mount.open_device()
+            mount.setup_conversion()
+
+    def close(self):
+        self.led.turn_off()
+        for mount in self.open_mounts:
+            mount.close_device()
+        self.open_mounts = []
+
+    def prompt(self, message):
+        """input() on the real bench; the simulated bench answers Enter straight away."""
+        if self.simulated:
+            logger.info(f"{message} [simulated: continuing]")
+            return ""
+        return input(message)
+
+    def set_qwps(self, state):
+        """Ask for the QWPs to be 'mounted' or 'removed'; the simulated bench does it itself."""
+        action = "Mount" if state == "mounted" else "Remove"
+        self.prompt(f"{action} the QWPs before continuing. Press Enter to continue.")
+        if self.simulated:
+            self.optics.qwps_mounted = state == "mounted"
+
+    def set_sample(self, present):
+        """Ask for the sample to be put in or taken out of the beam."""
+        action = "Put the sample in" if present else "Take the sample out of"
+        self.prompt(f"{action} the beam. Press Enter to continue.")
+        if self.simulated:
+            self.optics.sample_in_beam = present
+
+
+def real_bench(config):
+    from Devices.thorlabs_rotation_mount import RotationMount
+    from Devices.camera_automation import CameraAutomation
+    from Devices.LED_control import LEDController
+
+    mounts = {name: RotationMount(config[f"{name}_SN"], label=MOUNT_LABELS[name],
+                                  mirror=name in MIRRORED_MOUNTS)
+              for name in MOUNT_NAMES}
+    return Bench(LEDController(), CameraAutomation(), **mounts)
+
+
+def simulated_bench(config=None, time_scale=1.0, sample=None):
+    """
+    Bench of simulated devices. Settings come from the [simulation] table of
+    config.toml if present: velocity, acceleration, overhead (mount motion),
+    image_size, load, fringe_value, thickness (disc sample), read_noise, exposure_time,
+    mount_offsets (true offsets of the simulated mounts).
+    """
+    from Devices.simulated_rotation_mount import SimulatedRotationMount
+    from Devices.simulated_devices import (SimulatedLEDController, SimulatedCamera,
+                                           SimulatedPolariscope, SimulatedSample)
+
+    settings = (config or {}).get("simulation", {})
+    profile = MotionProfile(**{name: settings[name] for name in MotionProfile._fields if name in settings})
+    mounts = {name: SimulatedRotationMount(label=MOUNT_LABELS[name], mirror=name in MIRRORED_MOUNTS,
+                                           profile=profile, time_scale=time_scale)
+              for name in MOUNT_NAMES}
+    if sample is None:
+        size = settings.get("image_size", 256)
+        sample = SimulatedSample.disc((size, size), load=settings.get("load", 1500.0),
+                                      fringe_value=settings.get("fringe_value", 7.0),
+                                      thickness=settings.get("thickness", 5.0))
+    led = SimulatedLEDController()
+    offsets = tuple(settings.get("mount_offsets", [90.0] * 4))
+    optics = SimulatedPolariscope(led=led, sample=sample, phase_offset=offsets, **mounts)
+    camera = SimulatedCamera(optics, read_noise=settings.get("read_noise", 20.0),
+                             exposure_time=settings.get("exposure_time", 0.5), time_scale=time_scale)
+    return Bench(led, camera, optics=optics, **mounts)
+
+
+def open_bench(config, simulate=False, mounts=MOUNT_NAMES, **kwargs):
+    """
+    Create the real or simulated bench and open the named mounts.
+    kwargs go to simulated_bench().
+    """
+    bench = simulated_bench(config, **kwargs) if simulate else real_bench(config)
+    bench.open(mounts)
+    return bench
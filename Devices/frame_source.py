@@ -0,0 +1,232 @@
+"""
+Frame sources: deliver camera frames as in-memory numpy arrays.
+
+    source = SimulatedFrameSource(bench.camera)
+    frame = source.grab("I1")        # Frame(name, array, path, time_to_array)
+
+SimulatedFrameSource takes frames from the simulated camera.
+FileWatcherFrameSource waits for the camera software to write a new image file into
+a folder (either by itself, e.g. in auto-save mode, or after a trigger such as
+CameraAutomation.save_image_png_typewrite) and decodes it as soon as it is complete.
+
+AveragingFrameSource wraps either of them to average K frames per step.
+
+FrameWriter saves in-memory frames to disk on a background thread, so persistence
+does not hold up the next move.
+"""
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+from loguru import logger
+import numpy as np
+import cv2
+from modules.image_process import decode_image
+from modules.frame_averaging import FrameAccumulator
+
+
+class Frame(NamedTuple):
+    name: str
+    array: np.ndarray
+    path: Path | None      # file the frame came from, None for in-memory sources
+    time_to_array: float   # seconds from the grab request to the decoded array
+    variance: np.ndarray | None = None  # per-pixel variance of array, for averaged frames
+
+
+class FrameTimingStats:
+    """
+    Time-to-array of every grabbed frame, by frame name.
+    """
+    def __init__(self):
+        self.times = {}
+
+    def add(self, frame):
+        self.times[frame.name] = frame.time_to_array
+
+    def __str__(self):
+        if not self.times:
+            return "no frames"
+        times = np.array(list(self.times.values()))
+        return (f"{len(times)} frames, time to array mean {times.mean():.2f} s, "
+                f"max {times.max():.2f} s, total {times.sum():.2f} s")
+
+
+class SimulatedFrameSource:
+    """
+    Frames rendered by a SimulatedCamera, never touching the disk.
+    """
+    def __init__(self, camera):
+        self.camera = camera
+        self.stats = FrameTimingStats()
+
+    def grab(self, name):
+        start_time = time.perf_counter()
+        array = self.camera.capture()
+        frame = Frame(name, array, None, time.perf_counter() - start_time)
+        self.stats.add(frame)
+        return frame
+
+
+class FileWatcherFrameSource:
+    """
+    Frames written by the camera software into watch_dir.
+
+    grab() calls trigger(name) if given, then waits for an image file that is new or
+    rewritten (changed modification time or size) since the trigger, waits until its
+    size stops changing and decodes it. A file written again under an existing name,
+    e.g. by a re-run into the same capture folder, counts as new.
+
+    Args:
+        watch_dir: Folder the camera software saves into
+        trigger (callable, optional): Called with the frame name to make the camera save
+            a frame, e.g. lambda name: cam.save_image_png_typewrite(f"{name}_CZT.png")
+        pattern (str): Glob of the image files to pick up
+        timeout (float): Seconds to wait for a new file before raising TimeoutError
+        poll_interval (float): Seconds between checks of the folder
+    """
+    def __init__(self, watch_dir, trigger=None, pattern="*.png", timeout=30.0, poll_interval=0.05):
+        self.watch_dir = Path(watch_dir)
+        self.trigger = trigger
+        self.pattern = pattern
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stats = FrameTimingStats()
+        self._seen = self._list_files()
+
+    def _list_files(self):
+        """(st_mtime_ns, st_size) of every matching file, by path."""
+        files = {}
+        if not self.watch_dir.exists():
+            return files
+        for path in self.watch_dir.glob(self.pattern):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:   # removed between glob and stat
+                continue
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def grab(self, name):
+        start_time = time.perf_counter()
+        if self.trigger is not None:
+            # whatever is in the folder now was there before this frame was requested
+            self._seen = self._list_files()
+            self.trigger(name)
+        path = self._wait_for_new_file(start_time)
+        array = self._read_when_complete(path, start_time)
+        try:
+            stat = path.stat()
+            self._seen[path] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+        frame = Frame(name, array, path, time.perf_counter() - start_time)
+        self.stats.add(frame)
+        logger.debug(f"{name} - {path.name} decoded {frame.time_to_array:.2f} s after the request")
+        return frame
+
+    def _wait_for_new_file(self, start_time):
+        while time.perf_counter() - start_time < self.timeout:
+            files = self._list_files()
+            new_files = [path for path, signature in files.items() if self._seen.get(path) != signature]
+            if new_files:
+                path = min(new_files, key=lambda p: files[p][0])
+                self._seen[path] = files[path]
+                return path
+            time.sleep(self.poll_interval)
+        raise TimeoutError(f"No new {self.pattern} file in {self.watch_dir} after {self.timeout} s")
+
+    def _read_when_complete(self, path, start_time):
+        # the file may still be being written: wait for a stable size and a clean decode
+        last_size = -1
+        while time.perf_counter() - start_time < self.timeout:
+            size = path.stat().st_size
+            if size == last_size and size > 0:
+                try:
+                    # read into memory so the camera software can reuse the file name
+                    return decode_image(io.BytesIO(path.read_bytes()))
+                except ValueError:
+                    pass
+            last_size = size
+            time.sleep(self.poll_interval)
+        raise TimeoutError(f"{path} was not completely written after {self.timeout} s")
+
+
+class AveragingFrameSource:
+    """
+    Average frames_per_step frames of another source for every grab.
+
+    The frames are folded into a FrameAccumulator as they arrive and dropped, so
+    memory does not grow with frames_per_step. The returned frame holds the float64
+    mean and, for two or more frames, the variance of that mean.
+
+    Args:
+        source: Frame source to grab from, e.g. SimulatedFrameSource
+        frames_per_step (int): Frames averaged per grab
+    """
+    def __init__(self, source, frames_per_step):
+        if frames_per_step < 1:
+            raise ValueError(f"frames_per_step must be at least 1, got {frames_per_step}")
+        self.source = source
+        self.frames_per_step = frames_per_step
+        self.stats = FrameTimingStats()
+        self._accumulator = FrameAccumulator()
+
+    def grab(self, name):
+        start_time = time.perf_counter()
+        accumulator = self._accumulator
+        accumulator.reset()
+        for i in range(1, self.frames_per_step + 1):
+            # numbered names keep the source's files apart, e.g. I3_1 ... I3_K
+            source_name = name if self.frames_per_step == 1 else f"{name}_{i}"
+            accumulator.add(self.source.grab(source_name).array)
+        variance = accumulator.variance_of_mean() if accumulator.count > 1 else None
+        frame = Frame(name, accumulator.mean.copy(), None, time.perf_counter() - start_time, variance)
+        self.stats.add(frame)
+        logger.debug(f"{name} - {accumulator.count} frames averaged in {frame.time_to_array:.2f} s")
+        return frame
+
+
+class FrameWriter:
+    """
+    Save frames as PNG on a background thread.
+
+    Args:
+        save_dir: Folder to write into
+        suffix (str): Appended to the frame name, e.g. '_CZT' gives I1_CZT.png
+    """
+    def __init__(self, save_dir, suffix="_CZT"):
+        self.save_dir = Path(save_dir)
+        self.save_dir.mkdir(parents=True, exist_ok=True)
+        self.suffix = suffix
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._futures = []
+
+    def submit(self, frame):
+        """Queue a frame for saving; returns the future of its path."""
+        path = self.save_dir / f"{frame.name}{self.suffix}.png"
+        future = self._executor.submit(self._write, frame.array, path)
+        self._futures.append(future)
+        return future
+
+    @staticmethod
+    def _write(array, path):
+        if np.issubdtype(array.dtype, np.floating):
+            # averaged frames are saved rounded to the camera's 16 bits
+            array = np.clip(np.rint(array), 0, 65535).astype(np.uint16)
+        if not cv2.imwrite(str(path), array):
+            raise OSError(f"Could not write {path}")
+        return path
+
+    def close(self):
+        """Wait for all queued frames to be written; raises the first write error."""
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,131 @@
+"""
+Waiting for rotation mount moves to finish.
+
+A move is complete when the controller posts a 'moved' message, or, if messages are
+not available, when the status bits say the motor has stopped within tolerance of
+the target. The position is polled with exponential backoff: fast at first so short
+moves return promptly, slower later so long moves do not flood the USB link.
+An optional settle window then requires the position to stay within tolerance for
+that long before the move counts as done.
+
+A backend is any object with position(), is_moving() and pop_message(), see
+KinesisMountBackend and SimulatedMountBackend.
+"""
+import time
+from typing import NamedTuple
+import numpy as np
+
+# Kinesis message ids of the generic motor message type
+GENERIC_MOTOR = 2
+HOMED = 0
+MOVED = 1
+STOPPED = 2
+
+
+class MoveTimeoutError(TimeoutError):
+    pass
+
+
+class MoveResult(NamedTuple):
+    position: float
+    latency: float       # seconds from the move command to completion
+    polls: int
+    completed_by: str    # 'message' or 'status'
+
+
+def wait_for_move(backend, target, tolerance=0.1, timeout=60.0, settle_window=0.0,
+                  initial_interval=0.01, max_interval=0.1, backoff=1.5, use_messages=True,
+                  start_time=None, clock=time.perf_counter, sleep=time.sleep):
+    """
+    Block until the mount reaches target.
+
+    Args:
+        backend: Mount backend
+        target (float): Position in device degrees
+        tolerance (float): Allowed distance from target in degrees
+        timeout (float): Seconds before giving up with MoveTimeoutError
+        settle_window (float): Seconds the position must stay within tolerance
+        initial_interval, max_interval, backoff: Poll interval grows by backoff
+            from initial_interval up to max_interval
+        use_messages (bool): Accept the controller's moved/homed message as completion
+        start_time (float, optional): clock() when the move was commanded
+
+    Returns:
+        MoveResult
+    """
+    start_time = clock() if start_time is None else start_time
+    interval = initial_interval
+    polls = 0
+    completed_by = None
+    settled_since = None
+    while True:
+        polls += 1
+        now = clock()
+        position = backend.position()
+        on_target = np.isclose(position, target, atol=tolerance)
+        if completed_by is None:
+            if use_messages and _move_message(backend):
+                completed_by = "message"
+            elif on_target and not backend.is_moving():
+                completed_by = "status"
+        if completed_by is not None:
+            if on_target:
+                if settled_since is None:
+                    settled_since = now
+                if now - settled_since >= settle_window:
+                    return MoveResult(position, now - start_time, polls, completed_by)
+            else:
+                settled_since = None
+        if now - start_time > timeout:
+            raise MoveTimeoutError(f"Move to {target} not finished after {timeout} s, at {position}")
+        sleep(interval)
+        interval = min(interval * backoff, max_interval)
+
+
+def _move_message(backend):
+    """True if a homed/moved/stopped message is waiting; other messages are discarded."""
+    while (message := backend.pop_message()) is not None:
+        message_type, message_id = message
+        if message_type == GENERIC_MOTOR and message_id in (HOMED, MOVED, STOPPED):
+            return True
+    return False
+
+
+class MoveLatencyStats:
+    """
+    Latencies of completed moves, for reporting per mount.
+    """
+    def __init__(self):
+        self.latencies = []
+        self.polls = []
+
+    def add(self, result):
+        self.latencies.append(result.latency)
+        self.polls.append(result.polls)
+
+    def __len__(self):
+        return len(self.latencies)
+
+    def summary(self):
+        """
+        Returns:
+            dict: count, mean, median, p95 and max latency in seconds, mean polls per move
+        """
+        if not self.latencies:
+            return {"count": 0}
+        latencies = np.array(self.latencies)
+        return {
+            "count": len(latencies),
+            "mean": float(latencies.mean()),
+            "median": float(np.median(latencies)),
+            "p95": float(np.percentile(latencies, 95)),
+            "max": float(latencies.max()),
+            "polls": float(np.mean(self.polls)),
+        }
+
+    def __str__(self):
+        s = self.summary()
+        if not s["count"]:
+            return "no moves"
+        return (f"{s['count']} moves, latency mean {s['mean']:.2f} s, median {s['median']:.2f} s, "
+                f"p95 {s['p95']:.2f} s, max {s['max']:.2f} s, {s['polls']:.1f} polls per move")
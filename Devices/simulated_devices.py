@@ -0,0 +1,161 @@
+"""
+Simulated LED and camera for running the acquisition scripts without hardware.
+
+SimulatedPolariscope ties the simulated mounts, LED and sample together; the
+SimulatedCamera renders what the sensor would see for the current mount angles
+with modules.polariscope_model, from a known stress field.
+"""
+import time
+from pathlib import Path
+from loguru import logger
+import numpy as np
+import cv2
+from modules.polariscope_model import (sample_elements, intensity_from_elements, stress_to_optics,
+                                      disc_under_compression)
+
+
+class SimulatedLEDController:
+    """
+    Same methods as LEDController, without the upSERIES driver.
+    """
+    def __init__(self, verbose=False, current_limit=1000.0, wavelength=0.0):
+        logger.info("Initializing simulated LED Controller")
+        self.current_setpoint = 0.0  # mA
+        self.current_limit = current_limit
+        self.wavelength = wavelength
+        self.is_on = False
+        self.verbose = verbose
+
+    def get_current_setpoint(self):
+        """Get current LED current setpoint in mA"""
+        return self.current_setpoint
+
+    def set_current(self, current_ma):
+        """Set LED current in mA"""
+        self.current_setpoint = float(min(current_ma, self.current_limit))
+        logger.info(f"Current set to {self.current_setpoint:.1f} mA")
+
+    def turn_on(self):
+        """Turn LED on"""
+        logger.info("Turning LED on")
+        self.is_on = True
+
+    def turn_off(self):
+        """Turn LED off"""
+        logger.info("Turning LED off")
+        self.is_on = False
+
+    @property
+    def output(self):
+        """Light output in mA of drive current, 0 when off."""
+        return self.current_setpoint if self.is_on else 0.0
+
+    def print_parameters(self):
+        """Print LED parameters"""
+        print("\nSimulated LED Parameters:")
+        print(f"Current Limit: {self.current_limit:.1f} mA")
+        print(f"Current Setpoint: {self.current_setpoint:.1f} mA")
+
+
+class SimulatedSample:
+    """
+    Isoclinic angle and retardation maps of a sample, from a plane stress field.
+    """
+    def __init__(self, sxx, syy, sxy, fringe_value=7.0, thickness=5.0):
+        self.sxx, self.syy, self.sxy = sxx, syy, sxy
+        self.theta, self.delta = stress_to_optics(sxx, syy, sxy, fringe_value, thickness)
+        # Mueller matrix elements, computed once for every frame rendered
+        self.elements = sample_elements(self.theta, self.delta, dtype=np.float32)
+
+    @classmethod
+    def disc(cls, shape=(256, 256), radius=None, load=1500.0, fringe_value=7.0, thickness=5.0):
+        """Disc under diametral compression, filling most of the image."""
+        radius = 0.4 * min(shape) if radius is None else radius
+        sxx, syy, sxy, _ = disc_under_compression(shape, radius, load, thickness)
+        return cls(sxx, syy, sxy, fringe_value, thickness)
+
+    @property
+    def shape(self):
+        return self.theta.shape
+
+
+class SimulatedPolariscope:
+    """
+    Optical state of the simulated bench: which mounts hold which element, whether
+    the QWPs and the sample are in the beam, and the LED.
+
+    Mount angles are converted to optical angles like control_script does in
+    reverse: undo the mirror, then subtract phase_offset. phase_offset is the true
+    offset of the simulated mounts, one for all or a (polarizer, qwp1, qwp2,
+    analyzer) tuple, and need not match [mount_offsets] in config.toml.
+    """
+    def __init__(self, polarizer, qwp1, qwp2, analyzer, led, sample=None, phase_offset=90.0,
+                 qwps_mounted=False, sample_in_beam=True):
+        self.polarizer, self.qwp1, self.qwp2, self.analyzer = polarizer, qwp1, qwp2, analyzer
+        self.led = led
+        self.sample = sample
+        self.phase_offset = phase_offset
+        offsets = phase_offset if isinstance(phase_offset, (tuple, list)) else [phase_offset] * 4
+        self.offsets = dict(zip(("polarizer", "qwp1", "qwp2", "analyzer"), offsets))
+        self.qwps_mounted = qwps_mounted
+        self.sample_in_beam = sample_in_beam
+
+    def optical_angle(self, name):
+        mount = getattr(self, name)
+        position = mount.current_position
+        if mount.mirror:
+            position = 360 - position
+        return np.radians(position - self.offsets[name])
+
+    def render(self, shape):
+        """Noise-free intensity for a fully lit pixel, in units of LED mA."""
+        if self.sample is not None and self.sample_in_beam:
+            elements = self.sample.elements
+        else:
+            elements = sample_elements(np.zeros(shape), np.zeros(shape), dtype=np.float32)
+        qwp1 = self.optical_angle("qwp1") if self.qwps_mounted else None
+        qwp2 = self.optical_angle("qwp2") if self.qwps_mounted else None
+        return intensity_from_elements(elements, self.optical_angle("polarizer"), qwp1, qwp2,
+                                       self.optical_angle("analyzer"), intensity=self.led.output)
+
+
+class SimulatedCamera:
+    """
+    Same saving methods as CameraAutomation, writing rendered 16-bit PNGs.
+
+    Counts are dark_level + counts_per_ma * LED mA * intensity, with shot noise
+    (gain counts per electron) and Gaussian read noise, clipped to 16 bits.
+    """
+    def __init__(self, polariscope, shape=(256, 256), counts_per_ma=120.0, dark_level=100.0,
+                 read_noise=20.0, gain=4.0, exposure_time=0.5, time_scale=1.0, seed=0):
+        logger.info("Initializing simulated camera")
+        self.polariscope = polariscope
+        self.shape = tuple(polariscope.sample.shape) if polariscope.sample is not None else tuple(shape)
+        self.counts_per_ma = counts_per_ma
+        self.dark_level = dark_level
+        self.read_noise = read_noise
+        self.gain = gain
+        self.exposure_time = exposure_time
+        self.time_scale = time_scale
+        self.save_path = Path(".")
+        self.rng = np.random.default_rng(seed)
+
+    def capture(self):
+        """Take one frame as a uint16 array."""
+        time.sleep(self.exposure_time * self.time_scale)
+        signal = self.counts_per_ma * self.polariscope.render(self.shape)
+        if self.gain > 0:
+            signal = self.gain * self.rng.poisson(np.maximum(signal, 0) / self.gain)
+        counts = self.dark_level + signal + self.rng.normal(0, self.read_noise, self.shape)
+        return np.clip(np.rint(counts), 0, 65535).astype(np.uint16)
+
+    def save_image_png(self, file_name, save_path=None):
+        logger.info(f"Saving image as PNG - Filename: {file_name}, Path: {save_path}")
+        if save_path is not None:
+            self.save_path = Path(save_path)
+        self.save_path.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(self.save_path / file_name), self.capture())
+        logger.success(f"Image saved successfully as {file_name}")
+
+    # the real camera types the path into the vendor GUI; here both save the same way
+    save_image_png_typewrite = save_image_png
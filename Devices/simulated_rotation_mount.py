@@ -0,0 +1,77 @@
+import time
+from loguru import logger
+from modules.acquisition_planner import MotionProfile
+from Devices.move_completion import GENERIC_MOTOR, HOMED, MOVED
+from Devices.thorlabs_rotation_mount import RotationMount
+
+
+class SimulatedMountBackend:
+    """
+    Mount backend that needs no Kinesis DLL. Moves follow a MotionProfile in time
+    scaled by time_scale (0 for instant moves) and post a 'moved' message when done,
+    like the real controller.
+    """
+    def __init__(self, profile=MotionProfile(), time_scale=1.0, position=0.0, clock=time.perf_counter):
+        self.profile = profile
+        self.time_scale = time_scale
+        self.clock = clock
+        self._start_position = position
+        self._distance = 0.0
+        self._start_time = clock()
+        self._done_message = None
+        self._messages = []
+
+    def _elapsed(self):
+        if self.time_scale == 0:
+            return float("inf")
+        return (self.clock() - self._start_time) / self.time_scale
+
+    def _update(self):
+        if self._done_message is not None and self._elapsed() >= self.profile.move_time(self._distance):
+            self._messages.append((GENERIC_MOTOR, self._done_message))
+            self._done_message = None
+
+    def open(self):
+        return True
+
+    def close(self):
+        pass
+
+    def setup_conversion(self, steps_per_rev, gbox_ratio, pitch):
+        pass
+
+    def position(self):
+        travelled = self.profile.travelled(self._distance, self._elapsed())
+        return self._start_position + (travelled if self._distance >= 0 else -travelled)
+
+    def move_to(self, position, message=MOVED):
+        self._start_position = self.position()
+        self._distance = position - self._start_position
+        self._start_time = self.clock()
+        self._done_message = message
+
+    def set_position(self, position):
+        self._start_position = position
+        self._distance = 0.0
+
+    def home(self):
+        self.move_to(0.0, message=HOMED)
+
+    def is_moving(self):
+        self._update()
+        return self._done_message is not None
+
+    def pop_message(self):
+        self._update()
+        return self._messages.pop(0) if self._messages else None
+
+
+class SimulatedRotationMount(RotationMount):
+    """
+    RotationMount on a SimulatedMountBackend.
+    """
+    def __init__(self, serial_num="SIM", label="", mirror=False, profile=MotionProfile(),
+                 time_scale=1.0, position=0.0, **kwargs):
+        logger.debug(f"Simulating rotation mount {label}")
+        super().__init__(serial_num, label=label, mirror=mirror,
+                         backend=SimulatedMountBackend(profile, time_scale, position), **kwargs)
@@ -1,37 +1,120 @@
 import time
 import os
-from ctypes import c_int, c_double, c_char_p, byref, cdll
+from ctypes import c_int, c_ushort, c_ulong, c_double, c_char_p, byref, cdll
 from loguru import logger
 import numpy as np
+from modules.acquisition_planner import angular_distance
+from Devices.move_completion import wait_for_move, MoveLatencyStats
 
 
-class RotationMount:
-    def __init__(self, serial_num, label="", mirror=False, lib_path=r"C:\Program Files\Thorlabs\Kinesis"):
-        logger.debug(f"Initializing RotationMount with serial number: {serial_num}")
-        print(f"Initializing RotationMount with serial number: {serial_num}")
+class KinesisMountBackend:
+    """
+    KCube DC servo controller through the Thorlabs Kinesis DLL.
+    """
+    # status bits: motor moving clockwise / counter-clockwise
+    MOVING_BITS = 0x00000010 | 0x00000020
+
+    def __init__(self, serial_num, lib_path=r"C:\Program Files\Thorlabs\Kinesis", polling_ms=50):
         os.add_dll_directory(lib_path)
         self.lib = cdll.LoadLibrary(
             "Thorlabs.MotionControl.KCube.DCServo.dll"
         )  # loading dll
         self.serial_num = c_char_p(serial_num.encode())
-        self.label = label
-        self.mirror = mirror
+        self.polling_ms = polling_ms
 
-    def open_device(self):
-        logger.info("-- Opening Device --")
+    def open(self):
         if (
             self.lib.TLI_BuildDeviceList() == 0
         ):  # check is device list is built properly
             self.lib.CC_Open(self.serial_num)
-            self.lib.CC_StartPolling(self.serial_num, c_int(200))
+            # the controller then updates position and status every polling_ms on its own
+            self.lib.CC_StartPolling(self.serial_num, c_int(self.polling_ms))
+            return True
+        return False
+
+    def close(self):
+        self.lib.CC_StopPolling(self.serial_num)
+        self.lib.CC_Close(self.serial_num)
+
+    def home(self):
+        self.lib.CC_ClearMessageQueue(self.serial_num)
+        self.lib.CC_Home(self.serial_num)  # home device based on kinesis library
+
+    # conversion from real units to device units
+    def setup_conversion(self, steps_per_rev, gbox_ratio, pitch):
+        self.lib.CC_SetMotorParamsExt(self.serial_num, c_double(steps_per_rev),
+                                      c_double(gbox_ratio), c_double(pitch))
+
+    def position(self):
+        # last polled position, no round trip to the controller
+        dev_pos = c_int(self.lib.CC_GetPosition(self.serial_num))
+        real_pos = c_double()
+        self.lib.CC_GetRealValueFromDeviceUnit(
+            self.serial_num, dev_pos, byref(real_pos), 0
+        )
+        return real_pos.value
+
+    def move_to(self, position):
+        new_pos_dev = c_int()
+        self.lib.CC_GetDeviceUnitFromRealValue(
+            self.serial_num, c_double(position), byref(new_pos_dev), 0
+        )
+        # drop stale messages so the next 'moved' message belongs to this move
+        self.lib.CC_ClearMessageQueue(self.serial_num)
+        self.lib.CC_MoveToPosition(self.serial_num, new_pos_dev)
+
+    def set_position(self, position):
+        # re-zero: the controller takes its current place to be at position, nothing moves
+        new_pos_dev = c_int()
+        self.lib.CC_GetDeviceUnitFromRealValue(
+            self.serial_num, c_double(position), byref(new_pos_dev), 0
+        )
+        self.lib.CC_SetPositionCounter(self.serial_num, new_pos_dev)
+
+    def is_moving(self):
+        return bool(self.lib.CC_GetStatusBits(self.serial_num) & self.MOVING_BITS)
+
+    def pop_message(self):
+        if self.lib.CC_MessageQueueSize(self.serial_num) <= 0:
+            return None
+        message_type, message_id, message_data = c_ushort(), c_ushort(), c_ulong()
+        self.lib.CC_GetNextMessage(self.serial_num, byref(message_type), byref(message_id),
+                                   byref(message_data))
+        return message_type.value, message_id.value
+
+
+class RotationMount:
+    def __init__(self, serial_num, label="", mirror=False, lib_path=r"C:\Program Files\Thorlabs\Kinesis",
+                 backend=None, timeout=60.0, settle_window=0.0):
+        """
+        Args:
+            backend: Object driving the controller, defaults to KinesisMountBackend.
+                     Pass a SimulatedMountBackend to run without hardware.
+            timeout: Seconds to wait for a move before raising MoveTimeoutError
+            settle_window: Seconds the position must stay on target after a move
+        """
+        logger.debug(f"Initializing RotationMount with serial number: {serial_num}")
+        print(f"Initializing RotationMount with serial number: {serial_num}")
+        self.backend = backend if backend is not None else KinesisMountBackend(serial_num, lib_path)
+        self.serial_num = serial_num
+        self.label = label
+        self.mirror = mirror
+        self.timeout = timeout
+        self.settle_window = settle_window
+        self.latency_stats = MoveLatencyStats()
+
+    def open_device(self):
+        logger.info("-- Opening Device --")
+        if self.backend.open():
             logger.success("Device opened successfully")
         else:
             logger.error("Failed to build device list")
 
     def home_device(self):
         logger.info("-- Homing Device --")
-        self.lib.CC_Home(self.serial_num)  # home device based on kinesis library
-        time.sleep(12)
+        start_time = time.perf_counter()
+        self.backend.home()
+        wait_for_move(self.backend, 0.0, timeout=self.timeout, start_time=start_time)
         logger.debug("Device homing completed")
 
     # conversion from real units to device units
@@ -39,30 +122,24 @@ class RotationMount:
         logger.debug(
             f"Setting up conversion: steps_per_rev={steps_per_rev}, gbox_ratio={gbox_ratio}, pitch={pitch}"
         )
-        STEPS_PER_REV = c_double(steps_per_rev)
-        gbox_ratio = c_double(gbox_ratio)
-        pitch = c_double(pitch)
-        self.lib.CC_SetMotorParamsExt(self.serial_num, STEPS_PER_REV, gbox_ratio, pitch)
+        self.backend.setup_conversion(steps_per_rev, gbox_ratio, pitch)
 
     @property
     def current_position(self):
-        self.lib.CC_RequestPosition(self.serial_num)
-        time.sleep(0.2)
-        dev_pos = c_int(self.lib.CC_GetPosition(self.serial_num))
-        real_pos = c_double()
-        self.lib.CC_GetRealValueFromDeviceUnit(
-            self.serial_num, dev_pos, byref(real_pos), 0
-        )
-        return real_pos.value
+        return self.backend.position()
 
-    def move_to_position(self, new_pos_real: float | None | str, tolerance=0.1):
+    def move_to_position(self, new_pos_real: float | None | str, tolerance=0.1, shortest_path=False):
         """
-        Move the mount to a position. 
+        Move the mount to a position and wait until it gets there.
         If new_pos_real is None, do nothing.
         If mirror is True, move to the mirror position.
         Args:
             new_pos_real: float | None, angle in degrees. If None, do nothing.
             tolerance: float, tolerance in degrees. Default is 0.1.
+            shortest_path: bool, turn the short way round (at most 180 degrees) instead of
+                going to the absolute angle in 0-360. A move that ends outside 0-360 is
+                followed by re-zeroing the controller to the same angle within 0-360,
+                so absolute positions do not drift from move to move or run to run.
         """
         if new_pos_real is None or new_pos_real == "none":
             logger.info(f"{self.label} - Not moving")
@@ -70,30 +147,35 @@ class RotationMount:
         if self.mirror:
             new_pos_real = 360-new_pos_real
         new_pos_real = new_pos_real % 360 # ensure the angle is within 0-360 degrees
-        new_pos_real = c_double(new_pos_real)
-        new_pos_dev = c_int()
+        current_position = self._wrap_position(self.current_position)
+        if shortest_path:
+            new_pos_real = current_position + angular_distance(current_position, new_pos_real)
 
-        if np.isclose(self.current_position, new_pos_real, atol=tolerance):
+        if np.isclose(current_position, new_pos_real, atol=tolerance):
             logger.info(f"{self.label} - Already at {new_pos_real} degrees")
-            return self.current_position
+            return current_position
 
         logger.info(f"{self.label} - Moving to {new_pos_real} degrees")
-        self.lib.CC_GetDeviceUnitFromRealValue(
-            self.serial_num, new_pos_real, byref(new_pos_dev), 0
-        )
-        self.lib.CC_SetMoveAbsolutePosition(self.serial_num, new_pos_dev)
-        time.sleep(0.25)
-        self.lib.CC_MoveAbsolute(self.serial_num)
-        # Wait in a loop until the mount reaches the target position (within 0.1 degrees)
-        # Round to nearest integer to avoid floating point comparison issues
-        while not np.isclose(self.current_position, new_pos_real, atol=tolerance):
-            time.sleep(0.5)
-        logger.debug(f"{self.label} - Movement completed")
-        return self.current_position
+        start_time = time.perf_counter()
+        self.backend.move_to(new_pos_real)
+        result = wait_for_move(self.backend, new_pos_real, tolerance=tolerance, timeout=self.timeout,
+                               settle_window=self.settle_window, start_time=start_time)
+        self.latency_stats.add(result)
+        logger.debug(f"{self.label} - Movement completed in {result.latency:.2f} s ({result.completed_by})")
+        return self._wrap_position(result.position)
+
+    def _wrap_position(self, position):
+        """Re-zero the controller to position % 360 if position is outside 0-360."""
+        if 0 <= position < 360:
+            return position
+        wrapped = position % 360
+        logger.debug(f"{self.label} - Re-zeroing {position:.2f} to {wrapped:.2f} degrees")
+        self.backend.set_position(wrapped)
+        return wrapped
 
     def close_device(self):
         logger.info("Closing rotation mount device")
-        self.lib.CC_Close(self.serial_num)
+        self.backend.close()
         logger.debug("Device closed")
 
 
@@ -107,5 +189,6 @@ if __name__ == "__main__":
     print(
         f"End Position: {rotation_mount.current_position}"
     )  # Print current position
+    print(f"Move latency: {rotation_mount.latency_stats}")
     # rotation_mount.home_device()
     # rotation_mount.close_device()
@@ -1,6 +1,12 @@
+import sys
+from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
 
+# run from Notebook/ or anywhere else: modules/ lives in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from modules.phase_unwrap import unwrap_phase, count_residues, UNWRAP_METHODS
+
 # Example: generate a wrapped phase map
 x = np.linspace(0, 4 * np.pi, 100)
 y = np.linspace(0, 4 * np.pi, 100)
@@ -13,22 +19,21 @@ wrapped_phase = np.angle(np.exp(1j * (X + Y)))  # Wrapped between -π and π
 # plt.colorbar()
 # plt.show()
 
-# Unwrap along axis 0 (rows)
-unwrapped_phase = np.unwrap(wrapped_phase, axis=0)
-
-# Then unwrap along axis 1 (columns)
-unwrapped_phase = np.unwrap(unwrapped_phase, axis=1)
+# Add noise and a corrupted row, which the row/column unwrap smears across the map
+rng = np.random.default_rng(0)
+wrapped_phase = np.angle(np.exp(1j * (wrapped_phase + rng.normal(0, 0.5, wrapped_phase.shape))))
+wrapped_phase[50, :] = rng.uniform(-np.pi, np.pi, wrapped_phase.shape[1])
 
-fig, axs = plt.subplots(2, 1, figsize=(10, 10))
+results = [unwrap_phase(wrapped_phase, method=method) for method in UNWRAP_METHODS]
 
-axs[0].imshow(wrapped_phase, cmap='jet')
-axs[0].set_title('Wrapped Phase Map')
-
-axs[1].imshow(unwrapped_phase, cmap='jet')
-axs[1].set_title('Unwrapped Phase Map')
+fig, axs = plt.subplots(len(results) + 1, 1, figsize=(10, 5 * (len(results) + 1)))
 
+axs[0].set_title(f'Wrapped Phase Map ({count_residues(wrapped_phase)} residues)')
 fig.colorbar(axs[0].imshow(wrapped_phase, cmap='jet'), ax=axs[0], label='Phase (radians)')
-fig.colorbar(axs[1].imshow(unwrapped_phase, cmap='jet'), ax=axs[1], label='Phase (radians)')
+
+for ax, result in zip(axs[1:], results):
+    ax.set_title(f'Unwrapped Phase Map ({result.method})')
+    fig.colorbar(ax.imshow(result.unwrapped, cmap='jet'), ax=ax, label='Phase (radians)')
 
 fig.tight_layout()
 plt.show()
@@ -1,12 +1,37 @@
 import streamlit as st
 import numpy as np
+import matplotlib.pyplot as plt
 from pathlib import Path
-from modules.image_process import png_to_array, crop_image, compress_image_with_gaussian, compress_image
+from modules.image_process import (png_to_array, load_image_stack, find_sensor_edges,
+                                   compress_image_with_gaussian, compress_image)
 from modules.plotting_modules import (create_plotly_figure, 
+                                      DEFAULT_MAX_PIXELS,
+                                      DEFAULT_ARROW_SPACING,
                                       heatmap_plot_with_bounding_box,
                                       quiver_plot_plotly,
                                       quiver_plot_matplotlib)
-from modules.phase_analysis import isoclinic_phase, isochromatic_phase
+from modules.phase_analysis import PhaseStepEngine, modulation_mask, phase_periods
+from modules.phase_unwrap import unwrap_phase, UNWRAP_METHODS
+from modules.phase_filter import filter_phase, FILTER_METHODS
+from modules.results_store import (save_dataset, RAW_STACK, ISOCLINIC, ISOCHROMATIC,
+                                   ISOCLINIC_UNWRAPPED, ISOCHROMATIC_UNWRAPPED, MODULATION, VALID_MASK)
+from modules.downsample import DOWNSAMPLE_MODES
+from modules.image_stats import image_stats, color_range as color_range_of
+from modules.bad_pixel_map import BadPixelMapStore
+from modules.pipeline_cache import PipelineCache, content_hash, make_key
+from modules.roi import ROI
+
+STEPS = [f"I{i}" for i in range(1, 11)]
+
+
+def step_name(file):
+    """I3_CZT.png -> I3"""
+    return file.name.split('.')[0].upper().split('_')[0]
+
+
+def step_order(name):
+    return STEPS.index(name) if name in STEPS else len(STEPS)
+
 
 st.set_page_config(page_title="Stress Imaging Analysis", layout="wide")
 st.title("Stress Imaging Analysis")
@@ -29,53 +54,97 @@ uploaded_files = st.file_uploader(
 
 if "do_cropping" not in st.session_state:
     st.session_state.do_cropping = False
-if "show_cropped_images" not in st.session_state:
-    st.session_state.show_cropped_images = False
 if "show_full_images" not in st.session_state:
     st.session_state.show_full_images = False
 if "do_compress_image" not in st.session_state:
     st.session_state.do_compress_image = False
+if "bad_pixel_store" not in st.session_state:
+    st.session_state.bad_pixel_store = BadPixelMapStore()
+if "pipeline_cache" not in st.session_state:
+    st.session_state.pipeline_cache = PipelineCache(max_mb=1024)
+
+# Decoded, repaired, cropped and phase arrays are reused across reruns, so moving
+# a slider only re-renders the figures. Cached arrays must not be modified in place.
+cache = st.session_state.pipeline_cache
+cache.start_run()
 
 with st.sidebar:
     colormap = st.selectbox("Colormap", ["jet", "viridis", "plasma", "inferno", "magma", "cividis", "turbo", "gray"])
+    preview_figures = st.checkbox("Preview Resolution Figures", value=True,
+                                  help="Send a min/max-decimated preview to the browser instead of every pixel")
+    max_pixels = st.number_input("Max Pixels per Figure", value=DEFAULT_MAX_PIXELS,
+                                 min_value=10_000, step=10_000) if preview_figures else None
     calibration_file = st.file_uploader("Upload Calibration File", 
                                         type=['png', 'jpg', 'jpeg'])
     if calibration_file:
-        calib_image = png_to_array(calibration_file)
+        calib_key = make_key("decode", content_hash(calibration_file))
+        calib_image = cache.get_or_compute("decode", calib_key, png_to_array, calibration_file)
         calib_image_size = calib_image.shape
+        # crop inputs are keyed so edge detection can fill them in; reset them for a new sensor size
+        if st.session_state.get("crop_image_size") != calib_image_size:
+            st.session_state.crop_image_size = calib_image_size
+            st.session_state.crop_x0, st.session_state.crop_y0 = 0, 0
+            st.session_state.crop_x1, st.session_state.crop_y1 = calib_image_size[1], calib_image_size[0]
         col1, col2 = st.columns(2)
+        with col1:
+            edge_margin = st.number_input("Edge Margin", value=5, min_value=0, step=1,
+                                          help="Pixels to keep inside the detected sensor edges")
+        with col2:
+            if st.button("Detect Sensor Edges"):
+                try:
+                    sensor_edges = find_sensor_edges(calib_image)
+                except ValueError as e:
+                    st.warning(f"Could not detect the sensor edges: {e}")
+                else:
+                    detected = ROI.from_sensor_edges(sensor_edges,
+                                                     top_margin=edge_margin, bottom_margin=-edge_margin,
+                                                     left_margin=edge_margin, right_margin=-edge_margin)
+                    detected = detected.clip(calib_image_size)
+                    (st.session_state.crop_x0, st.session_state.crop_y0,
+                     st.session_state.crop_x1, st.session_state.crop_y1) = detected
         with col1:
             crop_x0 = st.number_input("Crop X0", 
-                                    value=0, 
                                     min_value=0, 
                                     max_value=calib_image_size[1], 
-                                    step=1)
+                                    step=1,
+                                    key="crop_x0")
         with col2:
             crop_x1 = st.number_input("Crop X1", 
-                                    value=calib_image_size[1], 
                                     min_value=0, 
                                     max_value=calib_image_size[1], 
-                                    step=1)
+                                    step=1,
+                                    key="crop_x1")
         with col1:
             crop_y0 = st.number_input("Crop Y0", 
-                                    value=0, 
                                     min_value=0, 
                                     max_value=calib_image_size[0], 
-                                    step=1)
+                                    step=1,
+                                    key="crop_y0")
         with col2:
             crop_y1 = st.number_input("Crop Y1", 
-                                    value=calib_image_size[0], 
                                     min_value=0, 
                                     max_value=calib_image_size[0], 
-                                    step=1)
-        crop_range_x = [crop_x0, crop_x1]
-        crop_range_y = [crop_y0, crop_y1]
-        bounding_box = [crop_x0, crop_y0, crop_x1, crop_y1]
-        calib_image_cropped = crop_image(calib_image, crop_range_x, crop_range_y)
+                                    step=1,
+                                    key="crop_y1")
+        # one immutable ROI for the whole pipeline: decode, repair, phase, plots and saving
+        roi = ROI(crop_x0, crop_y0, crop_x1, crop_y1)
+        bounding_box = roi.bounding_box
         st.session_state.do_cropping = st.checkbox("Apply Cropping to all images", value=st.session_state.do_cropping)
-        st.session_state.show_full_images = st.checkbox("Show Full Images", value=st.session_state.show_full_images)
-        if st.session_state.do_cropping:
-            st.session_state.show_cropped_images = st.checkbox("Show Cropped Images", value=st.session_state.show_cropped_images)
+        st.session_state.show_full_images = st.checkbox("Show Full Images", value=st.session_state.show_full_images,
+                                                        help="Keep the uncropped frames to show the crop box on them")
+
+    st.subheader("Bad Pixels")
+    sensor_id = st.text_input("Sensor ID", value="CZT")
+    repair_bad_pixels = st.checkbox("Repair Bad Pixels", value=False)
+    bad_pixel_store = st.session_state.bad_pixel_store
+    if repair_bad_pixels:
+        if calibration_file and (not bad_pixel_store.has(sensor_id) or st.button("Rebuild Bad Pixel Map")):
+            bad_pixel_store.build(sensor_id, calibration_file)
+        if bad_pixel_store.has(sensor_id):
+            st.caption(f"{bad_pixel_store.metadata(sensor_id)['n_bad_pixels']} bad pixels in map")
+        else:
+            st.warning("Upload a calibration file to build the bad pixel map")
+            repair_bad_pixels = False
 
 if calibration_file:
     with st.expander("Calibration Image", expanded=False):
@@ -85,118 +154,223 @@ if calibration_file:
                                             color_range=(0, 65000),
                                             fig_height=800,
                                             fig_width=800,
-                                            bounding_box=bounding_box)
+                                            bounding_box=bounding_box,
+                                            max_pixels=max_pixels)
         st.plotly_chart(fig)
 
 if uploaded_files:
-    # Convert uploaded files to dict
-    image_dict = {}
-    image_dict_cropped = {}
-    for idx, file in enumerate(uploaded_files):
-        name = file.name.split('.')[0].upper()  # Get filename without extension
-        if '_' in name:
-            index_name = name.split('_')[0]
-        image_array = png_to_array(file)
-        image_dict[index_name] = image_array
-        if st.session_state.do_cropping:
-            image_array_cropped = crop_image(image_array, crop_range_x, crop_range_y)
-            image_dict_cropped[index_name] = image_array_cropped
-        
+    # Decode in I1..I10 order so the phase steps are a view of the stack
+    uploaded_files = sorted(uploaded_files, key=lambda file: step_order(step_name(file)))
+    names = [step_name(file) for file in uploaded_files]
+    # Crop once. Unless the full frames are wanted, only the ROI is ever decoded.
+    roi = roi if calibration_file and st.session_state.do_cropping else None
+    keep_full_frames = roi is None or st.session_state.show_full_images
+    decode_roi = None if keep_full_frames else roi
+    # Decode all uploads concurrently into one (N, H, W) stack
+    stack_key = make_key("decode", [content_hash(file) for file in uploaded_files], decode_roi)
+    try:
+        image_stack = cache.get_or_compute("decode", stack_key, load_image_stack, uploaded_files, decode_roi)
+    except ValueError as e:
+        st.error(f"Could not load the uploaded images as one stack: {e}")
+        st.stop()
+    if repair_bad_pixels:
+        stack_key = make_key("repair", stack_key, sensor_id,
+                             bad_pixel_store.metadata(sensor_id).get("created"))
+        image_stack = cache.get_or_compute("repair", stack_key, bad_pixel_store.repair_images,
+                                           sensor_id, image_stack, roi=decode_roi)
+    # zero-copy view of the ROI over every frame
+    frames = roi.apply(image_stack) if roi is not None and decode_roi is None else image_stack
+    frames_key = make_key("crop", stack_key, roi)
+    for idx, name in enumerate(names):
         # Create plotly figure
         with st.expander(f"{name} Colormap", expanded=False):
+            frame_stats = cache.get_or_compute("stats", make_key("stats", frames_key, idx), image_stats, frames[idx])
             color_range = st.slider("Color Range", 
                                             min_value=0.0, 
                                             max_value=65000.0, 
-                                            value=(float(np.min(image_dict[index_name])), 
-                                                   float(np.max(image_dict[index_name]))),
+                                            value=(float(frame_stats.minimum), 
+                                                   float(frame_stats.maximum)),
                                             key=f"{name}_color_range")
 
-            fig = create_plotly_figure(image_dict[index_name], title=f"{name}", color_range=color_range, cmap=colormap)
+            fig = create_plotly_figure(frames[idx], title=f"{name}" if roi is None else f"{name} Cropped",
+                                       color_range=color_range, cmap=colormap, max_pixels=max_pixels)
             st.plotly_chart(fig)
-            if st.session_state.show_full_images:
-                fig = heatmap_plot_with_bounding_box(image_dict[index_name], 
+            if roi is not None and st.session_state.show_full_images:
+                fig = heatmap_plot_with_bounding_box(image_stack[idx], 
                                                 title=f"{name}", 
                                                 color_map=colormap, 
                                                 color_range=color_range,
                                                 fig_height=800,
                                                 fig_width=800,
-                                                bounding_box=bounding_box)
+                                                bounding_box=bounding_box,
+                                                max_pixels=max_pixels)
                 st.plotly_chart(fig)
 
-            if st.session_state.do_cropping and st.session_state.show_cropped_images:
-                fig_cropped = create_plotly_figure(image_dict_cropped[index_name], 
-                                                title=f"{name} Cropped", 
-                                                cmap=colormap, 
-                                                color_range=color_range)
-                st.plotly_chart(fig_cropped)
-
 col1, col2 = st.columns(2)
 with col1:
     calculate_phase = st.checkbox("Calculate Phase", value=False)
     phase_cmap = st.selectbox("Phase Colormap", 
                               ["jet", "viridis", "plasma", "inferno", "magma", "cividis", "turbo", "gray"],
                               index=0)
+    mask_low_modulation = st.checkbox("Mask Low Modulation", value=False,
+                                      help="Skip pixels with little fringe signal (outside the specimen, "
+                                           "below the noise floor) when filtering, unwrapping, plotting and saving")
+    modulation_threshold = st.number_input("Modulation Threshold", value=0.0, min_value=0.0, step=10.0,
+                                           help="Lowest valid fringe modulation in counts, "
+                                                "0 for 10% of the bright part of the specimen")
 with col2:
     apply_isoclinic_unwrap = st.checkbox("Apply Isoclinic Unwrap", value=False)
     apply_isochromatic_unwrap = st.checkbox("Apply Isochromatic Unwrap", value=False)
+    unwrap_method = st.selectbox("Unwrap Method", UNWRAP_METHODS, index=UNWRAP_METHODS.index("quality_guided"),
+                                 help="rows_cols: 1D unwrap along rows then columns. "
+                                      "quality_guided: reliability-ordered flood fill. "
+                                      "least_squares: DCT least-squares solution.")
+    phase_filter = st.selectbox("Phase Filter", ("none",) + FILTER_METHODS,
+                                help="Smooths the wrapped maps on the unit circle, so wraps are kept. "
+                                     "gaussian and box cost the same for any size; median suits small windows.")
+    filter_size = st.number_input("Filter Size", value=3.0, min_value=1.0, max_value=31.0, step=1.0,
+                                  help="Odd window size in pixels, or sigma for gaussian")
 
 
 if uploaded_files:
-    if len(uploaded_files) >= 10 and calculate_phase:
-        if image_dict_cropped:
-            images = image_dict_cropped
-        else:
-            images = image_dict
-        # Calculate phases
-        iso_phase = isoclinic_phase(
-            images['I1'], images['I2'], 
-            images['I3'], images['I4'],
-            method=phase_method)
-        
+    if names[:10] == STEPS and calculate_phase:
+        # isoclinic and isochromatic phases in one pass over the I1-I10 view
+        phase_stack = frames[:10]
+        phase_key = make_key("phase", frames_key, phase_method)
+        iso_wrapped, isochrom_wrapped = cache.get_or_compute("phase", phase_key,
+                                                             PhaseStepEngine(method=phase_method).compute,
+                                                             phase_stack)
+        iso_phase, isochrom_phase = iso_wrapped, isochrom_wrapped
+        iso_quality = isochrom_quality = None
+        iso_period, isochrom_period = phase_periods(phase_method)
+
+        # Fringe modulation and the mask of pixels worth working on
+        valid_mask = modulation = None
+        if mask_low_modulation:
+            # the modulation needs the arctan2 isoclinic phase, whatever the phase method
+            arctan2_key = make_key("phase", frames_key, "arctan2")
+            if phase_method == "arctan2":
+                iso_arctan2 = iso_wrapped
+            else:
+                iso_arctan2 = cache.get_or_compute("phase", arctan2_key, PhaseStepEngine().compute, phase_stack)[0]
+            modulation = cache.get_or_compute("modulation", make_key("modulation", arctan2_key),
+                                              PhaseStepEngine().compute_modulation, phase_stack, iso_arctan2)
+            phase_key = make_key("mask", phase_key, modulation_threshold)
+            valid_mask = cache.get_or_compute("mask", phase_key, modulation_mask, modulation,
+                                              modulation_threshold or None)
+            if valid_mask.any():
+                st.caption(f"{valid_mask.mean():.1%} of the pixels have enough modulation")
+            else:
+                st.warning("No pixel has enough modulation, lower the threshold")
+                valid_mask = None
+
+        # Filter the wrapped maps; the coherence then guides the quality-guided unwrap
+        if phase_filter != "none":
+            size = filter_size if phase_filter == "gaussian" else int(filter_size) // 2 * 2 + 1
+            phase_key = make_key("filter", phase_key, phase_filter, size)
+            iso_filtered = cache.get_or_compute("filter", make_key("filter", phase_key, "isoclinic"),
+                                                filter_phase, iso_phase, iso_period, phase_filter, size,
+                                                mask=valid_mask)
+            isochrom_filtered = cache.get_or_compute("filter", make_key("filter", phase_key, "isochromatic"),
+                                                     filter_phase, isochrom_phase, isochrom_period, phase_filter, size,
+                                                     mask=valid_mask)
+            iso_phase, iso_quality = iso_filtered
+            isochrom_phase, isochrom_quality = isochrom_filtered
+
         # Unwrap isoclinic phase
         if apply_isoclinic_unwrap:
-            iso_phase = np.unwrap(iso_phase, axis=0)
-            iso_phase = np.unwrap(iso_phase, axis=1)
-        
-        # Calculate isochromatic phase
-        isochrom_phase = isochromatic_phase(
-            iso_phase,
-            images['I5'], images['I6'],
-            images['I7'], images['I8'],
-            images['I9'], images['I10'],
-            method=phase_method
-        )
+            kwargs = {"quality": iso_quality} if unwrap_method == "quality_guided" and iso_quality is not None else {}
+            iso_unwrap = cache.get_or_compute("unwrap", make_key("unwrap", phase_key, "isoclinic", unwrap_method),
+                                              unwrap_phase, iso_phase, unwrap_method, iso_period,
+                                              mask=valid_mask, **kwargs)
+            iso_phase = iso_unwrap.unwrapped
         
         # Unwrap isochromatic phase
         if apply_isochromatic_unwrap:
-            isochrom_phase = np.unwrap(isochrom_phase, axis=0)
-            isochrom_phase = np.unwrap(isochrom_phase, axis=1)
+            kwargs = {"quality": isochrom_quality} if unwrap_method == "quality_guided" and isochrom_quality is not None else {}
+            isochrom_unwrap = cache.get_or_compute("unwrap", make_key("unwrap", phase_key, "isochromatic", unwrap_method),
+                                                   unwrap_phase, isochrom_phase, unwrap_method, isochrom_period,
+                                                   mask=valid_mask, **kwargs)
+            isochrom_phase = isochrom_unwrap.unwrapped
+
+        # masked pixels are left blank in the figures and out of the colour ranges
+        if valid_mask is not None:
+            iso_phase = np.where(valid_mask, iso_phase, np.nan)
+            isochrom_phase = np.where(valid_mask, isochrom_phase, np.nan)
 
 
         # Display results
+        zoom_phase = st.checkbox("Zoom Phase Maps", value=False,
+                                 help="Show only a region of the phase maps, at full resolution if it fits")
+        phase_viewport = None
+        if zoom_phase:
+            phase_height, phase_width = iso_phase.shape
+            col1, col2 = st.columns(2)
+            with col1:
+                zoom_x = st.slider("Zoom X", 0, phase_width, (0, phase_width), key="zoom_x")
+            with col2:
+                zoom_y = st.slider("Zoom Y", 0, phase_height, (0, phase_height), key="zoom_y")
+            if zoom_x[1] > zoom_x[0] and zoom_y[1] > zoom_y[0]:
+                phase_viewport = (zoom_x[0], zoom_y[0], zoom_x[1], zoom_y[1])
+
         col1, col2 = st.columns(2)
         
         with col1:
             st.subheader("Isoclinic Phase")
+            if apply_isoclinic_unwrap:
+                st.caption(f"{iso_unwrap.n_residues} residues in the wrapped map")
             color_range = st.slider("Phase Color Range", 
-                                    value=(float(np.min(iso_phase)), 
-                                           float(np.max(iso_phase))),
+                                    value=color_range_of(iso_phase, mask=valid_mask),
                                     key="iso_phase_color_range")
-            fig = create_plotly_figure(iso_phase, title=" ", cmap=phase_cmap, color_range=color_range)
+            fig = create_plotly_figure(iso_phase, title=" ", cmap=phase_cmap, color_range=color_range,
+                                       max_pixels=max_pixels, viewport=phase_viewport)
             st.plotly_chart(fig)
-            if st.button("Save Isoclinic Phase"):
-                np.save(f"isoclinic_phase_{iso_phase.shape[0]}_{iso_phase.shape[1]}.npy", iso_phase)
             
         with col2:
             st.subheader("Isochromatic Phase")
+            if apply_isochromatic_unwrap:
+                st.caption(f"{isochrom_unwrap.n_residues} residues in the wrapped map")
             color_range = st.slider("Phase Color Range", 
-                                    value=(float(np.min(isochrom_phase)), 
-                                           float(np.max(isochrom_phase))),
+                                    value=color_range_of(isochrom_phase, mask=valid_mask),
                                     key="isochrom_phase_color_range")
-            fig = create_plotly_figure(isochrom_phase, title=" ", cmap=phase_cmap, color_range=color_range)
+            fig = create_plotly_figure(isochrom_phase, title=" ", cmap=phase_cmap, color_range=color_range,
+                                       max_pixels=max_pixels, viewport=phase_viewport)
             st.plotly_chart(fig)
-            if st.button("Save Isochromatic Phase"):
-                np.save(f"isochrom_phase_{isochrom_phase.shape[0]}_{isochrom_phase.shape[1]}.npy", isochrom_phase)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            dataset_name = st.text_input("Dataset Name", value="dataset")
+        with col2:
+            if st.button("Save Results"):
+                # one container with the raw stack, crop box, phase maps and parameters
+                arrays = {
+                    RAW_STACK: phase_stack,
+                    ISOCLINIC: iso_wrapped,
+                    ISOCHROMATIC: isochrom_wrapped,
+                }
+                if apply_isoclinic_unwrap:
+                    arrays[ISOCLINIC_UNWRAPPED] = iso_phase
+                if apply_isochromatic_unwrap:
+                    arrays[ISOCHROMATIC_UNWRAPPED] = isochrom_phase
+                if valid_mask is not None:
+                    arrays[MODULATION] = modulation
+                    arrays[VALID_MASK] = valid_mask
+                attrs = {
+                    "sources": [file.name for file in uploaded_files],
+                    "crop_box": None if roi is None else roi.clip(calib_image_size),
+                    "phase_method": phase_method,
+                    "unwrap_method": unwrap_method,
+                    "phase_filter": None if phase_filter == "none" else [phase_filter, filter_size],
+                    "bad_pixel_sensor_id": sensor_id if repair_bad_pixels else None,
+                    "modulation_threshold": modulation_threshold if valid_mask is not None else None,
+                }
+                results_dir = Path("RESULTS")
+                results_dir.mkdir(exist_ok=True)
+                # only the chunks of the phase maps with valid pixels are written; the raw stack in full
+                saved_path = save_dataset(results_dir / dataset_name, arrays, attrs, mask=valid_mask,
+                                          masked=[name for name in arrays
+                                                  if name not in (RAW_STACK, MODULATION, VALID_MASK)])
+                st.success(f"Saved {saved_path}")
 
         st.divider()
 
@@ -205,15 +379,18 @@ if uploaded_files:
             st.session_state.do_compress_image = st.checkbox("Compress Image", value=st.session_state.do_compress_image)
         with col2:
             skip_points = st.number_input("Skip Points", value=3, min_value=1, max_value=10, step=1)
+            compress_mode = st.selectbox("Compression Mode", DOWNSAMPLE_MODES, index=0,
+                                         help="circular_mean averages the isoclinic angle across its wrap boundary")
 
         if st.session_state.do_compress_image:
             # compressed_image = compress_image_with_gaussian(iso_phase, kernel_size=3, sigma=1.0, jpeg_quality=50, scale_factor=0.5)
-            compressed_image = compress_image(iso_phase, skip_points=skip_points)
+            compressed_image = compress_image(iso_phase, skip_points=skip_points,
+                                              mode=compress_mode, period=iso_period)
             color_range = st.slider("Phase Color Range", 
-                                    value=(float(np.min(compressed_image)), 
-                                        float(np.max(compressed_image))),
+                                    value=color_range_of(compressed_image),
                                     key="compressed_image_color_range")
-            fig = create_plotly_figure(compressed_image, title="Compressed Image", cmap=colormap, color_range=color_range)
+            fig = create_plotly_figure(compressed_image, title="Compressed Image", cmap=colormap, color_range=color_range,
+                                       max_pixels=max_pixels)
             st.plotly_chart(fig)
         if st.session_state.do_compress_image:
             
@@ -224,16 +401,39 @@ if uploaded_files:
         # with col2:
         do_quiver_plot = st.checkbox("Isoclinic Phase Quiver Plot", value=False)
         if do_quiver_plot:
-            quiver_fig = quiver_plot_matplotlib(compressed_image, scale=1/0.05, vector_scale=0.2)
-            st.pyplot(quiver_fig)
-        
-        # create_quiver_plot = st.checkbox("Isoclinic Phase Quiver Plot", value=False)
-        # if create_quiver_plot:
-        #     quiver_fig = quiver_plot_matplotlib(compressed_image, scale=1)
-        #     st.pyplot(quiver_fig)
+            # arrows are sampled from the full map at a density set by the figure size
+            col1, col2 = st.columns(2)
+            with col1:
+                quiver_renderer = st.selectbox("Quiver Renderer", ["plotly", "matplotlib"],
+                                               help="plotly: one WebGL trace over the phase map. "
+                                                    "matplotlib: a static image")
+            with col2:
+                arrow_spacing = st.number_input("Arrow Spacing", value=DEFAULT_ARROW_SPACING, min_value=4,
+                                                max_value=100, step=2, help="Screen pixels between arrows")
+            if quiver_renderer == "plotly":
+                quiver_fig = quiver_plot_plotly(iso_phase, fig_width=800, spacing=arrow_spacing, mask=valid_mask,
+                                                cmap=phase_cmap, max_pixels=max_pixels)
+                st.plotly_chart(quiver_fig)
+            else:
+                quiver_fig = quiver_plot_matplotlib(iso_phase, spacing=arrow_spacing, mask=valid_mask,
+                                                    cmap=phase_cmap)
+                st.pyplot(quiver_fig)
+                plt.close(quiver_fig)
 
     else:
         st.warning("Please upload all 10 images (I1-I10)")
 else:
     st.info("Upload your images to begin analysis")
 
+with st.sidebar:
+    with st.expander("Pipeline Cache", expanded=False):
+        max_mb = st.number_input("Cache Size Limit (MB)", value=cache.max_bytes // 10**6,
+                                 min_value=0, step=256)
+        cache.set_max_mb(max_mb)
+        st.caption(f"{len(cache)} entries, {cache.current_bytes / 1e6:.1f} MB")
+        st.markdown("This rerun")
+        st.dataframe(cache.stats_table("run"), hide_index=True)
+        st.markdown("Session total")
+        st.dataframe(cache.stats_table("total"), hide_index=True)
+        if st.button("Clear Cache"):
+            cache.clear()
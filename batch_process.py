@@ -0,0 +1,282 @@
+"""
+Batch-process every complete I1-I10 capture set under a root folder.
+
+Each set goes through load (with crop) -> bad pixel repair -> phase -> unwrap -> save
+(one .sir results file per set, see modules/results_store.py)
+in a process pool. The number of sets in flight is limited by an estimated memory
+budget, finished sets are recorded in a manifest so an interrupted run can be
+resumed, and a per-set timing report is printed at the end.
+
+Example:
+    python batch_process.py SAMPLE_DATA --output RESULTS --crop 115 190 507 264
+"""
+import argparse
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+from loguru import logger
+from PIL import Image
+
+STEPS = [f"I{i}" for i in range(1, 11)]
+STAGES = ["load", "repair", "phase", "unwrap", "save"]
+# I1_CZT.png -> ("1", "_CZT"), I10.png -> ("10", "")
+IMAGE_NAME_PATTERN = re.compile(r"^I(\d+)(.*)\.png$", re.IGNORECASE)
+# float32 arrays alive per set at peak, in units of one frame: the 10-frame stack,
+# the decoded frame, 2 phase maps, 2 float64 unwrapped maps and working space
+FRAMES_PER_SET = 20
+
+
+def find_image_sets(root):
+    """
+    Find complete I1-I10 sets under root. Files in the same folder with the same
+    suffix after the step number (e.g. '_CZT') belong to the same set.
+
+    Returns:
+        dict: set id -> list of the 10 paths ordered I1..I10
+    """
+    groups = defaultdict(dict)
+    for path in sorted(Path(root).rglob("*")):
+        match = IMAGE_NAME_PATTERN.match(path.name)
+        if match is None or not path.is_file():
+            continue
+        step, suffix = int(match.group(1)), match.group(2)
+        groups[(path.parent, suffix)][step] = path
+
+    image_sets = {}
+    for (folder, suffix), files in groups.items():
+        if all(step in files for step in range(1, 11)):
+            set_id = (folder.relative_to(root) / f"I1-I10{suffix}").as_posix()
+            image_sets[set_id] = [str(files[step]) for step in range(1, 11)]
+        else:
+            missing = [f"I{step}" for step in range(1, 11) if step not in files]
+            logger.warning(f"Skipping incomplete set {folder / f'I*{suffix}.png'}, missing {missing}")
+    return image_sets
+
+
+def estimate_set_bytes(paths):
+    """
+    Rough peak memory of processing one set, from the PNG header of its first image.
+    """
+    with Image.open(paths[0]) as img:
+        width, height = img.size
+    return FRAMES_PER_SET * width * height * 4
+
+
+def process_image_set(set_id, paths, output_dir, options):
+    """
+    Run the full pipeline on one set. Executed in a worker process.
+
+    Returns:
+        dict: manifest entry with the output files and per-stage timings in seconds
+    """
+    from modules.image_process import load_image_stack, find_bad_pixel_mask, impute_bad_pixel_mask
+    from modules.bad_pixel_map import BadPixelMapStore
+    from modules.roi import ROI
+    from modules.phase_analysis import PhaseStepEngine, phase_periods
+    from modules.phase_unwrap import unwrap_phase
+    from modules import results_store
+
+    timings = {}
+    t_stage = time.perf_counter()
+
+    def lap(stage):
+        nonlocal t_stage
+        now = time.perf_counter()
+        timings[stage] = timings.get(stage, 0.0) + now - t_stage
+        t_stage = now
+
+    # the crop box is clipped to the sensor; one entirely outside it is an error, not an empty set
+    roi = None
+    if options["crop"] is not None:
+        requested = ROI.from_bounding_box(options["crop"])
+        with Image.open(paths[0]) as img:
+            width, height = img.size
+        roi = requested.clip((height, width))
+        if roi.width == 0 or roi.height == 0:
+            raise ValueError(f"Crop box {requested.bounding_box} is outside the {width}x{height} images")
+        if roi != requested:
+            logger.warning(f"{set_id} - crop box {requested.bounding_box} clipped to {roi.bounding_box}")
+
+    # decode all frames concurrently, cropping on decode
+    stack = load_image_stack(paths, crop_box=roi)
+    lap("load")
+
+    if options["sensor_id"]:
+        mask = BadPixelMapStore(options["bad_pixel_dir"]).load(options["sensor_id"])
+        if roi is not None:
+            mask = roi.apply(mask)
+        for frame in stack:
+            impute_bad_pixel_mask(frame, mask, inplace=True)
+    else:
+        for frame in stack:
+            mask = find_bad_pixel_mask(frame, options["lower_threshold"], options["upper_threshold"])
+            impute_bad_pixel_mask(frame, mask, inplace=True)
+    lap("repair")
+
+    iso_phase, isochrom_phase = PhaseStepEngine(method=options["phase_method"]).compute(stack)
+    lap("phase")
+
+    arrays = {
+        results_store.RAW_STACK: stack,
+        results_store.ISOCLINIC: iso_phase,
+        results_store.ISOCHROMATIC: isochrom_phase,
+    }
+    n_residues = {}
+    if options["unwrap_method"] != "none":
+        iso_period, isochrom_period = phase_periods(options["phase_method"])
+        for name, unwrapped_name, phase, period in [
+            ("isoclinic", results_store.ISOCLINIC_UNWRAPPED, iso_phase, iso_period),
+            ("isochromatic", results_store.ISOCHROMATIC_UNWRAPPED, isochrom_phase, isochrom_period),
+        ]:
+            result = unwrap_phase(phase, method=options["unwrap_method"], period=period)
+            arrays[unwrapped_name] = result.unwrapped
+            n_residues[name] = result.n_residues
+    lap("unwrap")
+
+    output_path = Path(output_dir) / set_id
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    attrs = {"sources": paths, "crop_box": roi, "n_residues": n_residues, **options}
+    outputs = [str(results_store.save_dataset(output_path, arrays, attrs))]
+    lap("save")
+
+    timings["total"] = sum(timings.values())
+    return {
+        "sources": paths,
+        "outputs": outputs,
+        "shape": list(stack.shape[1:]),
+        "n_residues": n_residues,
+        "timings": timings,
+        "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def load_manifest(path):
+    if Path(path).exists():
+        with open(path) as f:
+            return json.load(f)
+    return {"options": None, "sets": {}}
+
+
+def save_manifest(manifest, path):
+    # write then rename, so an interrupted run never leaves a half-written manifest
+    tmp_path = Path(str(path) + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_batch(root, output_dir, options, max_workers=None, memory_budget_mb=4096, force=False):
+    """
+    Process every complete set under root that the manifest doesn't list as finished.
+
+    Returns:
+        dict: set id -> manifest entry, for the sets processed in this run
+    """
+    if options["crop"] is not None:
+        x0, y0, x1, y1 = options["crop"]
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"Empty crop box {tuple(options['crop'])}, expected X0 < X1 and Y0 < Y1")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / "manifest.json"
+    manifest = load_manifest(manifest_path)
+    if manifest["options"] not in (None, options):
+        logger.warning("Options differ from the manifest's previous run, finished sets are still skipped"
+                       " (use --force to reprocess them)")
+    manifest["options"] = options
+
+    image_sets = find_image_sets(root)
+    pending = [(set_id, paths) for set_id, paths in image_sets.items()
+               if force or set_id not in manifest["sets"]]
+    logger.info(f"{len(image_sets)} complete sets found, {len(image_sets) - len(pending)} already done, "
+                f"{len(pending)} to process")
+
+    budget = memory_budget_mb * 1e6
+    processed = {}
+    in_flight = {}  # future -> (set_id, estimated bytes)
+    in_flight_bytes = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or in_flight:
+            # submit while the budget allows; always allow one set so nothing stalls
+            while pending:
+                set_id, paths = pending[0]
+                estimate = estimate_set_bytes(paths)
+                if in_flight and in_flight_bytes + estimate > budget:
+                    break
+                pending.pop(0)
+                future = executor.submit(process_image_set, set_id, paths, str(output_dir), options)
+                in_flight[future] = (set_id, estimate)
+                in_flight_bytes += estimate
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                set_id, estimate = in_flight.pop(future)
+                in_flight_bytes -= estimate
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    logger.error(f"{set_id} failed: {e}")
+                    continue
+                processed[set_id] = entry
+                manifest["sets"][set_id] = entry
+                save_manifest(manifest, manifest_path)
+                logger.success(f"{set_id} done in {entry['timings']['total']:.2f} s")
+    return processed
+
+
+def print_timing_report(processed):
+    header = f"{'set':<40}" + "".join(f"{stage:>9}" for stage in STAGES + ["total"])
+    print(header)
+    print("-" * len(header))
+    for set_id, entry in sorted(processed.items()):
+        timings = entry["timings"]
+        print(f"{set_id:<40}" + "".join(f"{timings.get(stage, 0.0):>9.3f}" for stage in STAGES + ["total"]))
+
+
+def main():
+    from modules.phase_unwrap import UNWRAP_METHODS
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("root", type=Path, help="Folder searched recursively for I1-I10 sets")
+    parser.add_argument("--output", type=Path, default=Path("RESULTS"))
+    parser.add_argument("--crop", type=int, nargs=4, metavar=("X0", "Y0", "X1", "Y1"))
+    parser.add_argument("--sensor-id", help="Repair with this sensor's stored bad pixel map "
+                                            "instead of thresholding every frame")
+    parser.add_argument("--bad-pixel-dir", default=None, help="Bad pixel map store folder")
+    parser.add_argument("--lower-threshold", type=float, default=101)
+    parser.add_argument("--upper-threshold", type=float, default=20e3)
+    parser.add_argument("--phase-method", choices=["arctan2", "arctan"], default="arctan2")
+    parser.add_argument("--unwrap-method", choices=list(UNWRAP_METHODS) + ["none"], default="quality_guided")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--memory-budget-mb", type=float, default=4096,
+                        help="Estimated memory allowed for the sets in flight")
+    parser.add_argument("--force", action="store_true", help="Reprocess sets listed in the manifest")
+    args = parser.parse_args()
+
+    if args.bad_pixel_dir is None:
+        from modules.bad_pixel_map import DEFAULT_STORE_DIR
+        args.bad_pixel_dir = str(DEFAULT_STORE_DIR)
+
+    options = {
+        "crop": args.crop,
+        "sensor_id": args.sensor_id,
+        "bad_pixel_dir": args.bad_pixel_dir,
+        "lower_threshold": args.lower_threshold,
+        "upper_threshold": args.upper_threshold,
+        "phase_method": args.phase_method,
+        "unwrap_method": args.unwrap_method,
+    }
+    t0 = time.perf_counter()
+    processed = run_batch(args.root, args.output, options, max_workers=args.workers,
+                          memory_budget_mb=args.memory_budget_mb, force=args.force)
+    print_timing_report(processed)
+    print(f"\n{len(processed)} sets in {time.perf_counter() - t0:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
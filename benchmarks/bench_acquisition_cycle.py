@@ -0,0 +1,86 @@
+"""
+Run a full I1-I10 acquisition cycle on the simulated bench and report the motion,
+capture and analysis time, plus how well the phase maps match the known stress field.
+
+Usage:
+    python -m benchmarks.bench_acquisition_cycle [--table config/angles_Ramesh.csv] [--time-scale 0.05]
+"""
+import argparse
+import asyncio
+import time
+import tomllib
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from Devices.bench import open_bench
+from modules.acquisition_planner import load_angle_csv, load_angle_table, plan_sequence
+from modules.phase_analysis import PhaseStepEngine
+from modules.phase_unwrap import wrap
+
+PHASE_OFFSET = 90.0
+
+
+async def move_step(bench, angles):
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[loop.run_in_executor(None, mount.move_to_position, angle + PHASE_OFFSET, 0.1, True)
+                           for mount, angle in zip(bench.rotation_mounts, angles) if angle is not None])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--table", default="config/angles_Ramesh.csv",
+                        help="Angle table in config.toml, or the path of an angle CSV")
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    args = parser.parse_args()
+
+    logger.remove()
+    with open(Path(__file__).parent.parent / "config.toml", "rb") as f:
+        config = tomllib.load(f)
+    table = load_angle_csv(args.table) if args.table.endswith(".csv") else load_angle_table(config, args.table)
+    bench = open_bench(config, simulate=True, time_scale=args.time_scale)
+    bench.led.set_current(800)
+    bench.led.turn_on()
+    plan = plan_sequence(table, [0.0] * 4, phase_offset=PHASE_OFFSET, settle_time=0.0)
+
+    frames = {}
+    timings = {"move": 0.0, "capture": 0.0}
+    for qwp_state, group in plan.groups:
+        bench.set_qwps(qwp_state)
+        for step in group:
+            t0 = time.perf_counter()
+            asyncio.run(move_step(bench, table[step]))
+            t1 = time.perf_counter()
+            frames[step] = bench.camera.capture()
+            timings["move"] += t1 - t0
+            timings["capture"] += time.perf_counter() - t1
+    t0 = time.perf_counter()
+    stack = np.stack([frames[f"I{i}"] for i in range(1, 11)])
+    iso, isochrom = PhaseStepEngine().compute(stack)
+    timings["phase"] = time.perf_counter() - t0
+    bench.close()
+
+    scale = args.time_scale or 1.0
+    print(f"order: {plan.steps}")
+    print(f"{'stage':>10}{'bench (s)':>12}{'wall (s)':>10}")
+    print(f"{'move':>10}{timings['move'] / scale:>12.2f}{timings['move']:>10.2f}  (estimated {plan.estimated_time:.2f} s)")
+    print(f"{'capture':>10}{timings['capture'] / scale:>12.2f}{timings['capture']:>10.2f}")
+    print(f"{'phase':>10}{'':>12}{timings['phase']:>10.3f}")
+
+    # compare with the sample away from the load points; isoclinic modulo pi/2 and
+    # isochromatic up to the sign flip where the isoclinic wraps
+    sample = bench.optics.sample
+    height, width = sample.shape
+    y, x = np.mgrid[0:height, 0:width]
+    inner = np.hypot(x - (width - 1) / 2, y - (height - 1) / 2) < 0.3 * min(height, width)
+    iso_error = np.abs(wrap(4 * (iso - sample.theta)) / 4)[inner]
+    isochrom_error = np.minimum(np.abs(wrap(isochrom - sample.delta)),
+                                np.abs(wrap(isochrom + sample.delta)))[inner]
+    print(f"isoclinic error: median {np.median(iso_error):.4f} rad, p95 {np.percentile(iso_error, 95):.4f} rad")
+    print(f"isochromatic error: median {np.median(isochrom_error):.4f} rad, "
+          f"p95 {np.percentile(isochrom_error, 95):.4f} rad")
+
+
+if __name__ == "__main__":
+    main()
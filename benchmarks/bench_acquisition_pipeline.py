@@ -0,0 +1,77 @@
+"""
+Compare processing the I1-I10 frames after the acquisition with processing them
+on a worker while the simulated mounts move (AcquisitionPipeline). Reports the
+motion time, the total time to finished phase maps and the wait after the last frame.
+
+Usage:
+    python -m benchmarks.bench_acquisition_pipeline [--size 2048] [--time-scale 0.05]
+"""
+import argparse
+import asyncio
+import time
+
+from loguru import logger
+
+from Devices.bench import simulated_bench
+from modules.acquisition_pipeline import AcquisitionPipeline
+from modules.acquisition_planner import load_angle_csv, plan_sequence
+from modules.roi import ROI
+
+PHASE_OFFSET = 90.0
+
+
+async def move_step(bench, angles):
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[loop.run_in_executor(None, mount.move_to_position, angle + PHASE_OFFSET, 0.1, True)
+                           for mount, angle in zip(bench.rotation_mounts, angles) if angle is not None])
+
+
+def run(size, time_scale, overlap, table, thresholds):
+    bench = simulated_bench({"simulation": {"image_size": size}}, time_scale=time_scale)
+    bench.led.set_current(800)
+    bench.led.turn_on()
+    plan = plan_sequence(table, [0.0] * 4, phase_offset=PHASE_OFFSET, settle_time=0.0)
+    roi = ROI(size // 8, size // 8, size - size // 8, size - size // 8)
+
+    t_start = time.perf_counter()
+    motion = 0.0
+    pipeline = AcquisitionPipeline(roi=roi, thresholds=thresholds)
+    frames = {}
+    for qwp_state, group in plan.groups:
+        bench.set_qwps(qwp_state)
+        for step in group:
+            t0 = time.perf_counter()
+            asyncio.run(move_step(bench, table[step]))
+            motion += time.perf_counter() - t0
+            frame = bench.camera.capture()
+            if overlap:
+                pipeline.submit(step, frame)
+            else:
+                frames[step] = frame
+    t_last_frame = time.perf_counter()
+    if not overlap:
+        for step, frame in frames.items():
+            pipeline.submit(step, frame)
+    result = pipeline.result()
+    t_done = time.perf_counter()
+    assert result.isochrom_phase is not None
+    return motion, t_done - t_start, t_done - t_last_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    parser.add_argument("--table", default="config/angles_Ramesh.csv")
+    args = parser.parse_args()
+    logger.remove()
+
+    table = load_angle_csv(args.table)
+    print(f"{'mode':>12}{'motion (s)':>12}{'total (s)':>11}{'after last frame (s)':>22}")
+    for overlap in (False, True):
+        motion, total, tail = run(args.size, args.time_scale, overlap, table, thresholds=(101, 20e3))
+        print(f"{'overlapped' if overlap else 'sequential':>12}{motion:>12.2f}{total:>11.2f}{tail:>22.2f}")
+
+
+if __name__ == "__main__":
+    main()
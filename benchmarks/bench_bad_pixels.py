@@ -0,0 +1,91 @@
+"""
+Benchmark bad-pixel detection and repair as the number of bad pixels grows.
+
+Compares the mask-based find_bad_pixel_mask() / impute_bad_pixel_mask() with the
+previous per-pixel Python loop. The loop is only timed up to --max-loop-pixels
+because it becomes impractically slow beyond that.
+
+Usage:
+    python -m benchmarks.bench_bad_pixels [--height 2048] [--width 2048]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from modules.image_process import find_bad_pixel_mask, impute_bad_pixel_mask
+
+
+def impute_bad_pixels_loop(img_array, bad_pixels):
+    """
+    The tuple-list implementation that impute_bad_pixels() used to have.
+    """
+    for x, y in bad_pixels:
+        surrounding_values = []
+        for i in [-1, 0, 1]:
+            for j in [-1, 0, 1]:
+                if i == 0 and j == 0:
+                    continue
+                if 0 <= y + i < img_array.shape[0] and 0 <= x + j < img_array.shape[1]:
+                    surrounding_values.append(img_array[y + i, x + j])
+        if surrounding_values:
+            img_array[y, x] = np.mean(surrounding_values)
+    return img_array
+
+
+def find_bad_pixels_where(img_array, lower_threshold=101, upper_threshold=20e3):
+    """
+    The np.where + tuple-list implementation that find_bad_pixels() used to have.
+    """
+    dim_pixels = np.where(img_array < lower_threshold)
+    bright_pixels = np.where(img_array > upper_threshold)
+    bad_pixels = np.concatenate((dim_pixels, bright_pixels), axis=1)
+    return list(zip(bad_pixels[1], bad_pixels[0]))
+
+
+def make_image(height, width, n_bad, rng):
+    image = rng.uniform(1000, 10000, size=(height, width)).astype(np.float32)
+    flat_idx = rng.choice(height * width, size=n_bad, replace=False)
+    values = np.where(rng.random(n_bad) < 0.5, 0.0, 60000.0)
+    image.flat[flat_idx] = values
+    return image
+
+
+def timed(func):
+    t0 = time.perf_counter()
+    func()
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--height", type=int, default=2048)
+    parser.add_argument("--width", type=int, default=2048)
+    parser.add_argument("--max-loop-pixels", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"image: {args.height} x {args.width}")
+    print(f"{'n_bad':>9}{'loop find':>12}{'loop repair':>13}{'mask find':>12}"
+          f"{'mean repair':>13}{'median repair':>15}")
+    for n_bad in [10, 100, 1_000, 10_000, 100_000, 1_000_000]:
+        image = make_image(args.height, args.width, n_bad, rng)
+
+        t_mask = timed(lambda: find_bad_pixel_mask(image))
+        mask = find_bad_pixel_mask(image)
+        t_mean = timed(lambda: impute_bad_pixel_mask(image, mask, method="mean"))
+        t_median = timed(lambda: impute_bad_pixel_mask(image, mask, method="median"))
+
+        if n_bad <= args.max_loop_pixels:
+            t_loop_find = timed(lambda: find_bad_pixels_where(image))
+            coords = find_bad_pixels_where(image)
+            t_loop = timed(lambda: impute_bad_pixels_loop(image.copy(), coords))
+            loop_find, loop_repair = f"{t_loop_find:12.4f}", f"{t_loop:13.4f}"
+        else:
+            loop_find, loop_repair = f"{'-':>12}", f"{'-':>13}"
+
+        print(f"{n_bad:>9}{loop_find}{loop_repair}{t_mask:12.4f}{t_mean:13.4f}{t_median:15.4f}")
+
+
+if __name__ == "__main__":
+    main()
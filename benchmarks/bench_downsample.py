@@ -0,0 +1,60 @@
+"""
+Benchmark the downsampling modes against the nested-loop compress_image()
+that the app used to call on every rerun.
+
+Usage:
+    python -m benchmarks.bench_downsample [--height 2048] [--width 2048] [--factor 3]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from modules.downsample import downsample, DOWNSAMPLE_MODES
+from modules.phase_analysis import isoclinic_phase, ISOCLINIC_PERIOD
+
+
+def compress_image_loop(image, skip_points=2):
+    """
+    The double-loop implementation that compress_image() used to have.
+    """
+    height, width = image.shape[:2]
+    compressed_image = np.zeros((height // skip_points + 1, width // skip_points + 1))
+    for i in range(height):
+        for j in range(width):
+            if i % skip_points == 0 and j % skip_points == 0:
+                compressed_image[i // skip_points, j // skip_points] = image[i, j]
+    return compressed_image
+
+
+def timed(func, repeats=1):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--height", type=int, default=2048)
+    parser.add_argument("--width", type=int, default=2048)
+    parser.add_argument("--factor", type=int, default=3)
+    parser.add_argument("--skip-loop", action="store_true", help="don't time the slow loop")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    I1, I2, I3, I4 = rng.uniform(0, 20000, size=(4, args.height, args.width)).astype(np.float32)
+    iso_phase = isoclinic_phase(I1, I2, I3, I4)
+
+    print(f"isoclinic phase map: {iso_phase.shape}, factor {args.factor}")
+    if not args.skip_loop:
+        print(f"{'loop (old compress_image)':<28}{timed(lambda: compress_image_loop(iso_phase, args.factor)):>10.4f} s")
+    for mode in DOWNSAMPLE_MODES:
+        t = timed(lambda: downsample(iso_phase, args.factor, mode=mode, period=ISOCLINIC_PERIOD), repeats=3)
+        print(f"{mode:<28}{t:>10.4f} s")
+
+
+if __name__ == "__main__":
+    main()
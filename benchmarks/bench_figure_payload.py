@@ -0,0 +1,38 @@
+"""
+Measure the JSON payload and build time of create_plotly_figure() for growing
+sensor sizes, at full resolution and with a max_pixels preview.
+
+Usage:
+    python -m benchmarks.bench_figure_payload [--max-pixels 262144]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from modules.plotting_modules import create_plotly_figure, DEFAULT_MAX_PIXELS
+
+
+def payload(img_array, **kwargs):
+    t0 = time.perf_counter()
+    fig = create_plotly_figure(img_array, **kwargs)
+    size = len(fig.to_json())
+    return size / 1e6, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-pixels", type=int, default=DEFAULT_MAX_PIXELS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'image':>12}{'full (MB)':>12}{'full (s)':>10}{'preview (MB)':>14}{'preview (s)':>13}")
+    for side in [256, 512, 1024, 2048, 4096]:
+        image = rng.uniform(0, 65535, size=(side, side)).astype(np.float32)
+        full_mb, full_s = payload(image)
+        preview_mb, preview_s = payload(image, max_pixels=args.max_pixels)
+        print(f"{f'{side}x{side}':>12}{full_mb:>12.2f}{full_s:>10.3f}{preview_mb:>14.2f}{preview_s:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
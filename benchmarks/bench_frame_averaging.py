@@ -0,0 +1,121 @@
+"""
+Averaging K frames per phase step with FrameAccumulator (Welford, float64).
+
+Reports the peak memory of averaging K frames against stacking them and taking
+the mean, and, on the simulated bench, the phase noise after averaging against
+the noise predicted by phase_variance().
+
+Usage:
+    python -m benchmarks.bench_frame_averaging [--size 1024] [--ks 1 4 16 64]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from loguru import logger
+
+from Devices.bench import simulated_bench
+from Devices.frame_source import SimulatedFrameSource, AveragingFrameSource
+from modules.acquisition_planner import load_angle_csv, group_steps
+from modules.acquisition_pipeline import AcquisitionPipeline
+from modules.frame_averaging import FrameAccumulator
+from modules.phase_analysis import ISOCLINIC_PERIOD, ISOCHROMATIC_PERIOD
+from modules.phase_unwrap import wrap
+
+PHASE_OFFSET = 90.0
+# median of |x| for a standard normal x
+MEDIAN_ABS_GAUSSIAN = 0.6745
+
+
+def frames(k, shape, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(k):
+        yield rng.integers(1000, 60000, shape, dtype=np.uint16)
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20, elapsed
+
+
+def welford(k, shape):
+    accumulator = FrameAccumulator(shape)
+    for frame in frames(k, shape):
+        accumulator.add(frame)
+    return accumulator.mean, accumulator.variance_of_mean() if k > 1 else None
+
+
+def stacked(k, shape):
+    stack = np.stack(list(frames(k, shape))).astype(np.float64)
+    return stack.mean(axis=0), stack.var(axis=0, ddof=1) / k if k > 1 else None
+
+
+def acquire(bench, table, source):
+    pipeline = AcquisitionPipeline()
+    for qwp_state, group in group_steps(table):
+        bench.set_qwps(qwp_state)
+        for step in group:
+            for mount, angle in zip(bench.rotation_mounts, table[step]):
+                if angle is not None:
+                    mount.move_to_position(angle + PHASE_OFFSET, 0.1, True)
+            frame = source.grab(step)
+            pipeline.submit(step, frame.array, frame.variance)
+    return pipeline.result()
+
+
+def phase_noise(size, ks, table):
+    bench = simulated_bench({"simulation": {"image_size": size}}, time_scale=0.0)
+    bench.led.set_current(800)
+    bench.led.turn_on()
+    camera = bench.camera
+    noise = camera.gain, camera.read_noise
+    camera.gain, camera.read_noise = 0.0, 0.0
+    reference = acquire(bench, table, SimulatedFrameSource(camera))
+    camera.gain, camera.read_noise = noise
+    inside = bench.optics.sample.delta > 0
+
+    # median absolute error, so the few pixels with no modulation do not dominate
+    print(f"\nMedian absolute phase error inside the disc, {size}x{size} simulated frames (rad)")
+    print(f"{'K':>4}{'iso':>10}{'predicted':>11}{'isochrom':>10}{'predicted':>11}")
+    for k in ks:
+        result = acquire(bench, table, AveragingFrameSource(SimulatedFrameSource(camera), k))
+        iso_error = wrap(result.iso_phase - reference.iso_phase, ISOCLINIC_PERIOD)[inside]
+        isochrom_error = wrap(result.isochrom_phase - reference.isochrom_phase, ISOCHROMATIC_PERIOD)[inside]
+        if result.iso_variance is None:
+            iso_pred = isochrom_pred = "-"
+        else:
+            iso_pred = f"{MEDIAN_ABS_GAUSSIAN * np.median(np.sqrt(result.iso_variance[inside])):.4f}"
+            isochrom_pred = f"{MEDIAN_ABS_GAUSSIAN * np.median(np.sqrt(result.isochrom_variance[inside])):.4f}"
+        print(f"{k:>4}{np.median(np.abs(iso_error)):>10.4f}{iso_pred:>11}"
+              f"{np.median(np.abs(isochrom_error)):>10.4f}{isochrom_pred:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--noise-size", type=int, default=256)
+    parser.add_argument("--table", default="config/angles_Ramesh.csv")
+    args = parser.parse_args()
+    logger.remove()
+
+    shape = (args.size, args.size)
+    frame_mb = args.size * args.size * 2 / 2**20
+    print(f"Peak memory averaging K {args.size}x{args.size} uint16 frames ({frame_mb:.1f} MB each)")
+    print(f"{'K':>4}{'welford (MB)':>14}{'time (s)':>10}{'stacked (MB)':>14}{'time (s)':>10}")
+    for k in args.ks:
+        welford_mb, welford_s = peak_memory(lambda: welford(k, shape))
+        stacked_mb, stacked_s = peak_memory(lambda: stacked(k, shape))
+        print(f"{k:>4}{welford_mb:>14.0f}{welford_s:>10.2f}{stacked_mb:>14.0f}{stacked_s:>10.2f}")
+
+    phase_noise(args.noise_size, [k for k in args.ks if k <= 16], load_angle_csv(args.table))
+
+
+if __name__ == "__main__":
+    main()
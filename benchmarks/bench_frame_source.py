@@ -0,0 +1,73 @@
+"""
+Time from requesting a frame to having it as a numpy array, for the simulated
+camera, a folder watched while another thread writes PNGs into it (standing in for
+the camera software), and the fixed waits of the old GUI save path for reference.
+
+Usage:
+    python -m benchmarks.bench_frame_source [--size 2048] [--frames 10]
+"""
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from Devices.frame_source import FileWatcherFrameSource, SimulatedFrameSource, FrameWriter
+from Devices.bench import simulated_bench
+
+# click duration + waits + per-character typing of CameraAutomation.save_image_png_typewrite
+GUI_FIXED_WAITS = 1.0 + 1.0 + 0.3 + 0.5
+GUI_TYPE_SPEED = 0.02
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--frames", type=int, default=10)
+    args = parser.parse_args()
+    logger.remove()
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 50000, (args.size, args.size), dtype=np.uint16)
+    names = [f"I{i + 1}" for i in range(args.frames)]
+    print(f"{'source':>24}{'mean (s)':>10}{'max (s)':>10}")
+
+    gui = GUI_FIXED_WAITS + GUI_TYPE_SPEED * len("I10_CZT.png")
+    print(f"{'gui save (waits only)':>24}{gui:>10.2f}{gui:>10.2f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        watch_dir = Path(tmp) / "camera"
+        watch_dir.mkdir()
+
+        def camera_software(name):
+            # writes the file a moment after the trigger, like the vendor software
+            threading.Timer(0.01, cv2.imwrite, (str(watch_dir / f"{name}.png"), image)).start()
+
+        source = FileWatcherFrameSource(watch_dir, trigger=camera_software, poll_interval=0.01)
+        times = [source.grab(name).time_to_array for name in names]
+        print(f"{'file watcher':>24}{np.mean(times):>10.2f}{np.max(times):>10.2f}")
+
+        bench = simulated_bench({"simulation": {"image_size": args.size}}, time_scale=0.0)
+        bench.led.set_current(800)
+        bench.led.turn_on()
+        source = SimulatedFrameSource(bench.camera)
+        t0 = time.perf_counter()
+        with FrameWriter(Path(tmp) / "saved") as writer:
+            times = []
+            for name in names:
+                frame = source.grab(name)
+                writer.submit(frame)
+                times.append(frame.time_to_array)
+            t_grabbed = time.perf_counter()
+        t_written = time.perf_counter()
+        print(f"{'simulated (in memory)':>24}{np.mean(times):>10.2f}{np.max(times):>10.2f}")
+        print(f"background writes finished {t_written - t_grabbed:.2f} s after the last grab "
+              f"({t_written - t0:.2f} s total)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark load_image_stack() against ten sequential png_to_array() calls plus
+np.stack, on synthetic 16-bit PNGs.
+
+Usage:
+    python -m benchmarks.bench_image_stack [--height 2048] [--width 2048]
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from modules.image_process import png_to_array, load_image_stack
+
+
+def measure(func, repeats=3):
+    """
+    Return (best wall time in s, peak traced memory in MB) of func().
+    """
+    best, peak = float("inf"), 0
+    for _ in range(repeats):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return best, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--height", type=int, default=2048)
+    parser.add_argument("--width", type=int, default=2048)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    h, w = args.height, args.width
+    crop_box = (w // 4, h // 4, 3 * w // 4, 3 * h // 4)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(1, 11):
+            path = Path(tmp) / f"I{i}_CZT.png"
+            frame = rng.normal(15000, 500, size=(h, w)).clip(0, 65535).astype(np.uint16)
+            cv2.imwrite(str(path), frame)
+            paths.append(path)
+
+        def sequential():
+            return np.stack([png_to_array(path) for path in paths])
+
+        def sequential_cropped():
+            x0, y0, x1, y1 = crop_box
+            return np.stack([png_to_array(path)[y0:y1, x0:x1] for path in paths])
+
+        assert np.array_equal(sequential(), load_image_stack(paths))
+
+        print(f"10 frames of {h} x {w} uint16")
+        print(f"{'loader':<40}{'time (s)':>10}{'peak (MB)':>12}")
+        rows = [
+            ("10 x png_to_array + np.stack", sequential),
+            ("load_image_stack float32", lambda: load_image_stack(paths)),
+            ("load_image_stack uint16", lambda: load_image_stack(paths, dtype=np.uint16)),
+            ("10 x png_to_array, crop, np.stack", sequential_cropped),
+            ("load_image_stack float32, crop_box", lambda: load_image_stack(paths, crop_box=crop_box)),
+        ]
+        for name, func in rows:
+            t, peak = measure(func)
+            print(f"{name:<40}{t:>10.3f}{peak:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark the single-pass image_stats() against the separate numpy passes it
+replaces: flatten + mean/std/min/max, np.percentile for a colour range, and a
+px.histogram of every pixel. Reports time, peak extra memory and histogram payload.
+
+Usage:
+    python -m benchmarks.bench_image_stats [--sizes 1024 2048 4096]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import plotly.express as px
+
+from modules.image_stats import image_stats
+from modules.plotting_modules import plot_histogram
+
+
+def measured(func):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6, result
+
+
+def numpy_summary(image):
+    flat = image.flatten()
+    return np.mean(flat), np.std(flat), np.min(flat), np.max(flat), np.percentile(image, 1), np.percentile(image, 99)
+
+
+def stats_summary(image):
+    stats = image_stats(image)
+    return (stats.mean, stats.std, stats.minimum, stats.maximum) + tuple(stats.percentile([1, 99]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096])
+    parser.add_argument("--histogram-max", type=int, default=1024,
+                        help="Largest image for the per-pixel px.histogram")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'image':>12}{'method':>14}{'time (s)':>10}{'peak (MB)':>11}{'p1 error':>10}{'p99 error':>11}")
+    for size in args.sizes:
+        image = rng.normal(20000, 3000, (size, size)).astype(np.float32)
+        t_numpy, mb_numpy, reference = measured(lambda: numpy_summary(image))
+        t_stats, mb_stats, summary = measured(lambda: stats_summary(image))
+        span = reference[3] - reference[2]
+        print(f"{f'{size}x{size}':>12}{'numpy':>14}{t_numpy:>10.3f}{mb_numpy:>11.1f}{'-':>10}{'-':>11}")
+        print(f"{'':>12}{'image_stats':>14}{t_stats:>10.3f}{mb_stats:>11.1f}"
+              f"{abs(summary[4] - reference[4]) / span:>10.1e}{abs(summary[5] - reference[5]) / span:>11.1e}")
+
+    print(f"\n{'image':>12}{'histogram':>14}{'time (s)':>10}{'JSON (MB)':>11}")
+    for size in args.sizes:
+        image = rng.normal(20000, 3000, (size, size)).astype(np.float32)
+        if size <= args.histogram_max:
+            t0 = time.perf_counter()
+            payload = len(px.histogram(image.flatten(), nbins=256).to_json()) / 1e6
+            print(f"{f'{size}x{size}':>12}{'px.histogram':>14}{time.perf_counter() - t0:>10.3f}{payload:>11.2f}")
+        t0 = time.perf_counter()
+        payload = len(plot_histogram(image).to_json()) / 1e6
+        print(f"{f'{size}x{size}':>12}{'bin counts':>14}{time.perf_counter() - t0:>10.3f}{payload:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark the work saved by the modulation mask when the specimen covers a small
+part of the frame: a loaded disc on a dark background, ten noisy phase steps, then
+unwrapping and saving with and without the mask.
+
+Usage:
+    python -m benchmarks.bench_modulation_mask [--size 1024] [--radius 0.2]
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from modules.acquisition_planner import load_angle_csv
+from modules.phase_analysis import PhaseStepEngine, modulation_mask, ISOCHROMATIC_PERIOD
+from modules.phase_unwrap import unwrap_phase
+from modules.polariscope_model import disc_under_compression, stress_to_optics, polariscope_intensity
+from modules.results_store import save_dataset, RAW_STACK, ISOCLINIC, ISOCHROMATIC, ISOCHROMATIC_UNWRAPPED
+
+
+def timed(func):
+    t0 = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t0, result
+
+
+def disc_stack(table, size, radius, counts, read_noise, rng):
+    """Ten steps of a disc that is the only lit part of the frame."""
+    sxx, syy, sxy, inside = disc_under_compression((size, size), radius, load=1500.0, thickness=5.0)
+    theta, delta = stress_to_optics(sxx, syy, sxy, fringe_value=7.0, thickness=5.0)
+    stack = np.empty((len(table), size, size), dtype=np.float32)
+    for image, angles in zip(stack, table.values()):
+        angles = [None if angle is None else np.radians(angle) for angle in angles]
+        image[:] = counts * inside * polariscope_intensity(theta, delta, *angles)
+    stack += rng.normal(0, read_noise, stack.shape).astype(np.float32)
+    return stack, inside
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--radius", type=float, default=0.2, help="Disc radius as a fraction of the size")
+    parser.add_argument("--counts", type=float, default=20000.0)
+    parser.add_argument("--read-noise", type=float, default=20.0)
+    parser.add_argument("--table", default="config/angles_Ramesh.csv")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    stack, inside = disc_stack(load_angle_csv(args.table), args.size, args.radius * args.size,
+                               args.counts, args.read_noise, rng)
+    engine = PhaseStepEngine()
+    iso, isochrom = engine.compute(stack)
+    t_modulation, modulation = timed(lambda: engine.compute_modulation(stack, iso))
+    t_mask, mask = timed(lambda: modulation_mask(modulation))
+    print(f"{args.size}x{args.size}, disc {inside.mean():.1%} of the frame, mask {mask.mean():.1%} "
+          f"({np.mean(mask[inside]):.1%} of the disc, {np.mean(mask[~inside]):.2%} of the background)")
+    print(f"modulation {t_modulation:.3f} s, mask {t_mask:.3f} s")
+
+    print(f"\n{'isochromatic unwrap':<24}{'time (s)':>10}{'residues':>10}")
+    for method in ("quality_guided", "least_squares"):
+        for name, pixels in (("all pixels", None), ("masked", mask)):
+            elapsed, result = timed(lambda: unwrap_phase(isochrom, method, ISOCHROMATIC_PERIOD, mask=pixels))
+            print(f"{f'{method}, {name}':<24}{elapsed:>10.3f}{result.n_residues:>10}")
+
+    unwrapped = unwrap_phase(isochrom, "quality_guided", ISOCHROMATIC_PERIOD, mask=mask).unwrapped
+    arrays = {RAW_STACK: stack, ISOCLINIC: iso, ISOCHROMATIC: isochrom, ISOCHROMATIC_UNWRAPPED: unwrapped}
+    print(f"\n{'save':<24}{'time (s)':>10}{'size (MB)':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, pixels in (("all pixels", None), ("masked", mask)):
+            elapsed, path = timed(lambda: save_dataset(Path(tmp) / name.replace(" ", "_"), arrays, mask=pixels))
+            print(f"{name:<24}{elapsed:>10.3f}{os.path.getsize(path) / 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
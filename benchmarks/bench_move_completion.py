@@ -0,0 +1,63 @@
+"""
+Compare the move completion latency of the old sleep-polling loop in
+RotationMount.move_to_position with wait_for_move, on a simulated mount in
+virtual time (runs instantly).
+
+Usage:
+    python -m benchmarks.bench_move_completion [--distances 1 5 22.5 45 90 180]
+"""
+import argparse
+
+from modules.acquisition_planner import MotionProfile
+from Devices.move_completion import wait_for_move
+from Devices.simulated_rotation_mount import SimulatedMountBackend
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def old_move(backend, clock, target, tolerance=0.1):
+    # current_position: CC_RequestPosition + 0.2 s sleep per read
+    def read():
+        clock.sleep(0.2)
+        return backend.position()
+    read()                       # "already at" check
+    clock.sleep(0.25)            # before CC_MoveAbsolute
+    backend.move_to(target)
+    while abs(read() - target) > tolerance:
+        clock.sleep(0.5)
+    return read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--distances", type=float, nargs="+", default=[1, 5, 22.5, 45, 90, 180])
+    parser.add_argument("--settle-window", type=float, default=0.0)
+    args = parser.parse_args()
+
+    profile = MotionProfile()
+    print(f"{'distance':>10}{'motion (s)':>12}{'old (s)':>10}{'new (s)':>10}{'polls':>8}")
+    for distance in args.distances:
+        clock = VirtualClock()
+        old_move(SimulatedMountBackend(profile, clock=clock), clock, distance)
+        old_latency = clock()
+
+        clock = VirtualClock()
+        backend = SimulatedMountBackend(profile, clock=clock)
+        backend.move_to(distance)
+        result = wait_for_move(backend, distance, settle_window=args.settle_window,
+                               clock=clock, sleep=clock.sleep)
+        print(f"{distance:>10.1f}{profile.move_time(distance):>12.2f}{old_latency:>10.2f}"
+              f"{result.latency:>10.2f}{result.polls:>8}")
+
+
+if __name__ == "__main__":
+    main()
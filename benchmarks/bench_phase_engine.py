@@ -0,0 +1,75 @@
+"""
+Benchmark the fused PhaseStepEngine against the two-call
+isoclinic_phase() / isochromatic_phase() path.
+
+Peak memory is measured with tracemalloc (numpy reports its buffers to it),
+so the numbers only include array allocations made by the phase calculation.
+
+Usage:
+    python -m benchmarks.bench_phase_engine [--height 2048] [--width 2048] [--repeats 3]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from modules.phase_analysis import isoclinic_phase, isochromatic_phase, PhaseStepEngine
+
+
+def two_call_path(stack, method='arctan2'):
+    iso_phase = isoclinic_phase(stack[0], stack[1], stack[2], stack[3], method=method)
+    isochrom_phase = isochromatic_phase(iso_phase, *stack[4:], method=method)
+    return iso_phase, isochrom_phase
+
+
+def measure(func, repeats):
+    """
+    Return (best wall time in s, peak traced memory in MB) of func().
+    """
+    times = []
+    peak = 0
+    for _ in range(repeats):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(times), peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--height", type=int, default=2048)
+    parser.add_argument("--width", type=int, default=2048)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--tile-rows", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    stack = rng.integers(0, 2**16, size=(10, args.height, args.width), dtype=np.uint16)
+    stack = stack.astype(np.float32)
+
+    engine = PhaseStepEngine(tile_rows=args.tile_rows)
+    out = engine.allocate(stack.shape[1:])
+
+    expected = two_call_path(stack)
+    result = engine.compute(stack, out=out)
+    assert np.array_equal(expected[0], result[0]) and np.array_equal(expected[1], result[1])
+    del expected, result
+
+    t_ref, mem_ref = measure(lambda: two_call_path(stack), args.repeats)
+    t_engine, mem_engine = measure(lambda: engine.compute(stack, out=out), args.repeats)
+    # Same engine but letting it allocate the outputs every call
+    t_alloc, mem_alloc = measure(lambda: engine.compute(stack), args.repeats)
+
+    print(f"stack: {stack.shape} {stack.dtype}, {stack.nbytes / 1e6:.0f} MB")
+    print(f"{'path':<32}{'time (s)':>10}{'peak (MB)':>12}")
+    print(f"{'two-call (isoclinic+isochrom)':<32}{t_ref:>10.3f}{mem_ref:>12.1f}")
+    print(f"{'engine, allocating outputs':<32}{t_alloc:>10.3f}{mem_alloc:>12.1f}")
+    print(f"{'engine, preallocated outputs':<32}{t_engine:>10.3f}{mem_engine:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
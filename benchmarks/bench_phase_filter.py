@@ -0,0 +1,59 @@
+"""
+Benchmark the wrapped-phase filters on a synthetic noisy map: filter time per
+method and size, then residues, quality-guided unwrap time and the fraction of
+pixels unwrapped to the wrong period with and without filtering.
+
+Usage:
+    python -m benchmarks.bench_phase_filter [--sizes 512 1024 2048] [--noise 0.9]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_phase_unwrap import synthetic_phase
+from modules.phase_filter import filter_phase
+from modules.phase_unwrap import unwrap_phase
+
+# (method, size) pairs; size is sigma for gaussian
+FILTERS = [("box", 3), ("box", 9), ("gaussian", 1.0), ("gaussian", 4.0), ("median", 3), ("median", 5)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--noise", type=float, default=0.9)
+    parser.add_argument("--unwrap-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>10}{'filter':>16}{'time (s)':>10}")
+    for size in args.sizes:
+        _, wrapped = synthetic_phase(size, args.noise, rng)
+        wrapped = wrapped.astype(np.float32)
+        for method, window in FILTERS:
+            t0 = time.perf_counter()
+            filter_phase(wrapped, method=method, size=window)
+            print(f"{f'{size}x{size}':>10}{f'{method} {window:g}':>16}{time.perf_counter() - t0:>10.3f}")
+
+    size = args.unwrap_size
+    true_phase, wrapped = synthetic_phase(size, args.noise, rng)
+    print(f"\nQuality-guided unwrap of a {size}x{size} map")
+    print(f"{'filter':>16}{'residues':>10}{'unwrap (s)':>12}{'wrong period':>14}")
+    for method, window in [(None, None)] + FILTERS:
+        if method is None:
+            phase, quality, name = wrapped, None, "none"
+        else:
+            phase, quality = filter_phase(wrapped, method=method, size=window)
+            name = f"{method} {window:g}"
+        t0 = time.perf_counter()
+        result = unwrap_phase(phase, quality=quality)
+        elapsed = time.perf_counter() - t0
+        error = result.unwrapped - true_phase
+        error -= np.median(error)
+        wrong = np.mean(np.abs(error) > np.pi)
+        print(f"{name:>16}{result.n_residues:>10}{elapsed:>12.3f}{wrong:>14.2%}")
+
+
+if __name__ == "__main__":
+    main()
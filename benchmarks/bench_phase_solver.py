@@ -0,0 +1,102 @@
+"""
+Benchmark PhaseStepSolver (least squares over any angle table) against the
+closed-form PhaseStepEngine, and show the noise gained from redundant steps.
+
+Speed is measured on random (N, H, W) stacks for the ten-step table and the same
+table taken twice; noise on the simulated bench, against the noise-free phases.
+
+Usage:
+    python -m benchmarks.bench_phase_solver [--size 2048] [--repeats 3]
+"""
+import argparse
+import time
+
+import numpy as np
+from loguru import logger
+
+from Devices.bench import simulated_bench
+from modules.acquisition_planner import load_angle_csv, group_steps
+from modules.phase_analysis import PhaseStepEngine, ISOCLINIC_PERIOD, ISOCHROMATIC_PERIOD
+from modules.phase_solver import PhaseStepSolver
+from modules.phase_unwrap import wrap
+
+PHASE_OFFSET = 90.0
+
+
+def best_time(func, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def repeated(table, times):
+    """The table's steps taken several times, as separate steps."""
+    return {f"{step}_{i}": angles for i in range(times) for step, angles in table.items()}
+
+
+def capture(bench, table):
+    frames = {}
+    for qwp_state, group in group_steps(table):
+        bench.set_qwps(qwp_state)
+        for step in group:
+            for mount, angle in zip(bench.rotation_mounts, table[step]):
+                if angle is not None:
+                    mount.move_to_position(angle + PHASE_OFFSET, 0.1, True)
+            frames[step] = bench.camera.capture()
+    return np.stack([frames[step] for step in table]).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--noise-size", type=int, default=256)
+    parser.add_argument("--table", default="config/angles_Ramesh.csv")
+    args = parser.parse_args()
+    logger.remove()
+
+    table = load_angle_csv(args.table)
+    rng = np.random.default_rng(0)
+    print(f"{args.size}x{args.size} stacks")
+    print(f"{'method':>24}{'steps':>7}{'time (s)':>10}")
+    stack = rng.integers(0, 2**16, size=(len(table), args.size, args.size), dtype=np.uint16).astype(np.float32)
+    engine = PhaseStepEngine()
+    print(f"{'closed form':>24}{len(table):>7}{best_time(lambda: engine.compute(stack), args.repeats):>10.2f}")
+    for times in (1, 2):
+        solver = PhaseStepSolver(repeated(table, times))
+        if times > 1:
+            stack = np.concatenate([stack] * times)
+        print(f"{'least squares':>24}{len(solver.steps):>7}{best_time(lambda: solver.solve(stack), args.repeats):>10.2f}")
+    del stack
+
+    bench = simulated_bench({"simulation": {"image_size": args.noise_size}}, time_scale=0.0)
+    bench.led.set_current(800)
+    bench.led.turn_on()
+    dark_level = bench.camera.dark_level
+    camera = bench.camera
+    noise = camera.gain, camera.read_noise
+    camera.gain, camera.read_noise = 0.0, 0.0
+    reference = PhaseStepSolver(table, dark_level).solve(capture(bench, table))
+    camera.gain, camera.read_noise = noise
+    inside = bench.optics.sample.delta > 0
+
+    print(f"\nMedian absolute phase error inside the disc, {args.noise_size}x{args.noise_size} simulated frames (rad)")
+    print(f"{'method':>24}{'steps':>7}{'iso':>10}{'isochrom':>10}{'residual':>10}")
+    stack = capture(bench, table)
+    iso, isochrom = engine.compute(stack)
+    print(f"{'closed form':>24}{len(table):>7}{np.median(np.abs(wrap(iso - reference.iso_phase, ISOCLINIC_PERIOD))[inside]):>10.4f}"
+          f"{np.median(np.abs(wrap(isochrom - reference.isochrom_phase, ISOCHROMATIC_PERIOD))[inside]):>10.4f}{'-':>10}")
+    for times in (1, 2, 4):
+        steps = repeated(table, times)
+        solution = PhaseStepSolver(steps, dark_level).solve(capture(bench, steps))
+        iso_error = np.abs(wrap(solution.iso_phase - reference.iso_phase, ISOCLINIC_PERIOD))[inside]
+        isochrom_error = np.abs(wrap(solution.isochrom_phase - reference.isochrom_phase, ISOCHROMATIC_PERIOD))[inside]
+        print(f"{'least squares':>24}{len(steps):>7}{np.median(iso_error):>10.4f}{np.median(isochrom_error):>10.4f}"
+              f"{np.median(solution.residual[inside]):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark the 2D unwrapping methods for growing map sizes on a synthetic,
+noisy isochromatic-like phase map, reporting runtime, residue count and the
+fraction of pixels unwrapped to the wrong period.
+
+Usage:
+    python -m benchmarks.bench_phase_unwrap [--sizes 256 512 1024] [--noise 0.9]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from modules.phase_unwrap import unwrap_phase, wrap, UNWRAP_METHODS
+
+
+def synthetic_phase(size, noise, rng):
+    y, x = np.mgrid[0:size, 0:size] / size
+    # a few fringes of a bending-like field plus noise
+    true_phase = 40 * ((x - 0.5) ** 2 - (y - 0.4) ** 2) + 10 * x
+    wrapped = wrap(true_phase + rng.normal(0, noise, true_phase.shape))
+    return true_phase, wrapped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024])
+    parser.add_argument("--noise", type=float, default=0.9)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>10}{'method':>16}{'time (s)':>10}{'residues':>10}{'wrong period':>14}")
+    for size in args.sizes:
+        true_phase, wrapped = synthetic_phase(size, args.noise, rng)
+        for method in UNWRAP_METHODS:
+            t0 = time.perf_counter()
+            result = unwrap_phase(wrapped, method=method)
+            elapsed = time.perf_counter() - t0
+            error = result.unwrapped - true_phase
+            error -= np.median(error)
+            wrong = np.mean(np.abs(error) > np.pi)
+            print(f"{f'{size}x{size}':>10}{method:>16}{elapsed:>10.3f}{result.n_residues:>10}{wrong:>14.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark the isoclinic direction-field renderers for growing map sizes: the
+old per-pixel versions (matplotlib quiver over a full meshgrid, figure_factory
+create_quiver) against the figure-sized LineCollection and WebGL trace.
+
+Matplotlib is timed up to a rendered PNG, Plotly up to the JSON sent to the browser.
+
+Usage:
+    python -m benchmarks.bench_quiver [--sizes 64 256 1024 4096] [--max-old 1024] [--max-old-plotly 64]
+"""
+import argparse
+import io
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import plotly.figure_factory as ff
+
+from modules.plotting_modules import quiver_plot_matplotlib, quiver_plot_plotly
+
+
+def old_quiver_matplotlib(isoclinic_phase):
+    x, y = np.meshgrid(np.arange(isoclinic_phase.shape[1]), np.arange(isoclinic_phase.shape[0]))
+    fig, ax = plt.subplots(figsize=(15, 15 * isoclinic_phase.shape[0] / isoclinic_phase.shape[1]))
+    ax.quiver(x, y, np.cos(isoclinic_phase) * 0.2, np.sin(isoclinic_phase) * 0.2, isoclinic_phase,
+              scale=1 / 0.05, pivot='mid', width=0.001, alpha=0.8, cmap='jet')
+    ax.invert_yaxis()
+    return fig
+
+
+def old_quiver_plotly(isoclinic_phase):
+    x, y = np.meshgrid(np.arange(isoclinic_phase.shape[1]), np.arange(isoclinic_phase.shape[0]))
+    return ff.create_quiver(x, y, np.cos(isoclinic_phase), np.sin(isoclinic_phase),
+                            scale=0.1, arrow_scale=0.4, line_width=0.5)
+
+
+def render_png(make_figure):
+    t0 = time.perf_counter()
+    fig = make_figure()
+    fig.savefig(io.BytesIO(), format="png")
+    plt.close(fig)
+    return time.perf_counter() - t0
+
+
+def render_json(make_figure):
+    t0 = time.perf_counter()
+    size = len(make_figure().to_json())
+    return time.perf_counter() - t0, size / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256, 1024, 4096])
+    parser.add_argument("--max-old", type=int, default=1024, help="Largest map for the per-pixel matplotlib quiver")
+    # create_quiver's time grows with the square of the arrow count: ~17 s at 64x64
+    parser.add_argument("--max-old-plotly", type=int, default=64, help="Largest map for create_quiver")
+    args = parser.parse_args()
+
+    print(f"{'map':>12}{'renderer':>14}{'old (s)':>10}{'new (s)':>10}{'old (MB)':>10}{'new (MB)':>10}")
+    for size in args.sizes:
+        y, x = np.mgrid[0:size, 0:size] / size
+        phase = (0.25 * np.arctan2(np.sin(8 * x * y), np.cos(6 * x - 3 * y))).astype(np.float32)
+        old = render_png(lambda: old_quiver_matplotlib(phase)) if size <= args.max_old else None
+        new = render_png(lambda: quiver_plot_matplotlib(phase))
+        print(f"{f'{size}x{size}':>12}{'matplotlib':>14}{'-' if old is None else f'{old:.2f}':>10}{new:>10.2f}"
+              f"{'-':>10}{'-':>10}")
+
+        old_s, old_mb = render_json(lambda: old_quiver_plotly(phase)) if size <= args.max_old_plotly else (None, None)
+        new_s, new_mb = render_json(lambda: quiver_plot_plotly(phase))
+        print(f"{'':>12}{'plotly':>14}{'-' if old_s is None else f'{old_s:.2f}':>10}{new_s:>10.2f}"
+              f"{'-' if old_mb is None else f'{old_mb:.1f}':>10}{new_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark saving and loading phase maps with the .sir results store against the
+CSV (save_array_to_csv / csv_to_array) and .npy paths, and time region-of-interest
+reads from the store.
+
+Usage:
+    python -m benchmarks.bench_results_store [--height 1024] [--width 1024]
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from modules.image_process import save_array_to_csv, csv_to_array
+from modules.results_store import save_dataset, load_dataset, DatasetReader, ISOCHROMATIC
+
+
+def timed(func):
+    t0 = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--height", type=int, default=1024)
+    parser.add_argument("--width", type=int, default=1024)
+    parser.add_argument("--skip-csv", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:args.height, 0:args.width] / max(args.height, args.width)
+    # smooth phase map plus a little noise, like a real isochromatic map
+    phase = np.arctan2(np.sin(30 * x * y), np.cos(30 * x * y)) + rng.normal(0, 0.05, x.shape)
+    phase = phase.astype(np.float32)
+    roi = (slice(args.height // 4, args.height // 4 + 128), slice(args.width // 4, args.width // 4 + 128))
+
+    print(f"phase map: {phase.shape} {phase.dtype}, {phase.nbytes / 1e6:.1f} MB")
+    print(f"{'format':<16}{'save (s)':>10}{'load (s)':>10}{'ROI (s)':>10}{'size (MB)':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if not args.skip_csv:
+            t_save, _ = timed(lambda: save_array_to_csv(phase, "phase", save_dir=str(tmp)))
+            t_load, _ = timed(lambda: csv_to_array(str(tmp / "phase.csv")))
+            size = os.path.getsize(tmp / "phase.csv") / 1e6
+            print(f"{'csv':<16}{t_save:>10.3f}{t_load:>10.3f}{'-':>10}{size:>11.2f}")
+
+        t_save, _ = timed(lambda: np.save(tmp / "phase.npy", phase))
+        t_load, _ = timed(lambda: np.load(tmp / "phase.npy"))
+        t_roi, _ = timed(lambda: np.array(np.load(tmp / "phase.npy", mmap_mode="r")[roi]))
+        size = os.path.getsize(tmp / "phase.npy") / 1e6
+        print(f"{'npy':<16}{t_save:>10.3f}{t_load:>10.3f}{t_roi:>10.4f}{size:>11.2f}")
+
+        for compression in ["zlib", "none"]:
+            path = tmp / f"phase_{compression}"
+            t_save, path = timed(lambda: save_dataset(path, {ISOCHROMATIC: phase}, compression=compression))
+            t_load, (arrays, _) = timed(lambda: load_dataset(path))
+            assert np.array_equal(arrays[ISOCHROMATIC], phase)
+            with DatasetReader(path) as dataset:
+                t_roi, _ = timed(lambda: dataset.read(ISOCHROMATIC, roi))
+            size = os.path.getsize(path) / 1e6
+            print(f"{f'sir ({compression})':<16}{t_save:>10.3f}{t_load:>10.3f}{t_roi:>10.4f}{size:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
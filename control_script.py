@@ -1,7 +1,17 @@
-from Devices.thorlabs_rotation_mount import RotationMount
-from Devices.camera_automation import CameraAutomation
-from Devices.LED_control import LEDController
+from Devices.bench import open_bench
+from Devices.frame_source import SimulatedFrameSource, FileWatcherFrameSource, AveragingFrameSource, FrameWriter
+from modules.acquisition_planner import load_angle_table, load_angle_csv, load_mount_offsets, plan_sequence
+from modules.acquisition_pipeline import AcquisitionPipeline
+from modules.bad_pixel_map import BadPixelMapStore
+from modules.phase_analysis import phase_periods, variance_quality
+from modules.phase_unwrap import unwrap_phase, UNWRAP_METHODS
+from modules.roi import ROI
+from modules.results_store import (save_dataset, RAW_STACK, ISOCLINIC, ISOCHROMATIC,
+                                   ISOCLINIC_UNWRAPPED, ISOCHROMATIC_UNWRAPPED,
+                                   ISOCLINIC_VARIANCE, ISOCHROMATIC_VARIANCE, FIT_RESIDUAL,
+                                   MODULATION, VALID_MASK)
 
+import argparse
 import asyncio
 from pathlib import Path
 import tomllib
@@ -25,65 +35,190 @@ logger.add(
     backtrace=True, diagnose=True                      # nicer tracebacks
 )
 
+parser = argparse.ArgumentParser(description="Acquire the I1-I10 phase-stepped images")
+parser.add_argument("--simulate", action="store_true",
+                    help="Run on simulated mounts, LED and camera instead of the hardware")
+parser.add_argument("--time-scale", type=float, default=1.0,
+                    help="Simulated seconds per real second of motion and exposure (0 for instant)")
+parser.add_argument("--table", default="angles_Ramesh",
+                    help="Angle table in config.toml, or the path of an angle CSV")
+parser.add_argument("--save-path", default=None)
+parser.add_argument("--frame-source", choices=["gui", "watch"], default="gui",
+                    help="gui: save each frame through the camera GUI, then load it. "
+                         "watch: load each new image the camera software writes to --watch-dir. "
+                         "Simulated runs always take frames straight from the simulated camera.")
+parser.add_argument("--watch-dir", default=None, help="Folder the camera software saves into")
+parser.add_argument("--crop", type=int, nargs=4, metavar=("X0", "Y0", "X1", "Y1"),
+                    help="Region of the sensor to analyse")
+parser.add_argument("--frames-per-step", type=int, default=1,
+                    help="Average this many frames for each step; 2 or more also gives phase variance maps")
+parser.add_argument("--phase-solver", choices=["closed_form", "matrix"], default="closed_form",
+                    help="closed_form: the I1-I10 formulas, computed while the mounts move. "
+                         "matrix: least squares for the steps of --table, whatever they are")
+parser.add_argument("--dark-level", type=float, default=0.0,
+                    help="Camera counts with no light, subtracted by the matrix solver")
+parser.add_argument("--unwrap-method", choices=list(UNWRAP_METHODS) + ["none"], default="quality_guided",
+                    help="Unwrap both phase maps before saving; quality_guided unwraps the least "
+                         "noisy pixels first when --frames-per-step gives phase variance maps")
+parser.add_argument("--modulation-threshold", type=float, default=None,
+                    help="Lowest valid fringe modulation in counts; pixels below it are not saved. "
+                         "Default: 10%% of the bright part of the specimen, 0 saves every pixel")
+parser.add_argument("--sensor-id", default=None,
+                    help="Repair bad pixels with this sensor's stored map (see modules/bad_pixel_map.py)")
+args = parser.parse_args()
+
 config_path = Path(__file__).parent / "config.toml"
 with open(config_path, "rb") as f:
     config = tomllib.load(f)
 
-image_save_path = Path("R:/Pockels_data/STRESS IMAGING/Polariscope-Test")
+if args.save_path is not None:
+    image_save_path = Path(args.save_path)
+elif args.simulate:
+    image_save_path = Path(__file__).parent / "SAMPLE_DATA" / "simulated"
+else:
+    image_save_path = Path("R:/Pockels_data/STRESS IMAGING/Polariscope-Test")
 image_save_path.mkdir(parents=True, exist_ok=True) # create folder if it doesn't exist
-cam = CameraAutomation()
-led = LEDController()
+bench = open_bench(config, simulate=args.simulate, time_scale=args.time_scale)
+cam = bench.camera
+led = bench.led
 led.set_current(800)
 led.turn_on()
 
-polarizer = RotationMount(config["polarizer_SN"], label="Polarizer", mirror=False)
-qwp1 = RotationMount(config["qwp1_SN"], label="QWP1", mirror=True)
-qwp2 = RotationMount(config["qwp2_SN"], label="QWP2", mirror=False)
-analyzer = RotationMount(config["analyzer_SN"], label="Analyzer", mirror=True)
-
-rotation_mounts = [polarizer, qwp1, qwp2, analyzer]
-for mount in rotation_mounts:
-    mount.open_device()
-    mount.setup_conversion()
+polarizer, qwp1, qwp2, analyzer = bench.rotation_mounts
+rotation_mounts = bench.rotation_mounts
 
 
-angles_Ramesh = config["angles_Ramesh"]
+MOUNT_OFFSETS = load_mount_offsets(config)
+SETTLE_TIME = 1.0
+# simulated runs go time_scale times faster; times below are reported in bench seconds
+time_scale = args.time_scale if args.simulate else 1.0
+if args.table.endswith(".csv"):
+    angle_table = load_angle_csv(args.table)
+else:
+    angle_table = load_angle_table(config, args.table)
 
 async def move_mount(mount, position):
-    await asyncio.get_event_loop().run_in_executor(None, mount.move_to_position, position)
-
-
-async def move_all_mounts(step, phase_offset=90.0):
-    if step in ["I1", "I2", "I3", "I4"]:
-        tasks = [
-            move_mount(polarizer, angles_Ramesh[step][0]+phase_offset),
-            move_mount(analyzer, angles_Ramesh[step][3]+phase_offset),
-        ]
-    else:
-        tasks = [
-            move_mount(polarizer, angles_Ramesh[step][0]+phase_offset),
-            move_mount(qwp1, angles_Ramesh[step][1]+phase_offset),
-            move_mount(qwp2, angles_Ramesh[step][2]+phase_offset),
-            move_mount(analyzer, angles_Ramesh[step][3]+phase_offset),
-        ]
+    await asyncio.get_event_loop().run_in_executor(None, mount.move_to_position, position, 0.1, True)
+
+
+async def move_all_mounts(step, mount_offsets=MOUNT_OFFSETS):
+    # mounts without an angle for this step (the QWPs in I1-I4) stay where they are
+    tasks = [
+        move_mount(mount, angle + offset)
+        for mount, angle, offset in zip(rotation_mounts, angle_table[step], mount_offsets)
+        if angle is not None
+    ]
     await asyncio.gather(*tasks)
 
-steps = ["I1", "I2", "I3", "I4", "I5", "I6", "I7", "I8", "I9", "I10"]
+# Order the steps for the least rotation, starting from where the mounts are now
+start_positions = []
+for mount in rotation_mounts:
+    position = mount.current_position % 360
+    start_positions.append((360 - position) % 360 if mount.mirror else position)
+plan = plan_sequence(angle_table, start_positions, phase_offset=MOUNT_OFFSETS, settle_time=SETTLE_TIME)
+logger.info(f"Acquisition order: {plan.steps}, estimated {plan.estimated_time:.1f} s of moves")
 
-for i, step in enumerate(steps):
-    response = input(f"Move to {step}? ('n' to skip, Enter to continue)")
-    if response.lower() != "n":
-        if step == "I5":
-            response2 = input("Mount the QWPs before continuing. Press Enter to continue.")
-        asyncio.run(move_all_mounts(step=step))
-        time.sleep(1)
-        if i == 0: # only type save path in the first image
+# Frames arrive as arrays; files are written in the background or already exist
+if args.simulate:
+    frame_source = SimulatedFrameSource(cam)
+elif args.frame_source == "watch":
+    frame_source = FileWatcherFrameSource(args.watch_dir or image_save_path)
+else:
+    first_image = True
+
+    def save_through_gui(step):
+        global first_image
+        if first_image: # only type save path in the first image
             cam.save_image_png_typewrite(f"{step}_CZT.png", 
                                          save_path=str(image_save_path))
+            first_image = False
         else:
             cam.save_image_png_typewrite(f"{step}_CZT.png")
 
+    frame_source = FileWatcherFrameSource(image_save_path, trigger=save_through_gui)
+if args.frames_per_step > 1:
+    frame_source = AveragingFrameSource(frame_source, args.frames_per_step)
+if args.simulate or args.frames_per_step == 1:
+    frame_writer = FrameWriter(image_save_path)
+else:
+    # averaged frames go to a subfolder, out of sight of the watcher that reads the raw ones
+    frame_writer = FrameWriter(image_save_path / "averaged")
+# crop, repair and phase calculation run on a worker while the mounts move
+roi = ROI.from_bounding_box(args.crop) if args.crop else None
+bad_pixel_mask = BadPixelMapStore().load(args.sensor_id) if args.sensor_id else None
+pipeline = AcquisitionPipeline(roi=roi, bad_pixel_mask=bad_pixel_mask,
+                               angle_table=angle_table if args.phase_solver == "matrix" else None,
+                               dark_level=args.dark_level, modulation_threshold=args.modulation_threshold)
+
+qwps_mounted = None
+actual_step_times = {}
+for qwp_state, group in plan.groups:
+    if qwp_state != qwps_mounted:
+        bench.set_qwps(qwp_state)
+    qwps_mounted = qwp_state
+    for step in group:
+        response = bench.prompt(f"Move to {step}? ('n' to skip, Enter to continue)")
+        if response.lower() == "n":
+            continue
+        t_step = time.perf_counter()
+        asyncio.run(move_all_mounts(step=step))
+        time.sleep(SETTLE_TIME * time_scale)
+        actual_step_times[step] = (time.perf_counter() - t_step) / (time_scale or 1.0)
+        logger.info(f"{step} - moves took {actual_step_times[step]:.1f} s "
+                    f"(estimated {plan.step_times[step]:.1f} s)")
+        frame = frame_source.grab(step)
+        pipeline.submit(step, frame.array, frame.variance)
+        if frame.path is None:
+            frame_writer.submit(frame)
+        logger.info(f"{step} - frame in memory after {frame.time_to_array:.2f} s")
+
+estimated_total = sum(plan.step_times[step] for step in actual_step_times)
+logger.info(f"Cycle move time: {sum(actual_step_times.values()):.1f} s actual, "
+            f"{estimated_total:.1f} s estimated")
+
+logger.info(f"Frames: {frame_source.stats}")
+
+t_last_frame = time.perf_counter()
+result = pipeline.result()
+if result.isochrom_phase is not None:
+    logger.info(f"Phase maps ready {time.perf_counter() - t_last_frame:.2f} s after the last frame")
+    arrays = {RAW_STACK: result.stack, ISOCLINIC: result.iso_phase, ISOCHROMATIC: result.isochrom_phase}
+    if result.isochrom_variance is not None:
+        arrays[ISOCLINIC_VARIANCE] = result.iso_variance
+        arrays[ISOCHROMATIC_VARIANCE] = result.isochrom_variance
+    if result.residual is not None:
+        arrays[FIT_RESIDUAL] = result.residual
+    logger.info(f"{result.mask.mean():.1%} of the pixels have enough modulation")
+    if args.unwrap_method != "none":
+        iso_period, isochrom_period = phase_periods(pipeline.engine.method)
+        for unwrapped_name, phase, period, variance in [
+            (ISOCLINIC_UNWRAPPED, result.iso_phase, iso_period, result.iso_variance),
+            (ISOCHROMATIC_UNWRAPPED, result.isochrom_phase, isochrom_period, result.isochrom_variance),
+        ]:
+            # averaged captures: the propagated phase variance orders the unwrap
+            kwargs = {}
+            if args.unwrap_method == "quality_guided" and variance is not None:
+                kwargs["quality"] = variance_quality(variance)
+            unwrapped = unwrap_phase(phase, args.unwrap_method, period, mask=result.mask, **kwargs)
+            arrays[unwrapped_name] = unwrapped.unwrapped
+            logger.info(f"{unwrapped_name} - {unwrapped.n_residues} residues")
+    # the maps are stored only where the mask is valid; the raw stack, mask and modulation in full
+    masked = [name for name in arrays if name != RAW_STACK]
+    arrays[MODULATION] = result.modulation
+    arrays[VALID_MASK] = result.mask
+    saved_path = save_dataset(image_save_path / "phase_maps", arrays,
+                              {"angle_table": args.table, "order": plan.steps, "crop_box": roi,
+                               "bad_pixel_sensor_id": args.sensor_id,
+                               "frames_per_step": args.frames_per_step, "phase_solver": args.phase_solver,
+                               "unwrap_method": args.unwrap_method,
+                               "modulation_threshold": args.modulation_threshold},
+                              mask=result.mask, masked=masked)
+    logger.success(f"Phase maps saved to {saved_path}")
+else:
+    logger.warning(f"No phase maps, missing {pipeline.missing_steps()}")
+
 ### SHUTDOWN ###
-led.turn_off()
+frame_writer.close()
 for mount in rotation_mounts:
-    mount.close_device()
\ No newline at end of file
+    logger.info(f"{mount.label} - {mount.latency_stats}")
+bench.close()
\ No newline at end of file
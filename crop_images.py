@@ -1,18 +1,19 @@
 import numpy as np
 from pathlib import Path
-from modules.image_process import png_to_array, crop_image, save_array_to_png
+from modules.image_process import load_image_stack, save_array_to_png
+from modules.roi import ROI
 
 folder = Path("C:/Code/Stress-Imaging/SAMPLE_DATA/XMED_3_point_bending")
 
-# Get all PNG files in the folder
-png_files = list(folder.glob('*.png'))
+# Get all PNG files in the folder, except the output of a previous run
+png_files = [file for file in folder.glob('*.png') if not file.stem.endswith('_cropped')]
+
+# Decode all files in parallel, converting only the cropped region
+roi = ROI(x0=115, y0=190, x1=507, y1=264)
+cropped_stack = load_image_stack(png_files, crop_box=roi)
 
 # Print each PNG file
-for file in png_files:
-    img_array = png_to_array(file)
-    crop_range_x = [115, 507]
-    crop_range_y = [190, 264]
-    cropped_img_array = crop_image(img_array, crop_range_x, crop_range_y)
+for file, cropped_img_array in zip(png_files, cropped_stack):
     new_filename = file.name.replace(".png", "_cropped.png")
     save_array_to_png(cropped_img_array, new_filename, save_dir=folder)
     print(file.name)
@@ -0,0 +1,185 @@
+"""
+Analyse frames while the acquisition is still running.
+
+    pipeline = AcquisitionPipeline(roi=ROI(115, 190, 507, 264), bad_pixel_mask=mask)
+    for step in plan.steps:
+        move_all_mounts(step)
+        pipeline.submit(step, frame_source.grab(step).array)   # returns at once
+    result = pipeline.result()
+
+Each frame is cropped to the ROI, converted into its slot of a preallocated
+(10, H, W) stack and bad-pixel repaired on a worker thread while the mounts move
+to the next step. The isoclinic phase is computed as soon as I1-I4 are in and the
+isochromatic phase as soon as I5-I10 are, so the phase maps are ready almost as
+soon as the last frame arrives, whatever order the steps are taken in.
+
+Averaged frames (AveragingFrameSource) can be submitted with their per-pixel
+variance; once all ten have one, the variance of both phase maps is propagated
+from them (phase_variance()) for quality-guided unwrapping.
+
+Given an angle table, the pipeline takes that table's steps instead and solves them
+all at once with PhaseStepSolver after the last one arrives, which also gives the
+per-pixel fit residual.
+
+Either way the fringe modulation is computed with the phases, and thresholded into
+a validity mask that later stages (unwrapping, filtering, saving) can skip on.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+import numpy as np
+from modules.image_process import impute_bad_pixel_mask, find_bad_pixel_mask
+from modules.phase_analysis import PhaseStepEngine, phase_variance, modulation_mask
+from modules.phase_solver import PhaseStepSolver
+
+STEPS = [f"I{i}" for i in range(1, 11)]
+ISOCLINIC_STEPS = STEPS[:4]
+
+
+class PipelineResult(NamedTuple):
+    stack: np.ndarray           # (steps, H, W) cropped, repaired I1-I10 or the table's steps
+    iso_phase: np.ndarray
+    isochrom_phase: np.ndarray
+    timings: dict               # event -> seconds since the pipeline started
+    iso_variance: np.ndarray | None = None       # phase variances, when every frame had one
+    isochrom_variance: np.ndarray | None = None
+    residual: np.ndarray | None = None           # fit residual, with an angle table
+    modulation: np.ndarray | None = None         # fringe modulation, counts
+    mask: np.ndarray | None = None               # True where the modulation is high enough
+
+
+class AcquisitionPipeline:
+    """
+    Args:
+        roi (ROI, optional): Region of the sensor to keep
+        bad_pixel_mask (numpy.ndarray, optional): Full-sensor bad pixel mask, e.g. from
+            BadPixelMapStore.load(); cropped with roi
+        thresholds (tuple, optional): (lower, upper) to find bad pixels in each frame
+            instead, like find_bad_pixel_mask()
+        phase_method (str): 'arctan2' or 'arctan'
+        dtype: Floating point type of the stack and phase maps
+        angle_table (dict, optional): Solve the steps of this table with PhaseStepSolver
+            instead of the closed-form I1-I10 formulas
+        dark_level (float): Camera counts with no light, subtracted by the solver
+        modulation_threshold (float, optional): Lowest valid fringe modulation in counts,
+            see modulation_mask(); 0 keeps every pixel
+    """
+    def __init__(self, roi=None, bad_pixel_mask=None, thresholds=None, phase_method="arctan2",
+                 dtype=np.float32, repair_method="mean", angle_table=None, dark_level=0.0,
+                 modulation_threshold=None):
+        self.roi = roi
+        self.bad_pixel_mask = bad_pixel_mask if roi is None or bad_pixel_mask is None else roi.apply(bad_pixel_mask)
+        self.thresholds = thresholds
+        self.repair_method = repair_method
+        self.dtype = np.dtype(dtype)
+        self.engine = PhaseStepEngine(method=phase_method, dtype=dtype)
+        self.solver = None if angle_table is None else PhaseStepSolver(angle_table, dark_level, dtype=dtype)
+        self.steps = STEPS if self.solver is None else self.solver.steps
+        self.residual = None
+        self.modulation_threshold = modulation_threshold
+        self.modulation = None
+        self.mask = None
+        self.stack = None
+        self.iso_phase = None
+        self.isochrom_phase = None
+        self.variance = None
+        self.iso_variance = None
+        self.isochrom_variance = None
+        self.timings = {}
+        self._received = set()
+        self._with_variance = set()
+        self._futures = []
+        # one worker: frames are processed in arrival order and never concurrently
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.start_time = time.perf_counter()
+
+    def submit(self, name, array, variance=None):
+        """
+        Queue a frame (e.g. name 'I3') for processing and return immediately.
+        The arrays must not be modified afterwards.
+
+        Args:
+            variance (numpy.ndarray, optional): Per-pixel variance of array, same shape
+        """
+        if name not in self.steps:
+            raise ValueError(f"Unknown step {name}, expected one of {self.steps}")
+        self.timings[f"{name} received"] = time.perf_counter() - self.start_time
+        future = self._executor.submit(self._process, name, array, variance)
+        self._futures.append(future)
+        return future
+
+    def _process(self, name, array, variance):
+        frame = array if self.roi is None else self.roi.apply(array)
+        if self.stack is None:
+            self.stack = np.empty((len(self.steps),) + frame.shape, dtype=self.dtype)
+        elif frame.shape != self.stack.shape[1:]:
+            raise ValueError(f"{name} has shape {frame.shape}, expected {self.stack.shape[1:]}")
+        out = self.stack[self.steps.index(name)]
+        np.copyto(out, frame, casting="unsafe")
+        mask = self.bad_pixel_mask
+        if mask is None and self.thresholds is not None:
+            mask = find_bad_pixel_mask(out, *self.thresholds)
+        if mask is not None:
+            impute_bad_pixel_mask(out, mask, method=self.repair_method, inplace=True)
+        if variance is not None:
+            self._store_variance(name, variance, mask)
+        self._received.add(name)
+        self.timings[f"{name} processed"] = time.perf_counter() - self.start_time
+
+        if self.solver is not None:
+            if self._received.issuperset(self.steps):
+                solution = self.solver.solve(self.stack)
+                self.iso_phase, self.isochrom_phase, self.residual = (solution.iso_phase, solution.isochrom_phase,
+                                                                      solution.residual)
+                self.timings["solved"] = time.perf_counter() - self.start_time
+                self._set_mask(solution.modulation)
+            return
+        if self.iso_phase is None and self._received.issuperset(ISOCLINIC_STEPS):
+            self.iso_phase = self.engine.compute_isoclinic(self.stack)
+            self.timings["isoclinic"] = time.perf_counter() - self.start_time
+        if self.iso_phase is not None and self.isochrom_phase is None and self._received.issuperset(STEPS):
+            self.isochrom_phase = self.engine.compute_isochromatic(self.stack, self.iso_phase)
+            self.timings["isochromatic"] = time.perf_counter() - self.start_time
+            self._set_mask(self.engine.compute_modulation(self.stack, self._arctan2_isoclinic()))
+        if (self.isochrom_phase is not None and self.isochrom_variance is None
+                and self._with_variance.issuperset(STEPS)):
+            self.iso_variance, self.isochrom_variance = phase_variance(self.stack, self.variance, self.iso_phase)
+            self.timings["phase variance"] = time.perf_counter() - self.start_time
+
+    def _arctan2_isoclinic(self):
+        # the modulation needs the full-range isoclinic angle, whatever the phase method
+        if self.engine.method == "arctan2":
+            return self.iso_phase
+        return PhaseStepEngine(dtype=self.engine.dtype).compute_isoclinic(self.stack)
+
+    def _set_mask(self, modulation):
+        self.modulation = modulation
+        self.mask = modulation_mask(modulation, self.modulation_threshold)
+        self.timings["mask"] = time.perf_counter() - self.start_time
+
+    def _store_variance(self, name, variance, mask):
+        variance = variance if self.roi is None else self.roi.apply(variance)
+        if variance.shape != self.stack.shape[1:]:
+            raise ValueError(f"{name} variance has shape {variance.shape}, expected {self.stack.shape[1:]}")
+        if self.variance is None:
+            self.variance = np.empty_like(self.stack)
+        out = self.variance[self.steps.index(name)]
+        np.copyto(out, variance, casting="unsafe")
+        if mask is not None:
+            impute_bad_pixel_mask(out, mask, method=self.repair_method, inplace=True)
+        self._with_variance.add(name)
+
+    def result(self):
+        """
+        Wait for the queued frames and return the phase maps; raises the first
+        processing error. The phase maps are None if steps are missing.
+        """
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        return PipelineResult(self.stack, self.iso_phase, self.isochrom_phase, dict(self.timings),
+                              self.iso_variance, self.isochrom_variance, self.residual,
+                              self.modulation, self.mask)
+
+    def missing_steps(self):
+        return [step for step in self.steps if step not in self._received]
@@ -0,0 +1,298 @@
+"""
+Plan the order of the phase-stepping steps (I1-I10) to minimise rotation mount travel.
+
+Each step is a row of an angle table from config.toml, e.g. angles_Ramesh:
+    I5 = [polarizer, qwp1, qwp2, analyzer]
+with "none" for a mount that is not used (the QWPs are removed for I1-I4).
+The order of the captures does not matter for the analysis because each frame is
+saved under its step name, so the steps can be taken in whichever order needs the
+least rotation. Steps that need the QWPs mounted are grouped together so they only
+have to be mounted or removed once.
+
+The mounts move concurrently, so a step takes as long as its slowest mount. Every
+mount turns the short way round to its target (see RotationMount.move_to_position).
+"""
+from itertools import permutations
+from typing import NamedTuple
+
+MOUNT_LABELS = ("Polarizer", "QWP1", "QWP2", "Analyzer")
+MOUNT_KEYS = ("polarizer", "qwp1", "qwp2", "analyzer")
+QWP_INDICES = (1, 2)
+ANGLE_TABLES = ("angles_Ramesh", "angles_Tsinghua")
+# above this many steps in a group, use nearest neighbour instead of trying every order
+MAX_EXHAUSTIVE_STEPS = 8
+
+
+class MotionProfile(NamedTuple):
+    """
+    Move time model of one rotation mount: trapezoidal velocity profile plus a
+    fixed overhead per move (command round trip and completion polling).
+    The defaults are for a PRM1Z8 on a KDC101.
+    """
+    velocity: float = 10.0       # deg/s
+    acceleration: float = 10.0   # deg/s^2
+    overhead: float = 0.2        # s
+
+    def move_time(self, distance):
+        """Time in seconds to turn by distance degrees, 0 if the mount does not move."""
+        distance = abs(distance)
+        if distance == 0:
+            return 0.0
+        ramp_distance = self.velocity ** 2 / self.acceleration
+        if distance < ramp_distance:
+            # never reaches full speed
+            travel = 2 * (distance / self.acceleration) ** 0.5
+        else:
+            travel = distance / self.velocity + self.velocity / self.acceleration
+        return self.overhead + travel
+
+    def travelled(self, distance, elapsed):
+        """
+        Degrees covered elapsed seconds after the start of a move of distance
+        degrees, counting the overhead as a delay before the mount starts turning.
+        """
+        distance = abs(distance)
+        t = elapsed - self.overhead
+        if t <= 0 or distance == 0:
+            return 0.0
+        total = self.move_time(distance) - self.overhead
+        if t >= total:
+            return distance
+        # time to reach the peak speed, which is below velocity for short moves
+        t_ramp = min(self.velocity / self.acceleration, total / 2)
+        peak = self.acceleration * t_ramp
+        if t < t_ramp:
+            return 0.5 * self.acceleration * t ** 2
+        if t < total - t_ramp:
+            return 0.5 * peak * t_ramp + peak * (t - t_ramp)
+        return distance - 0.5 * self.acceleration * (total - t) ** 2
+
+
+class SequencePlan(NamedTuple):
+    steps: list            # steps in capture order
+    groups: list           # (qwp_state, [steps]) in capture order
+    step_times: dict       # step -> estimated seconds (moves + settle)
+    estimated_time: float  # total estimated seconds
+
+
+def load_angle_table(config, name="angles_Ramesh"):
+    """
+    Read an angle table from config.toml as {step: [angle or None, ...]}.
+    """
+    if name not in config:
+        raise KeyError(f"No angle table '{name}' in the config")
+    return {step: [None if angle == "none" else float(angle) for angle in angles]
+            for step, angles in config[name].items()}
+
+
+def load_angle_csv(path):
+    """
+    Read an angle table from a CSV like config/angles_Ramesh.csv
+    (index,polarizer,qwp1,qwp1_mirror,qwp2,analyzer,analyzer_mirror with -1 for
+    an unused mount) as {step: [angle or None, ...]}.
+    """
+    import csv
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    return {row["index"]: [None if float(row[name]) < 0 else float(row[name])
+                           for name in ("polarizer", "qwp1", "qwp2", "analyzer")]
+            for row in rows}
+
+
+def load_mount_offsets(config, default=90.0):
+    """
+    Read the [mount_offsets] table of config.toml: the (unmirrored) mount position
+    at which each element's axis is at 0 degrees in the angle tables.
+
+    Returns:
+        tuple: Offsets in degrees in table order, default for a missing mount
+    """
+    offsets = config.get("mount_offsets", {})
+    return tuple(float(offsets.get(key, default)) for key in MOUNT_KEYS)
+
+
+def angular_distance(start, target):
+    """Shortest rotation from start to target in degrees, in [-180, 180)."""
+    return (target - start + 180.0) % 360.0 - 180.0
+
+
+def qwp_state(angles):
+    """'mounted' if the step uses the quarter wave plates, else 'removed'."""
+    return "removed" if all(angles[i] is None for i in QWP_INDICES) else "mounted"
+
+
+def group_steps(angle_table):
+    """
+    Group the steps by QWP state, keeping the table order.
+
+    Returns:
+        list: [(qwp_state, [steps]), ...]
+    """
+    groups = {}
+    for step, angles in angle_table.items():
+        groups.setdefault(qwp_state(angles), []).append(step)
+    return list(groups.items())
+
+
+def step_move(angle_table, step, positions, profile, phase_offset=90.0):
+    """
+    Move time of one step from the given mount positions. phase_offset is one
+    offset for every mount or one per mount, see load_mount_offsets().
+
+    Returns:
+        tuple: (seconds, new positions)
+    """
+    new_positions = list(positions)
+    seconds = 0.0
+    offsets = phase_offset if isinstance(phase_offset, (tuple, list)) else [phase_offset] * len(positions)
+    for i, angle in enumerate(angle_table[step]):
+        if angle is None:
+            continue
+        target = (angle + offsets[i]) % 360.0
+        if positions[i] is not None:
+            seconds = max(seconds, profile.move_time(angular_distance(positions[i], target)))
+        new_positions[i] = target
+    return seconds, new_positions
+
+
+def sequence_time(angle_table, steps, start_positions=None, profile=MotionProfile(),
+                  phase_offset=90.0, settle_time=1.0):
+    """
+    Estimated time of taking the steps in the given order.
+
+    Args:
+        start_positions (list, optional): Mount angles before the first step, in the
+            same frame as the table plus phase_offset. None for an unknown position,
+            which is assumed to cost nothing.
+        settle_time (float): Wait after each step's moves before capturing
+
+    Returns:
+        tuple: (total seconds, {step: seconds}, final positions)
+    """
+    positions = list(start_positions) if start_positions is not None else [None] * len(MOUNT_LABELS)
+    step_times = {}
+    for step in steps:
+        seconds, positions = step_move(angle_table, step, positions, profile, phase_offset)
+        step_times[step] = seconds + settle_time
+    return sum(step_times.values()), step_times, positions
+
+
+def _order_group(angle_table, steps, start_positions, profile, phase_offset):
+    """
+    Candidate orders of one group: the fastest order ending on each step.
+
+    Returns:
+        dict: last step -> (move seconds, order, final positions)
+    """
+    if len(steps) <= MAX_EXHAUSTIVE_STEPS:
+        orders = permutations(steps)
+    else:
+        orders = [_nearest_neighbour(angle_table, steps, start_positions, profile, phase_offset)]
+    best = {}
+    for order in orders:
+        seconds, _, positions = sequence_time(angle_table, order, start_positions, profile,
+                                              phase_offset, settle_time=0.0)
+        if order[-1] not in best or seconds < best[order[-1]][0]:
+            best[order[-1]] = (seconds, list(order), positions)
+    return best
+
+
+def _nearest_neighbour(angle_table, steps, start_positions, profile, phase_offset):
+    remaining = list(steps)
+    positions = list(start_positions)
+    order = []
+    while remaining:
+        moves = [step_move(angle_table, step, positions, profile, phase_offset) for step in remaining]
+        index = min(range(len(remaining)), key=lambda i: moves[i][0])
+        order.append(remaining.pop(index))
+        positions = moves[index][1]
+    return tuple(order)
+
+
+def plan_sequence(angle_table, start_positions=None, profile=MotionProfile(), phase_offset=90.0,
+                  settle_time=1.0, first_state=None):
+    """
+    Order the steps to minimise the total rotation time.
+
+    Steps with the same QWP state are taken together. Both group orders are tried
+    unless first_state ('mounted' or 'removed') fixes the one to start with, e.g.
+    because the QWPs are already on the bench. Within a group every order is tried,
+    keeping the fastest order ending on each step so the next group can start from
+    wherever is best.
+
+    Returns:
+        SequencePlan
+    """
+    groups = dict(group_steps(angle_table))
+    if start_positions is None:
+        start_positions = [None] * len(MOUNT_LABELS)
+    if first_state is not None and first_state not in groups:
+        raise ValueError(f"No steps with the QWPs {first_state}")
+
+    best_plan = None
+    for state_order in permutations(groups):
+        if first_state is not None and state_order[0] != first_state:
+            continue
+        # partial plans: last step -> (seconds, [(state, order), ...], positions)
+        partial = {None: (0.0, [], list(start_positions))}
+        for state in state_order:
+            extended = {}
+            for seconds, plan_groups, positions in partial.values():
+                candidates = _order_group(angle_table, groups[state], positions, profile, phase_offset)
+                for last, (group_seconds, order, end_positions) in candidates.items():
+                    total = seconds + group_seconds
+                    if last not in extended or total < extended[last][0]:
+                        extended[last] = (total, plan_groups + [(state, order)], end_positions)
+            partial = extended
+        seconds, plan_groups, _ = min(partial.values(), key=lambda plan: plan[0])
+        if best_plan is None or seconds < best_plan[0]:
+            best_plan = (seconds, plan_groups)
+
+    plan_groups = best_plan[1]
+    steps = [step for _, order in plan_groups for step in order]
+    estimated_time, step_times, _ = sequence_time(angle_table, steps, start_positions, profile,
+                                                  phase_offset, settle_time)
+    return SequencePlan(steps, plan_groups, step_times, estimated_time)
+
+
+if __name__ == "__main__":
+    # Validate the estimates against simulated mounts moving in real (scaled) time
+    import argparse
+    import asyncio
+    import time
+    import tomllib
+    from pathlib import Path
+    from Devices.simulated_rotation_mount import SimulatedRotationMount
+
+    parser = argparse.ArgumentParser(description="Plan and simulate an acquisition sequence")
+    parser.add_argument("--table", default="angles_Ramesh", choices=ANGLE_TABLES)
+    parser.add_argument("--time-scale", type=float, default=0.2,
+                        help="Simulated seconds per modelled second")
+    args = parser.parse_args()
+
+    with open(Path(__file__).parent.parent / "config.toml", "rb") as f:
+        table = load_angle_table(tomllib.load(f), args.table)
+
+    profile = MotionProfile()
+    settle_time = 1.0
+    start = [0.0] * len(MOUNT_LABELS)
+    plan = plan_sequence(table, start, profile, settle_time=settle_time)
+    table_order_time, _, _ = sequence_time(table, list(table), start, profile, settle_time=settle_time)
+    print(f"Table order: {list(table)} -> {table_order_time:.1f} s")
+    print(f"Planned order: {plan.steps} -> {plan.estimated_time:.1f} s")
+
+    mounts = [SimulatedRotationMount(label=label, mirror=label in ("QWP1", "Analyzer"),
+                                     profile=profile, time_scale=args.time_scale)
+              for label in MOUNT_LABELS]
+
+    async def move_step(step):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(None, mount.move_to_position, angle + 90.0, 0.1, True)
+                               for mount, angle in zip(mounts, table[step]) if angle is not None])
+
+    t_start = time.perf_counter()
+    for step in plan.steps:
+        asyncio.run(move_step(step))
+        time.sleep(settle_time * args.time_scale)
+    actual = (time.perf_counter() - t_start) / args.time_scale
+    print(f"Simulated: {actual:.1f} s (estimated {plan.estimated_time:.1f} s)")
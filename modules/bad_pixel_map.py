@@ -0,0 +1,174 @@
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from modules.image_process import png_to_array, find_bad_pixel_mask, impute_bad_pixel_mask
+
+DEFAULT_STORE_DIR = Path(__file__).parent.parent / "config" / "bad_pixel_maps"
+
+
+def encode_mask(mask):
+    """
+    Encode a boolean mask in whichever of two compact forms is smaller:
+    'sparse' (flat indices of the bad pixels) or 'packed' (one bit per pixel).
+
+    Returns:
+        tuple: (encoding, data) where data is a 1D numpy array
+    """
+    mask = np.asarray(mask, dtype=bool)
+    n_bad = int(np.count_nonzero(mask))
+    index_dtype = np.uint32 if mask.size < 2**32 else np.uint64
+    if n_bad * np.dtype(index_dtype).itemsize < (mask.size + 7) // 8:
+        return "sparse", np.flatnonzero(mask).astype(index_dtype)
+    return "packed", np.packbits(mask, axis=None)
+
+
+def decode_mask(encoding, data, shape):
+    """
+    Inverse of encode_mask().
+    """
+    shape = tuple(int(n) for n in shape)
+    if encoding == "sparse":
+        mask = np.zeros(shape, dtype=bool)
+        mask.flat[data] = True
+        return mask
+    if encoding == "packed":
+        return np.unpackbits(data, count=int(np.prod(shape))).astype(bool).reshape(shape)
+    raise ValueError(f"Invalid encoding: {encoding}")
+
+
+class BadPixelMapStore:
+    """
+    Per-sensor bad pixel maps, built once from a calibration capture and stored on disk.
+
+    Each sensor gets one '<sensor_id>.npz' file in store_dir holding the encoded mask
+    (see encode_mask) plus the thresholds and calibration file it was built from.
+    Loaded masks are kept in memory so repeated repairs don't touch the disk.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = Path(store_dir)
+        self._masks = {}
+        self._metadata = {}
+
+    def path_for(self, sensor_id):
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", str(sensor_id))
+        return self.store_dir / f"{safe_id}.npz"
+
+    def has(self, sensor_id):
+        return sensor_id in self._masks or self.path_for(sensor_id).exists()
+
+    def build(self, sensor_id, calibration_image, lower_threshold=101, upper_threshold=20e3):
+        """
+        Build the bad pixel map of a sensor from a calibration capture and save it.
+
+        Args:
+            sensor_id (str): Device or sensor identifier, e.g. camera serial number
+            calibration_image (str | Path | numpy.ndarray): e.g. calib_parallel_on.png
+            lower_threshold (float): Pixels below this value are bad (dead)
+            upper_threshold (float): Pixels above this value are bad (bright)
+
+        Returns:
+            numpy.ndarray: Boolean bad pixel mask
+        """
+        source = None
+        if isinstance(calibration_image, (str, Path)):
+            source = str(calibration_image)
+            calibration_image = png_to_array(calibration_image)
+        elif not isinstance(calibration_image, np.ndarray):
+            # e.g. a Streamlit UploadedFile
+            source = getattr(calibration_image, "name", None)
+            calibration_image = png_to_array(calibration_image)
+
+        mask = find_bad_pixel_mask(calibration_image, lower_threshold, upper_threshold)
+        metadata = {
+            "sensor_id": str(sensor_id),
+            "source": source,
+            "lower_threshold": float(lower_threshold),
+            "upper_threshold": float(upper_threshold),
+            "n_bad_pixels": int(np.count_nonzero(mask)),
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.save(sensor_id, mask, metadata)
+        return mask
+
+    def save(self, sensor_id, mask, metadata=None):
+        """
+        Save a bad pixel mask for a sensor, replacing any existing one.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        metadata = dict(metadata or {})
+        metadata.setdefault("sensor_id", str(sensor_id))
+        metadata.setdefault("n_bad_pixels", int(np.count_nonzero(mask)))
+        encoding, data = encode_mask(mask)
+
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            self.path_for(sensor_id),
+            encoding=np.array(encoding),
+            shape=np.array(mask.shape),
+            data=data,
+            metadata=np.array(json.dumps(metadata)),
+        )
+        self._masks[sensor_id] = mask
+        self._metadata[sensor_id] = metadata
+
+    def load(self, sensor_id):
+        """
+        Return the bad pixel mask of a sensor.
+        """
+        if sensor_id not in self._masks:
+            path = self.path_for(sensor_id)
+            if not path.exists():
+                raise KeyError(f"No bad pixel map stored for sensor {sensor_id!r}")
+            with np.load(path) as f:
+                mask = decode_mask(str(f["encoding"]), f["data"], f["shape"])
+                self._metadata[sensor_id] = json.loads(str(f["metadata"]))
+            self._masks[sensor_id] = mask
+        return self._masks[sensor_id]
+
+    def metadata(self, sensor_id):
+        self.load(sensor_id)
+        return self._metadata[sensor_id]
+
+    def repair(self, sensor_id, img_array, method="mean", inplace=False, roi=None):
+        """
+        Repair the bad pixels of an image taken with the given sensor.
+        If the image was cropped, roi is the region of the sensor it covers.
+        """
+        mask = self.load(sensor_id)
+        if roi is not None:
+            mask = roi.apply(mask)
+        return impute_bad_pixel_mask(img_array, mask, method=method, inplace=inplace)
+
+    def repair_images(self, sensor_id, images, method="mean", inplace=False, roi=None):
+        """
+        Repair every image in a dict (e.g. I1-I10) or an (N, H, W) stack with the same map.
+        """
+        if isinstance(images, dict):
+            return {key: self.repair(sensor_id, img, method, inplace, roi) for key, img in images.items()}
+        repaired = images if inplace else images.copy()
+        for img in repaired:
+            self.repair(sensor_id, img, method, inplace=True, roi=roi)
+        return repaired
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a sensor's bad pixel map from a calibration capture")
+    parser.add_argument("sensor_id")
+    parser.add_argument("calibration_image", help="e.g. calib_parallel_on.png")
+    parser.add_argument("--lower-threshold", type=float, default=101)
+    parser.add_argument("--upper-threshold", type=float, default=20e3)
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    args = parser.parse_args()
+
+    store = BadPixelMapStore(args.store_dir)
+    mask = store.build(args.sensor_id, args.calibration_image,
+                       lower_threshold=args.lower_threshold,
+                       upper_threshold=args.upper_threshold)
+    print(f"{np.count_nonzero(mask)} bad pixels saved to {store.path_for(args.sensor_id)}")
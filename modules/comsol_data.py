@@ -0,0 +1,235 @@
+"""
+Read COMSOL stress exports and resample them onto the camera pixel grid.
+
+COMSOL writes one text file per expression (sxx.txt, sxy.txt, syy.txt): a '%'
+header, then one row per mesh node with X, Y, the expression and the displacements
+u, v. Each file is parsed in one pass (header, then the numbers straight into an
+array). The files do not list the nodes in the same order, and nodes on domain
+boundaries appear once per domain, so the fields are aligned through a node index:
+every distinct (X, Y) pair, compared bit for bit, gets an integer index and values
+are gathered by it, averaging the duplicates. The aligned nodes are cached in a .sir
+file next to the exports and reused until an export changes.
+
+    nodes = load_stress_nodes("COMSOL")
+    grid = GridInterpolator(nodes.x, nodes.y, *pixel_centres((400, 1200), 10e-6, (-0.006, 0.002)))
+    sxx, syy, sxy = grid(nodes.sxx), grid(nodes.syy), grid(nodes.sxy)
+
+GridInterpolator triangulates the nodes once and stores, for every pixel, the three
+nodes of the triangle it falls in and their barycentric weights, so resampling
+another field (or another load case on the same mesh) is a gather and a weighted sum.
+"""
+import re
+from pathlib import Path
+from typing import NamedTuple
+import numpy as np
+from modules.results_store import save_dataset, load_dataset
+
+STRESS_FIELDS = ("sxx", "sxy", "syy")
+CACHE_NAME = "stress_nodes"
+_HEADER_ITEM = re.compile(r"%\s*([^:]+):\s*(.*)")
+
+
+class ComsolExport(NamedTuple):
+    metadata: dict       # header items, e.g. {'Model': ..., 'Nodes': '27915'}
+    columns: str         # the column header line
+    data: np.ndarray     # (nodes, columns) float64, X and Y first
+
+
+class StressNodes(NamedTuple):
+    x: np.ndarray        # node coordinates, model units (m)
+    y: np.ndarray
+    u: np.ndarray        # displacements
+    v: np.ndarray
+    sxx: np.ndarray      # stresses, NaN at nodes missing from an export
+    sxy: np.ndarray
+    syy: np.ndarray
+
+
+def read_comsol_export(path):
+    """
+    Parse a COMSOL text export (spreadsheet format).
+
+    Returns:
+        ComsolExport
+    """
+    metadata, columns = {}, ""
+    with open(path, "rb") as f:
+        while f.peek(1)[:1] == b"%":
+            line = f.readline().decode("utf-8", errors="replace").strip()
+            match = _HEADER_ITEM.match(line)
+            if match:
+                metadata[match[1].strip()] = match[2].strip()
+            else:
+                columns = line.lstrip("% ")
+        data = np.loadtxt(f, dtype=np.float64, ndmin=2)
+    nodes = metadata.get("Nodes")
+    if nodes is not None and int(nodes) != len(data):
+        raise ValueError(f"{path}: header says {nodes} nodes, found {len(data)} rows")
+    return ComsolExport(metadata, columns, data)
+
+
+def node_index(x, y):
+    """
+    Index the distinct (x, y) pairs, comparing the float64 values exactly.
+
+    Returns:
+        tuple: (unique x, unique y, inverse) with x == unique_x[inverse]
+    """
+    xy = np.ascontiguousarray(np.column_stack([x, y]), dtype=np.float64)
+    keys = xy.view(np.dtype((np.void, xy.itemsize * 2))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return xy[first, 0], xy[first, 1], inverse.ravel()
+
+
+def _gather(inverse, values, count):
+    """Mean of values per node, NaN for nodes without any."""
+    total = np.bincount(inverse, weights=values, minlength=count)
+    hits = np.bincount(inverse, minlength=count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(hits > 0, total / hits, np.nan)
+
+
+def align_stress_exports(exports):
+    """
+    Combine {field: ComsolExport} of the same mesh into StressNodes.
+    """
+    data = [exports[field].data for field in STRESS_FIELDS]
+    sizes = [len(d) for d in data]
+    x, y, inverse = node_index(np.concatenate([d[:, 0] for d in data]),
+                               np.concatenate([d[:, 1] for d in data]))
+    count = len(x)
+    # the displacements are in every export; average them over all of them
+    u = _gather(inverse, np.concatenate([d[:, 3] for d in data]), count)
+    v = _gather(inverse, np.concatenate([d[:, 4] for d in data]), count)
+    fields = {}
+    for field, d, rows in zip(STRESS_FIELDS, data, np.split(inverse, np.cumsum(sizes)[:-1])):
+        fields[field] = _gather(rows, d[:, 2], count)
+    return StressNodes(x, y, u, v, fields["sxx"], fields["sxy"], fields["syy"])
+
+
+def _source_stamps(paths):
+    return {path.name: [path.stat().st_size, path.stat().st_mtime_ns] for path in paths}
+
+
+def load_stress_nodes(folder, cache=True):
+    """
+    Read sxx.txt, sxy.txt and syy.txt from folder as aligned StressNodes.
+
+    Args:
+        folder: Folder with the exports
+        cache (bool): Read and write folder/stress_nodes.sir, rebuilt when an export changes
+
+    Returns:
+        StressNodes
+    """
+    folder = Path(folder)
+    paths = [folder / f"{field}.txt" for field in STRESS_FIELDS]
+    cache_path = folder / f"{CACHE_NAME}.sir"
+    stamps = _source_stamps(paths)
+    if cache and cache_path.exists():
+        arrays, attrs = load_dataset(cache_path)
+        if attrs.get("sources") == stamps:
+            return StressNodes(**arrays)
+
+    nodes = align_stress_exports({field: read_comsol_export(path) for field, path in zip(STRESS_FIELDS, paths)})
+    if cache:
+        save_dataset(cache_path, nodes._asdict(), {"sources": stamps})
+    return nodes
+
+
+def pixel_centres(shape, pixel_size, origin=(0.0, 0.0)):
+    """
+    Model coordinates of the pixel centres of an image.
+
+    Args:
+        shape (tuple): (H, W)
+        pixel_size (float): Pixel pitch on the sample, in model units
+        origin (tuple): (x, y) of the centre of the top-left pixel; rows go towards -y
+
+    Returns:
+        tuple: (x, y) arrays of shape (H, W)
+    """
+    rows, cols = np.mgrid[0:shape[0], 0:shape[1]]
+    return origin[0] + cols * pixel_size, origin[1] - rows * pixel_size
+
+
+class GridInterpolator:
+    """
+    Linear interpolation from scattered nodes onto fixed points, e.g. pixel_centres().
+
+    Args:
+        x, y: Node coordinates
+        grid_x, grid_y: Coordinates to interpolate at, any (matching) shape
+        max_edge (float, optional): Drop triangles with a longer edge, so concave parts
+            and holes of the model, which the Delaunay triangulation fills in, stay empty
+    """
+    def __init__(self, x, y, grid_x, grid_y, max_edge=None):
+        import matplotlib.tri as mtri
+
+        self.shape = np.shape(grid_x)
+        triangulation = mtri.Triangulation(x, y)
+        triangles = triangulation.triangles
+        if max_edge is not None:
+            corners_x, corners_y = triangulation.x[triangles], triangulation.y[triangles]
+            edges = np.hypot(corners_x - np.roll(corners_x, 1, axis=1), corners_y - np.roll(corners_y, 1, axis=1))
+            triangulation.set_mask(edges.max(axis=1) > max_edge)
+
+        px = np.asarray(grid_x, dtype=np.float64).ravel()
+        py = np.asarray(grid_y, dtype=np.float64).ravel()
+        found = triangulation.get_trifinder()(px, py)
+        self.inside = found >= 0
+        # nodes and barycentric weights of the triangle of each point inside the mesh
+        self.nodes = triangles[found[self.inside]].astype(np.int32)
+        x0, x1, x2 = (triangulation.x[self.nodes[:, k]] for k in range(3))
+        y0, y1, y2 = (triangulation.y[self.nodes[:, k]] for k in range(3))
+        qx, qy = px[self.inside], py[self.inside]
+        area = (y1 - y2) * (x0 - x2) + (x2 - x1) * (y0 - y2)
+        w0 = ((y1 - y2) * (qx - x2) + (x2 - x1) * (qy - y2)) / area
+        w1 = ((y2 - y0) * (qx - x2) + (x0 - x2) * (qy - y2)) / area
+        self.weights = np.column_stack([w0, w1, 1 - w0 - w1])
+
+    def __call__(self, values, fill_value=np.nan, dtype=np.float64):
+        """
+        Interpolate node values onto the grid; fill_value outside the mesh.
+        """
+        values = np.asarray(values, dtype=dtype)
+        out = np.full(self.inside.size, fill_value, dtype=dtype)
+        out[self.inside] = np.einsum("ij,ij->i", values[self.nodes], self.weights)
+        return out.reshape(self.shape)
+
+    @property
+    def mask(self):
+        """True for the grid points inside the mesh."""
+        return self.inside.reshape(self.shape)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from modules.polariscope_model import stress_to_optics
+
+    parser = argparse.ArgumentParser(description="Load COMSOL stress exports and resample them to pixels")
+    parser.add_argument("folder", nargs="?", default=str(Path(__file__).parent.parent / "COMSOL"))
+    parser.add_argument("--pixel-size", type=float, default=10e-6, help="Pixel pitch on the sample in m")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    nodes = load_stress_nodes(args.folder, cache=False)
+    t1 = time.perf_counter()
+    nodes = load_stress_nodes(args.folder)
+    t2 = time.perf_counter()
+    nodes = load_stress_nodes(args.folder)
+    t3 = time.perf_counter()
+    print(f"{len(nodes.x)} nodes: parsed and aligned in {t1 - t0:.2f} s, from the cache in {t3 - t2:.3f} s")
+
+    width = int(round((nodes.x.max() - nodes.x.min()) / args.pixel_size)) + 1
+    height = int(round((nodes.y.max() - nodes.y.min()) / args.pixel_size)) + 1
+    grid_x, grid_y = pixel_centres((height, width), args.pixel_size, (nodes.x.min(), nodes.y.max()))
+    t0 = time.perf_counter()
+    grid = GridInterpolator(nodes.x, nodes.y, grid_x, grid_y)
+    t1 = time.perf_counter()
+    sxx, sxy, syy = grid(nodes.sxx), grid(nodes.sxy), grid(nodes.syy)
+    t2 = time.perf_counter()
+    theta, delta = stress_to_optics(sxx, syy, sxy, fringe_value=7.0, thickness=5.0)
+    print(f"{height}x{width} grid: weights in {t1 - t0:.2f} s, three fields resampled in {t2 - t1:.3f} s, "
+          f"{grid.mask.mean():.0%} of pixels inside the mesh")
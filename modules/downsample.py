@@ -0,0 +1,114 @@
+import numpy as np
+
+DOWNSAMPLE_MODES = ("stride", "mean", "median", "circular_mean", "minmax")
+
+
+def stride_view(image, step=2):
+    """
+    Keep every step-th pixel along both axes.
+    Returns a view of the input array, no data is copied.
+    """
+    if step < 1:
+        raise ValueError("step must be at least 1")
+    return image[::step, ::step]
+
+
+def _blocks(image, block):
+    """
+    View an image as (h // block, block, w // block, block), dropping edge pixels
+    that don't fill a whole block.
+    """
+    if block < 1:
+        raise ValueError("block must be at least 1")
+    height = image.shape[0] // block * block
+    width = image.shape[1] // block * block
+    if height == 0 or width == 0:
+        raise ValueError(f"Image of shape {image.shape} is smaller than one {block}x{block} block")
+    trimmed = image[:height, :width]
+    return trimmed.reshape(height // block, block, width // block, block, *image.shape[2:])
+
+
+def block_mean(image, block=2):
+    """
+    Downsample by averaging non-overlapping block x block bins.
+    """
+    blocks = _blocks(image, block)
+    dtype = image.dtype if np.issubdtype(image.dtype, np.floating) else np.float64
+    return blocks.mean(axis=(1, 3), dtype=dtype)
+
+
+def block_median(image, block=2):
+    """
+    Downsample by taking the median of non-overlapping block x block bins.
+    """
+    blocks = _blocks(image, block)
+    n_rows, n_cols = blocks.shape[0], blocks.shape[2]
+    # bring the two in-block axes together so the median is over one axis
+    blocks = blocks.swapaxes(1, 2).reshape(n_rows, n_cols, block * block, *image.shape[2:])
+    return np.median(blocks, axis=2)
+
+
+def block_circular_mean(phase, block=2, period=2 * np.pi):
+    """
+    Downsample a wrapped phase map by the circular mean of each block x block bin.
+
+    The phase is mapped onto the unit circle (one turn per period), the sine and
+    cosine are averaged per bin and converted back, so bins straddling the wrap
+    boundary don't average to a value in between.
+
+    Args:
+        phase (numpy.ndarray): Wrapped phase map
+        block (int): Bin size in pixels
+        period (float): Period of the phase, e.g. ISOCLINIC_PERIOD for isoclinic maps
+
+    Returns:
+        numpy.ndarray: Downsampled phase in [-period/2, period/2]
+    """
+    dtype = phase.dtype if np.issubdtype(phase.dtype, np.floating) else np.float64
+    angle = np.asarray(phase, dtype=dtype) * (2 * np.pi / period)
+    mean_sin = block_mean(np.sin(angle), block)
+    mean_cos = block_mean(np.cos(angle), block)
+    return np.arctan2(mean_sin, mean_cos) * (period / (2 * np.pi))
+
+
+def block_extreme(image, block=2):
+    """
+    Min/max-preserving downsampling for display.
+
+    Each block x block bin is replaced by its minimum or its maximum, whichever is
+    further from the bin mean, so isolated hot and cold spots survive decimation
+    instead of being averaged away.
+    """
+    blocks = _blocks(image, block)
+    block_min = blocks.min(axis=(1, 3))
+    block_max = blocks.max(axis=(1, 3))
+    # max - mean > mean - min  <=>  max + min > 2 * mean
+    dtype = image.dtype if np.issubdtype(image.dtype, np.floating) else np.float64
+    twice_mean = 2 * blocks.mean(axis=(1, 3), dtype=dtype)
+    return np.where(block_max.astype(dtype) + block_min > twice_mean, block_max, block_min)
+
+
+def downsample(image, factor=2, mode="stride", period=2 * np.pi):
+    """
+    Downsample an image by an integer factor.
+
+    Args:
+        image (numpy.ndarray): 2D image or phase map
+        factor (int): Downsampling factor along both axes
+        mode (str): 'stride' (zero-copy view of every factor-th pixel), 'mean',
+                    'median', 'circular_mean' (for wrapped phase maps) or 'minmax'
+                    (see block_extreme)
+        period (float): Phase period, only used by 'circular_mean'
+    """
+    if mode == "stride":
+        return stride_view(image, factor)
+    elif mode == "mean":
+        return block_mean(image, factor)
+    elif mode == "median":
+        return block_median(image, factor)
+    elif mode == "circular_mean":
+        return block_circular_mean(image, factor, period=period)
+    elif mode == "minmax":
+        return block_extreme(image, factor)
+    else:
+        raise ValueError(f"Invalid mode: {mode}")
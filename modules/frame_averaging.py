@@ -0,0 +1,86 @@
+"""
+Average repeated frames of one phase step without keeping them.
+
+    accumulator = FrameAccumulator()
+    for _ in range(k):
+        accumulator.add(camera.capture())
+    mean, variance = accumulator.mean, accumulator.variance_of_mean()
+
+Welford's algorithm updates a float64 running mean and sum of squared deviations
+in place, so memory is three frame-sized float64 buffers (mean, M2 and one scratch
+buffer) however many frames are added, and the result does not suffer from the
+cancellation of the naive sum / sum-of-squares method on bright, low-noise pixels.
+"""
+import numpy as np
+
+
+class FrameAccumulator:
+    """
+    Running per-pixel mean and variance of equally shaped frames.
+
+    Args:
+        shape (tuple, optional): Frame shape; taken from the first frame if not given
+    """
+    def __init__(self, shape=None):
+        self.count = 0
+        self._mean = None
+        self._m2 = None
+        self._scratch = None
+        if shape is not None:
+            self._allocate(tuple(shape))
+
+    def _allocate(self, shape):
+        self._mean = np.zeros(shape, dtype=np.float64)
+        self._m2 = np.zeros(shape, dtype=np.float64)
+        self._scratch = np.empty(shape, dtype=np.float64)
+
+    @property
+    def shape(self):
+        return None if self._mean is None else self._mean.shape
+
+    def add(self, frame):
+        """Add one frame (any numeric dtype)."""
+        frame = np.asarray(frame)
+        if self._mean is None:
+            self._allocate(frame.shape)
+        elif frame.shape != self._mean.shape:
+            raise ValueError(f"Frame has shape {frame.shape}, expected {self._mean.shape}")
+        self.count += 1
+        n = self.count
+        # delta/n is added to the mean and M2 grows by (n-1)/n * delta**2 = n(n-1) * (delta/n)**2,
+        # all through the one scratch buffer
+        step = self._scratch
+        np.subtract(frame, self._mean, out=step)
+        step *= 1.0 / n
+        self._mean += step
+        np.square(step, out=step)
+        step *= n * (n - 1.0)
+        self._m2 += step
+
+    @property
+    def mean(self):
+        """Running mean; a view of the internal buffer, copy it before adding more frames."""
+        if self.count == 0:
+            raise ValueError("No frames added")
+        return self._mean
+
+    def variance(self, ddof=1):
+        """Per-pixel variance of the frames (sample variance for ddof=1)."""
+        if self.count <= ddof:
+            raise ValueError(f"Need more than {ddof} frames for the variance, have {self.count}")
+        return self._m2 / (self.count - ddof)
+
+    def variance_of_mean(self):
+        """Per-pixel variance of mean, i.e. the noise left after averaging."""
+        return self.variance() / self.count
+
+    def reset(self):
+        """Start a new average, keeping the buffers."""
+        self.count = 0
+        if self._mean is not None:
+            self._mean.fill(0)
+            self._m2.fill(0)
+
+    @property
+    def nbytes(self):
+        return 0 if self._mean is None else self._mean.nbytes + self._m2.nbytes + self._scratch.nbytes
@@ -1,9 +1,14 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 import numpy as np
 from PIL import Image
 import matplotlib.pyplot as plt
 import plotly.express as px
 import cv2
+from modules.downsample import downsample
+from modules.image_stats import color_range as color_range_of
+from modules.roi import ROI
 
 
 
@@ -23,24 +28,92 @@ def png_to_array(image_path, dtype=np.float32):
 
     # Convert to numpy array
     img_array = np.array(img)
-    img_array = img_array.astype(dtype)
+    img_array = img_array.astype(dtype, copy=False)
     return img_array
 
+def decode_image(source):
+    """
+    Decode an image file to a numpy array in its native dtype (e.g. uint16) with OpenCV.
+    Paths are memory-mapped rather than read into memory; file-like objects
+    (e.g. Streamlit uploads) are read from their buffer. Colour images are returned
+    in RGB(A) order, like png_to_array().
+    """
+    if hasattr(source, "getbuffer"):
+        buffer = np.frombuffer(source.getbuffer(), dtype=np.uint8)
+    elif hasattr(source, "read"):
+        position = source.tell()
+        buffer = np.frombuffer(source.read(), dtype=np.uint8)
+        source.seek(position)
+    else:
+        buffer = np.memmap(source, dtype=np.uint8, mode="r")
+    image = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError(f"Could not decode image {getattr(source, 'name', source)}")
+    if image.ndim == 3 and image.shape[2] == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    elif image.ndim == 3 and image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA)
+    return image
+
+def load_image_stack(sources, crop_box=None, dtype=np.float32, max_workers=None, out=None):
+    """
+    Decode several images of the same size (e.g. I1-I10) concurrently into one
+    preallocated (N, H, W) array.
+
+    Every frame is decoded in its native dtype and only the crop_box region of it is
+    converted into the output buffer, so no full-size float copy is ever made.
+    OpenCV releases the GIL while decoding, so threads decode in parallel.
+
+    Args:
+        sources (list): Paths or file-like objects, in stack order
+        crop_box (ROI or tuple, optional): (x0, y0, x1, y1) region to keep, clipped to the image
+        dtype: Output dtype, e.g. np.float32 or np.uint16 to keep the raw counts
+        max_workers (int, optional): Number of decoding threads, defaults to len(sources)
+        out (numpy.ndarray, optional): Preallocated output of the right shape and dtype
+
+    Returns:
+        numpy.ndarray: Array of shape (N, H, W) (or (N, H, W, C) for colour images)
+    """
+    sources = list(sources)
+    if not sources:
+        raise ValueError("No images to load")
+
+    roi = None if crop_box is None else ROI.from_bounding_box(crop_box)
+
+    def region(image):
+        if roi is None:
+            return image
+        return image[roi.slices(image.shape[:2])]
+
+    # decode the first frame here to learn the output shape
+    first = region(decode_image(sources[0]))
+    if out is None:
+        out = np.empty((len(sources),) + first.shape, dtype=dtype)
+    elif out.shape != (len(sources),) + first.shape:
+        raise ValueError(f"Output buffer has shape {out.shape}, expected {(len(sources),) + first.shape}")
+    np.copyto(out[0], first, casting="unsafe")
+    del first
+
+    def load_into(index):
+        frame = region(decode_image(sources[index]))
+        if frame.shape != out.shape[1:]:
+            raise ValueError(f"Image {index} has shape {frame.shape}, expected {out.shape[1:]}")
+        np.copyto(out[index], frame, casting="unsafe")
+
+    if len(sources) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers or len(sources) - 1) as executor:
+            # list() re-raises the first decoding error
+            list(executor.map(load_into, range(1, len(sources))))
+    return out
+
 def crop_image(img_array, crop_range_x, crop_range_y):
     """
     Crop an image array to a specified range. 
     If the crop range is out of bounds, it will be set to the nearest valid value.
+    The crop ranges are not modified and the result is a view of img_array.
     """
-    image_size = img_array.shape
-    if crop_range_x[0] < 0:
-        crop_range_x[0] = 0
-    if crop_range_x[1] > image_size[1]:
-        crop_range_x[1] = image_size[1]
-    if crop_range_y[0] < 0:
-        crop_range_y[0] = 0
-    if crop_range_y[1] > image_size[0]:
-        crop_range_y[1] = image_size[0]
-    return img_array[crop_range_y[0] : crop_range_y[1], crop_range_x[0] : crop_range_x[1]]
+    roi = ROI.from_ranges(crop_range_x, crop_range_y)
+    return img_array[roi.slices(img_array.shape[:2])]
 
 def save_array_to_png(img_array, filename, save_dir=None):
     """
@@ -105,9 +178,8 @@ def plot_image_colormap(
         img_array = np.mean(img_array, axis=2)
 
     if color_range is None:
-        # Calculate 5th and 95th percentiles for color range
-        vmin = np.percentile(img_array, 1)
-        vmax = np.percentile(img_array, 99)
+        # 1st and 99th percentiles, from one pass over the image
+        vmin, vmax = color_range_of(img_array, 1, 99)
     else:
         vmin = color_range[0]
         vmax = color_range[1]
@@ -137,8 +209,7 @@ def plot_image_plotly(
     """
 
     # Calculate 5th and 95th percentiles
-    vmin = np.percentile(img_array, z_range[0])
-    vmax = np.percentile(img_array, z_range[1])
+    vmin, vmax = color_range_of(img_array, *z_range)
 
     fig = px.imshow(
         img_array,
@@ -149,56 +220,140 @@ def plot_image_plotly(
     fig.update_layout(title=title)
     fig.show()
 
-def impute_bad_pixels(img_array, bad_pixels):
-    """
-    Impute bad pixels in an image array.
-    """
-    for pixel in bad_pixels:
-        x, y = pixel
-        # Get values of surrounding pixels in a 3x3 grid, excluding the center pixel
-        surrounding_values = []
-        for i in [-1, 0, 1]:
-            for j in [-1, 0, 1]:
-                # Skip the center pixel
-                if i == 0 and j == 0:
-                    continue
-                # Check bounds to avoid index errors
-                if 0 <= y + i < img_array.shape[0] and 0 <= x + j < img_array.shape[1]:
-                    surrounding_values.append(img_array[y + i, x + j])
-        # Calculate mean of surrounding pixels and assign to dead pixel
-        if surrounding_values:
-            img_array[y, x] = np.mean(surrounding_values)
-    return img_array
+# (dy, dx) offsets of the 8 neighbours in a 3x3 window
+_NEIGHBOUR_OFFSETS = np.array(
+    [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dy, dx) != (0, 0)]
+)
+
+
+def impute_bad_pixel_mask(img_array, bad_pixel_mask, method="mean", inplace=False):
+    """
+    Replace bad pixels with the mean or median of their 3x3 neighbours.
+
+    Neighbours that are themselves bad are ignored. If every neighbour of a pixel
+    is bad, all of its in-bounds neighbours are used instead.
+
+    Args:
+        img_array (numpy.ndarray): 2D image array
+        bad_pixel_mask (numpy.ndarray): Boolean array of the same shape, True for bad pixels
+        method (str): 'mean' or 'median'
+        inplace (bool): Repair img_array itself instead of a copy
+
+    Returns:
+        numpy.ndarray: Repaired image array
+    """
+    if method not in ("mean", "median"):
+        raise ValueError(f"Invalid method: {method}")
+    bad_pixel_mask = np.asarray(bad_pixel_mask, dtype=bool)
+    if bad_pixel_mask.shape != img_array.shape[:2]:
+        raise ValueError("Bad pixel mask must have the same shape as the image")
+
+    repaired = img_array if inplace else img_array.copy()
+    ys, xs = np.nonzero(bad_pixel_mask)
+    if ys.size == 0:
+        return repaired
+
+    height, width = bad_pixel_mask.shape
+    # (8, n_bad) neighbour coordinates
+    ny = ys[None, :] + _NEIGHBOUR_OFFSETS[:, 0, None]
+    nx = xs[None, :] + _NEIGHBOUR_OFFSETS[:, 1, None]
+    inside = (ny >= 0) & (ny < height) & (nx >= 0) & (nx < width)
+    np.clip(ny, 0, height - 1, out=ny)
+    np.clip(nx, 0, width - 1, out=nx)
+
+    valid = inside & ~bad_pixel_mask[ny, nx]
+    no_good_neighbours = ~valid.any(axis=0)
+    valid[:, no_good_neighbours] = inside[:, no_good_neighbours]
+
+    work_dtype = img_array.dtype if np.issubdtype(img_array.dtype, np.floating) else np.float64
+    values = img_array[ny, nx].astype(work_dtype)
+    counts = valid.sum(axis=0)
+    has_neighbours = counts > 0
+
+    if method == "mean":
+        values[~valid] = 0
+        replacement = values.sum(axis=0)[has_neighbours] / counts[has_neighbours]
+    else:
+        values[~valid] = np.nan
+        replacement = np.nanmedian(values[:, has_neighbours], axis=0)
+
+    repaired[ys[has_neighbours], xs[has_neighbours]] = replacement
+    return repaired
+
+
+def bad_pixel_coords_to_mask(bad_pixels, shape):
+    """
+    Convert a list of (x, y) tuples to a boolean mask of the given (height, width).
+    """
+    mask = np.zeros(shape[:2], dtype=bool)
+    if len(bad_pixels):
+        coords = np.asarray(bad_pixels, dtype=np.intp).reshape(-1, 2)
+        mask[coords[:, 1], coords[:, 0]] = True
+    return mask
+
+
+def bad_pixel_mask_to_coords(bad_pixel_mask):
+    """
+    Convert a boolean mask to a list of (x, y) tuples.
+    """
+    ys, xs = np.nonzero(bad_pixel_mask)
+    return list(zip(xs, ys))
+
+
+def impute_bad_pixels(img_array, bad_pixels, method="mean"):
+    """
+    Impute bad pixels in an image array, in place.
+    bad_pixels is a list of (x, y) tuples, see impute_bad_pixel_mask().
+    """
+    mask = bad_pixel_coords_to_mask(bad_pixels, img_array.shape)
+    return impute_bad_pixel_mask(img_array, mask, method=method, inplace=True)
+
+
+def find_dead_pixel_mask(img_array, threshold=100):
+    """
+    Boolean mask of dead pixels (below threshold) in an image array.
+    """
+    return img_array < threshold
+
+
+def find_bright_pixel_mask(img_array, threshold=20e3):
+    """
+    Boolean mask of bright pixels (above threshold) in an image array.
+    """
+    return img_array > threshold
+
+
+def find_bad_pixel_mask(img_array, lower_threshold=101, upper_threshold=20e3):
+    """
+    Boolean mask of bad pixels, either dim or bright, in an image array.
+    """
+    return (img_array < lower_threshold) | (img_array > upper_threshold)
+
 
 def find_dead_pixels(img_array, threshold=100):
     """
     Find dead pixels in an image array.
+    Returns a list of (x,y) tuples.
     """
-    dead_pixels = np.where(img_array < threshold)
-    # Convert array indices to list of (x,y) tuples
-    dead_pixel_coords = list(zip(dead_pixels[1], dead_pixels[0]))
-    # return dead_pixel_coords
-    return dead_pixel_coords
+    return bad_pixel_mask_to_coords(find_dead_pixel_mask(img_array, threshold))
+
 
 def find_bad_pixels(img_array, lower_threshold=101, upper_threshold=20e3):
     """
     Find bad pixels in an image array.
+    Returns a list of (x,y) tuples.
     """
-    dim_pixels = np.where(img_array < lower_threshold)
-    bright_pixels = np.where(img_array > upper_threshold)
-    bad_pixels = np.concatenate((dim_pixels, bright_pixels), axis=1)
-    bad_pixel_coords = list(zip(bad_pixels[1], bad_pixels[0]))
-    return bad_pixel_coords
+    return bad_pixel_mask_to_coords(
+        find_bad_pixel_mask(img_array, lower_threshold, upper_threshold)
+    )
 
 
 def find_bright_pixels(img_array, threshold=20e3):
     """
     Find bright pixels in an image array.
+    Returns a list of (x,y) tuples.
     """
-    bright_pixels = np.where(img_array > threshold)
-    # Convert array indices to list of (x,y) tuples
-    bright_pixel_coords = list(zip(bright_pixels[1], bright_pixels[0]))
-    return bright_pixel_coords
+    return bad_pixel_mask_to_coords(find_bright_pixel_mask(img_array, threshold))
 
 
 def cap_array(img_array, min_value, max_value):
@@ -221,17 +376,55 @@ def remove_low_value_pixels(img_array):
     img_array[img_array == 0] = 1.0
     return img_array
 
+def to_uint8(image):
+    """
+    Min-max normalise an image to the full uint8 range in a single pass.
+    """
+    if image.dtype == np.uint8:
+        return image
+    return cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+
 def canny_edge_method(image, threshold1=100, threshold2=300):
     # Convert to uint8 if needed
-    if image.dtype != np.uint8:
-        image = ((image - image.min()) / (image.max() - image.min()) * 255).astype(np.uint8)
+    image = to_uint8(image)
     
     # find the edges of the sensor
     edges = cv2.Canny(image, threshold1, threshold2)
     return edges
 
 
-def find_horizontal_edges(image, edge_threshold1=100, edge_threshold2=300, mean_threshold=1.0):
+def find_projection_peaks(strength, mean_threshold=1.0, min_separation=50, n_peaks=2):
+    """
+    Find the strongest local maxima of a 1D edge-strength projection.
+
+    Local maxima above mean(strength) * mean_threshold are candidates. Non-maximum
+    suppression then keeps the strongest candidate, drops every candidate closer
+    than min_separation to it, and repeats until n_peaks are kept.
+
+    Returns:
+        numpy.ndarray: Indices of the kept peaks in decreasing order of strength
+    """
+    strength = np.asarray(strength)
+    if strength.size < 3:
+        return np.array([], dtype=np.intp)
+    centre = strength[1:-1]
+    is_peak = (centre > strength[:-2]) & (centre > strength[2:])
+    is_peak &= centre > strength.mean() * mean_threshold
+    candidates = np.flatnonzero(is_peak) + 1
+
+    # strongest first; stable sort keeps the lower index first on ties
+    candidates = candidates[np.argsort(-strength[candidates], kind="stable")]
+    kept = []
+    while candidates.size and len(kept) < n_peaks:
+        peak = candidates[0]
+        kept.append(peak)
+        candidates = candidates[np.abs(candidates - peak) >= min_separation]
+    return np.array(kept, dtype=np.intp)
+
+
+def find_horizontal_edges(image, edge_threshold1=100, edge_threshold2=300, mean_threshold=1.0,
+                          edges=None, min_separation=50):
     """
     Find the most likely horizontal edges of a bright rectangle in an image.
     
@@ -239,41 +432,24 @@ def find_horizontal_edges(image, edge_threshold1=100, edge_threshold2=300, mean_
         image: Input image array
         threshold1: Lower threshold for Canny edge detection
         threshold2: Upper threshold for Canny edge detection
+        edges: Precomputed Canny edge map, so it isn't recomputed
     
     Returns:
         top_edge: Row index of the top edge
         bottom_edge: Row index of the bottom edge
     """
-    # Get edges using existing function
-    edges = canny_edge_method(image, edge_threshold1, edge_threshold2)
+    if edges is None:
+        edges = canny_edge_method(image, edge_threshold1, edge_threshold2)
     
     # Sum edges horizontally to find rows with strong horizontal edges
     horizontal_edge_strength = np.sum(edges, axis=1)
 
-    min_separation = 50
-    
-    # Find peaks in the horizontal edge strength
-    peaks = {}
-    for i, value in enumerate(horizontal_edge_strength):
-        if (value > horizontal_edge_strength[i-1] and 
-            value > horizontal_edge_strength[i+1] and
-            value > np.mean(horizontal_edge_strength) * mean_threshold):
-            peaks[i] = value
-    
-    filtered_peaks = {} # Remove peaks that are too close to each other
-    for peak in peaks.keys():
-        if not any(abs(peak - existing) < min_separation for existing in filtered_peaks):
-            filtered_peaks[peak] = peaks[peak]
-    
-    # Find the 2 largest peak values
-    sorted_peaks = dict(sorted(filtered_peaks.items(), key=lambda x: x[1], reverse=True))
-    top_peaks = {k: sorted_peaks[k] for k in list(sorted_peaks.keys())[:2]}
-
-    if len(top_peaks) < 2:
+    peaks = find_projection_peaks(horizontal_edge_strength, mean_threshold, min_separation)
+    if len(peaks) < 2:
         raise ValueError("Not enough peaks found")
     
-    top_edge = min(top_peaks.keys())
-    bottom_edge = max(top_peaks.keys())
+    top_edge = int(peaks.min())
+    bottom_edge = int(peaks.max())
     
     return top_edge, bottom_edge, horizontal_edge_strength
 
@@ -330,7 +506,8 @@ def find_horizontal_edges_robust(image, edge_threshold1=100, edge_threshold2=300
     
     return top_edge, bottom_edge, combined_strength
 
-def find_vertical_edges(image, edge_threshold1=100, edge_threshold2=300, mean_threshold=5.0):
+def find_vertical_edges(image, edge_threshold1=100, edge_threshold2=300, mean_threshold=5.0,
+                        edges=None, min_separation=200):
     """
     Find the most likely vertical edges of a bright rectangle in an image.
     
@@ -338,47 +515,56 @@ def find_vertical_edges(image, edge_threshold1=100, edge_threshold2=300, mean_th
         image: Input image array
         threshold1: Lower threshold for Canny edge detection
         threshold2: Upper threshold for Canny edge detection
+        edges: Precomputed Canny edge map, so it isn't recomputed
     
     Returns:
         left_edge: Column index of the left edge
         right_edge: Column index of the right edge
     """
-    # Get edges using existing function
-    edges = canny_edge_method(image, edge_threshold1, edge_threshold2)
+    if edges is None:
+        edges = canny_edge_method(image, edge_threshold1, edge_threshold2)
     # Sum edges vertically to find columns with strong vertical edges
     vertical_edge_strength = np.sum(edges, axis=0).astype(np.float32)
-    # Find peaks in the vertical edge strength
-    peaks = {}
-    for idx, value in enumerate(vertical_edge_strength):
-        if (value > vertical_edge_strength[idx-1] and 
-            value > vertical_edge_strength[idx+1] and
-            value > np.mean(vertical_edge_strength) * mean_threshold):
-            peaks[idx] = value
-
-    min_separation = 200
-    filtered_peaks = {}
-    for peak in peaks.keys():
-        if not any(abs(peak - existing) < min_separation for existing in filtered_peaks):
-            filtered_peaks[peak] = peaks[peak]
-
-    # Find the 2 largest peak values (top peaks)
-    sorted_peaks = dict(sorted(filtered_peaks.items(), key=lambda x: x[1], reverse=True))
-    top_peaks = {k: sorted_peaks[k] for k in list(sorted_peaks.keys())[:2]}
 
-    if len(top_peaks) < 2:
+    peaks = find_projection_peaks(vertical_edge_strength, mean_threshold, min_separation)
+    if len(peaks) < 2:
         raise ValueError("Not enough peaks found")
     
     # Return the left and right edges
-    left_edge = min(top_peaks.keys())
-    right_edge = max(top_peaks.keys())
+    left_edge = int(peaks.min())
+    right_edge = int(peaks.max())
     
     return left_edge, right_edge, vertical_edge_strength
 
 
+class SensorEdges(NamedTuple):
+    """
+    Result of find_sensor_edges(). Unpacks like the plain tuple it replaces.
+    """
+    top_edge: int
+    bottom_edge: int
+    left_edge: int
+    right_edge: int
+    canny_edges: np.ndarray
+    horizontal_edge_strength: np.ndarray
+    vertical_edge_strength: np.ndarray
+
+    @property
+    def bounding_box(self):
+        """(x0, y0, x1, y1) of the detected sensor."""
+        return self.left_edge, self.top_edge, self.right_edge, self.bottom_edge
+
+
 def find_sensor_edges(image_path, 
                       edge_threshold1=50, 
                       edge_threshold2=100, 
-                      mean_threshold=6.0):
+                      mean_threshold=6.0) -> SensorEdges:
+    """
+    Detect the edges of the bright sensor rectangle in an image.
+
+    The Canny edge map is computed once and its row and column projections are
+    searched for the two strongest peaks each.
+    """
     
     if isinstance(image_path, str):
         image = png_to_array(image_path)
@@ -388,17 +574,16 @@ def find_sensor_edges(image_path,
         raise ValueError("Image path must be a string or a numpy array")
     
     canny_edges = canny_edge_method(image, threshold1=edge_threshold1, threshold2=edge_threshold2)
-    # Find both horizontal and vertical edges
+    # Find both horizontal and vertical edges from the same edge map
     top_edge, bottom_edge, horizontal_edge_strength = find_horizontal_edges(image, 
-                                                  edge_threshold1=edge_threshold1, 
-                                                  edge_threshold2=edge_threshold2, 
-                                                  mean_threshold=mean_threshold)
+                                                  mean_threshold=mean_threshold,
+                                                  edges=canny_edges)
     left_edge, right_edge, vertical_edge_strength = find_vertical_edges(image, 
-                                                edge_threshold1=edge_threshold1, 
-                                                edge_threshold2=edge_threshold2, 
-                                                mean_threshold=mean_threshold)
+                                                mean_threshold=mean_threshold,
+                                                edges=canny_edges)
 
-    return top_edge, bottom_edge, left_edge, right_edge, canny_edges, horizontal_edge_strength, vertical_edge_strength
+    return SensorEdges(top_edge, bottom_edge, left_edge, right_edge,
+                       canny_edges, horizontal_edge_strength, vertical_edge_strength)
 
 def plot_edge_detection_pipeline(image_path, top_edge, bottom_edge, left_edge, right_edge, 
                                  canny_edges, horizontal_edge_strength, vertical_edge_strength, mean_threshold,
@@ -480,11 +665,12 @@ if __name__ == "__main__":
     edge_threshold2 = 100
     mean_threshold = 6.0
 
-    top_edge, bottom_edge, left_edge, right_edge, fig = find_sensor_edges(image_path, 
-                                                                          edge_threshold1=edge_threshold1, 
-                                                                          edge_threshold2=edge_threshold2, 
-                                                                          mean_threshold=mean_threshold,
-                                                                          plot=True)
+    sensor_edges = find_sensor_edges(image_path, 
+                                     edge_threshold1=edge_threshold1, 
+                                     edge_threshold2=edge_threshold2, 
+                                     mean_threshold=mean_threshold)
+    fig = plot_edge_detection_pipeline(image_path, *sensor_edges, mean_threshold,
+                                       top_margin=0, bottom_margin=0, left_margin=0, right_margin=0)
 
     plt.tight_layout()
     plt.show()
@@ -518,9 +704,11 @@ def compress_image_with_gaussian(input_image, kernel_size=5, sigma=1.0, jpeg_qua
 
     return resized_image
 
-def compress_image(input_image, skip_points=2):
+def compress_image(input_image, skip_points=2, mode="stride", period=2 * np.pi):
     """
-    Compress an image by skipping every nth pixel.
+    Compress an image by keeping every nth pixel (mode='stride', a zero-copy view),
+    or by binning n x n blocks with mode='mean', 'median' or 'circular_mean'.
+    See modules.downsample.downsample().
     """
     if isinstance(input_image, str):
         image = cv2.imread(input_image)
@@ -528,18 +716,5 @@ def compress_image(input_image, skip_points=2):
         image = input_image
     else:
         raise ValueError("Input image must be a string or a numpy array")
-    
-    # Get image dimensions
-    height, width = image.shape[:2]
-    
-    # Create a new image with skipped pixels
-    compressed_image = np.zeros((height // skip_points+1, width // skip_points+1))
-    
-    # Copy every nth pixel
-    for i in range(height):
-        for j in range(width):
-            if i % skip_points == 0 and j % skip_points == 0:
-                compressed_image[i // skip_points, j // skip_points] = image[i, j]
-    
-    return compressed_image
 
+    return downsample(image, factor=skip_points, mode=mode, period=period)
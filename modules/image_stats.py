@@ -0,0 +1,186 @@
+"""
+Single-pass statistics of images for colour ranges, histograms and summaries.
+
+image_stats() reads an image once, a block of rows at a time, and keeps only:
+
+    count, mean and M2 (sum of squared deviations), merged chunk by chunk
+    (Chan et al.), so the variance is stable for large offsets like raw counts
+    minimum and maximum
+    a histogram of fixed size whose bins double in width (merging neighbouring
+    pairs) whenever a chunk falls outside the range covered so far
+
+so no flattened copy or full-image temporary is made, whatever the image size.
+Percentiles are read off the cumulative histogram, to within one bin width
+(range / DEFAULT_BINS at worst, 2 range / DEFAULT_BINS after the bins double),
+instead of partitioning the whole image for each one. Plots get the bin counts,
+re-binned onto the requested bins, rather than every pixel.
+
+    stats = image_stats(frame, mask=valid_mask)
+    vmin, vmax = stats.percentile([1, 99])
+    counts, edges = stats.histogram(bins=256)
+"""
+from typing import NamedTuple
+import numpy as np
+
+DEFAULT_BINS = 4096     # resolution of the running histogram
+CHUNK_ROWS = 256
+
+
+class ImageStats(NamedTuple):
+    count: int
+    mean: float
+    variance: float       # population variance
+    minimum: float
+    maximum: float
+    counts: np.ndarray    # running histogram, DEFAULT_BINS int64 counts
+    edges: np.ndarray     # its bin edges
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+    def percentile(self, q):
+        """
+        Approximate percentiles (0-100), exact at 0 and 100, linear within a bin.
+        NaN for an image without valid pixels.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        target = q / 100 * self.count
+        # the bin holding the target rank, then linear within it
+        i = np.clip(np.searchsorted(cumulative, target, side="left"), 1, self.counts.size)
+        in_bin = cumulative[i] - cumulative[i - 1]
+        fraction = np.where(in_bin > 0, (target - cumulative[i - 1]) / np.maximum(in_bin, 1), 0.0)
+        values = self.edges[i - 1] + np.clip(fraction, 0, 1) * (self.edges[i] - self.edges[i - 1])
+        values = np.clip(values, self.minimum, self.maximum)
+        values = np.where(q <= 0, self.minimum, np.where(q >= 100, self.maximum, values))
+        return values[()]
+
+    def histogram(self, bins=256, value_range=None):
+        """
+        Counts in bins equal bins over value_range (default minimum..maximum),
+        re-binned from the running histogram; fractional where the bins do not line up.
+
+        Returns:
+            tuple: (counts, edges)
+        """
+        low, high = (self.minimum, self.maximum) if value_range is None else value_range
+        if not high > low:
+            high = low + 1.0
+        edges = np.linspace(low, high, bins + 1)
+        cumulative = np.interp(edges, self.edges, np.concatenate([[0], np.cumsum(self.counts)]))
+        # every value in range is counted, also where minimum and maximum fall inside a bin
+        if low <= self.minimum:
+            cumulative[0] = 0
+        if high >= self.maximum:
+            cumulative[-1] = self.count
+        return np.diff(cumulative), edges
+
+
+class _RunningStats:
+    def __init__(self, bins=DEFAULT_BINS):
+        if bins < 2 or bins % 2:
+            raise ValueError(f"bins must be an even number of at least 2, got {bins}")
+        self.bins = bins
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.low = None
+        self.width = None
+
+    def add(self, values):
+        """Add a 1D float64 array of finite values."""
+        n = values.size
+        if n == 0:
+            return
+        low, high = float(values.min()), float(values.max())
+        chunk_mean = float(values.mean())
+        deviation = values - chunk_mean
+        chunk_m2 = float(np.dot(deviation, deviation))
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.minimum, self.maximum = min(self.minimum, low), max(self.maximum, high)
+
+        self._cover(low, high)
+        # deviation is reused as the bin index buffer
+        np.subtract(values, self.low, out=deviation)
+        deviation /= self.width
+        index = deviation.astype(np.intp)
+        np.clip(index, 0, self.bins - 1, out=index)
+        self.counts += np.bincount(index, minlength=self.bins)
+
+    def _cover(self, low, high):
+        if self.width is None:
+            self.low = low
+            # a constant first chunk still needs a bin width > 0
+            self.width = max(high - low, abs(low) * 1e-6, 1e-12) / self.bins
+            return
+        half = self.bins // 2
+        while high >= self.low + self.bins * self.width or low < self.low:
+            merged = self.counts.reshape(half, 2).sum(axis=1)
+            self.counts[:] = 0
+            if high >= self.low + self.bins * self.width:
+                self.counts[:half] = merged   # the range grows upwards
+            else:
+                self.counts[half:] = merged   # the range grows downwards
+                self.low -= self.bins * self.width
+            self.width *= 2
+
+    def result(self):
+        if self.width is None:
+            return ImageStats(0, np.nan, np.nan, np.nan, np.nan, self.counts, np.linspace(0.0, 1.0, self.bins + 1))
+        edges = self.low + self.width * np.arange(self.bins + 1)
+        return ImageStats(self.count, self.mean, self.m2 / self.count, self.minimum, self.maximum,
+                          self.counts, edges)
+
+
+def image_stats(image, mask=None, bins=DEFAULT_BINS, chunk_rows=CHUNK_ROWS):
+    """
+    Count, mean, variance, minimum, maximum and a histogram of an image in one pass.
+
+    Args:
+        image (numpy.ndarray): 2D image, or (N, H, W) stack; NaN and inf are left out
+        mask (numpy.ndarray, optional): (H, W) boolean, True for the pixels to include
+        bins (int): Resolution of the running histogram
+        chunk_rows (int): Rows read at a time, bounds the float64 working memory
+
+    Returns:
+        ImageStats
+    """
+    image = np.asarray(image)
+    if image.ndim == 2:
+        image = image[None]
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != image.shape[-2:]:
+            raise ValueError(f"mask has shape {mask.shape}, expected {image.shape[-2:]}")
+    check_finite = np.issubdtype(image.dtype, np.floating)
+    running = _RunningStats(bins)
+    for frame in image:
+        for r0 in range(0, frame.shape[0], chunk_rows):
+            chunk = frame[r0:r0 + chunk_rows]
+            values = chunk[mask[r0:r0 + chunk_rows]] if mask is not None else chunk.ravel()
+            values = values.astype(np.float64, copy=False)
+            if check_finite:
+                finite = np.isfinite(values)
+                if not finite.all():
+                    values = values[finite]
+            running.add(values)
+    return running.result()
+
+
+def color_range(image, low=0.0, high=100.0, mask=None):
+    """
+    (vmin, vmax) colour range of an image at the low and high percentiles, as
+    floats; the exact minimum and maximum by default.
+    """
+    vmin, vmax = image_stats(image, mask=mask).percentile([low, high])
+    return float(vmin), float(vmax)
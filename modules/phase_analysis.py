@@ -1,9 +1,27 @@
 import numpy as np
-from modules.image_process import png_to_array
+import cv2
+from modules.image_process import load_image_stack
 from pathlib import Path
 import matplotlib.pyplot as plt
 # import plotly.express as px
 
+# Period of the wrapped phase maps. The 0.25 factor in isoclinic_phase() maps the
+# arctan2 range (-pi, pi] onto (-pi/4, pi/4], so the isoclinic map wraps every pi/2.
+ISOCLINIC_PERIOD = np.pi / 2
+ISOCHROMATIC_PERIOD = 2 * np.pi
+
+def phase_periods(method='arctan2'):
+    """
+    (isoclinic, isochromatic) wrap periods of the maps of a phase method. arctan
+    only covers half the range of arctan2, so its maps wrap twice as often.
+    """
+    if method == 'arctan2':
+        return ISOCLINIC_PERIOD, ISOCHROMATIC_PERIOD
+    elif method == 'arctan':
+        return ISOCLINIC_PERIOD / 2, ISOCHROMATIC_PERIOD / 2
+    else:
+        raise ValueError(f"Invalid method: {method}")
+
 def isoclinic_phase(I1, I2, I3, I4, method='arctan2'):
     """
     Calculate the phase of the isoclinic state.
@@ -28,19 +46,252 @@ def isochromatic_phase(iso_phase, I5, I6, I7, I8, I9, I10, method='arctan2'):
     else:
         raise ValueError(f"Invalid method: {method}")
 
+def fringe_modulation(iso_phase, I5, I6, I7, I8, I9, I10):
+    """
+    Amplitude of the isochromatic fringe signal, the length of the vector whose angle
+    isochromatic_phase() takes. It is the light modulated by the sample whatever the
+    retardation, so it is low outside the specimen and below the noise floor, where
+    the phase maps are meaningless.
+    """
+    numerator = (I9-I7)*np.sin(2*iso_phase) + (I8-I10)*np.cos(2*iso_phase)
+    return np.hypot(numerator, I5-I6)
+
+def modulation_mask(modulation, threshold=None, fraction=0.1, min_size=3):
+    """
+    Validity mask of a modulation map.
+
+    Args:
+        modulation (numpy.ndarray): From fringe_modulation() or PhaseStepEngine.compute_modulation()
+        threshold (float, optional): Lowest valid modulation, in counts. Defaults to
+            fraction of the 99th percentile, i.e. of the well lit part of the specimen
+        fraction (float): See threshold
+        min_size (int): Side of the square opening that removes valid specks and
+            one-pixel bridges smaller than it; 1 to keep them
+
+    Returns:
+        numpy.ndarray: Boolean, True for valid pixels
+    """
+    if threshold is None:
+        threshold = fraction * np.percentile(modulation[::4, ::4], 99)
+    mask = modulation > threshold
+    if min_size > 1:
+        kernel = np.ones((min_size, min_size), dtype=np.uint8)
+        mask = cv2.morphologyEx(mask.view(np.uint8), cv2.MORPH_OPEN, kernel).view(bool)
+    return mask
+
+def _arctan2_variance(numerator, denominator, numerator_variance, denominator_variance):
+    # first order propagation through arctan2(n, d): (d^2 var_n + n^2 var_d) / (n^2 + d^2)^2;
+    # infinite where there is no modulation at all
+    modulation = numerator**2 + denominator**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (denominator**2 * numerator_variance + numerator**2 * denominator_variance) / modulation**2
+    return np.where(modulation > 0, variance, np.inf)
+
+def phase_variance(stack, variance, iso_phase=None):
+    """
+    Per-pixel variance of the isoclinic and isochromatic phases, propagated from the
+    per-pixel variance of each image, e.g. FrameAccumulator.variance_of_mean().
+
+    Args:
+        stack (numpy.ndarray): (10, H, W) images I1-I10
+        variance (numpy.ndarray): (10, H, W) variance of each image
+        iso_phase (numpy.ndarray, optional): Isoclinic phase, computed from stack if not given
+
+    Returns:
+        tuple: (isoclinic variance, isochromatic variance) in rad^2; the isochromatic
+               variance treats the isoclinic phase as exact
+    """
+    I1, I2, I3, I4, I5, I6, I7, I8, I9, I10 = stack
+    V1, V2, V3, V4, V5, V6, V7, V8, V9, V10 = variance
+    if iso_phase is None:
+        iso_phase = isoclinic_phase(I1, I2, I3, I4)
+    # the 0.25 factor of the isoclinic phase scales its variance by 1/16
+    iso_variance = _arctan2_variance(I3 - I2, I4 - I1, V3 + V2, V4 + V1) / 16
+    sin2, cos2 = np.sin(2 * iso_phase), np.cos(2 * iso_phase)
+    isochrom_variance = _arctan2_variance((I9 - I7) * sin2 + (I8 - I10) * cos2, I5 - I6,
+                                          (V9 + V7) * sin2**2 + (V8 + V10) * cos2**2, V5 + V6)
+    return iso_variance, isochrom_variance
+
+def variance_quality(phase_variance):
+    """
+    Quality map for unwrap_quality_guided(quality=...): the inverse standard
+    deviation of the phase, so the least noisy pixels are unwrapped first.
+    """
+    return 1.0 / np.sqrt(phase_variance + 1e-12)
+
+
+class PhaseStepEngine:
+    """
+    Fused isoclinic + isochromatic phase calculation for a stacked (10, H, W) array of I1-I10.
+
+    The stack is processed in blocks of rows so that all intermediate values
+    (differences, sin/cos of the isoclinic angle, numerator) live in small scratch
+    buffers of shape (tile_rows, W) instead of full-frame temporaries. Results are
+    identical to calling isoclinic_phase() followed by isochromatic_phase().
+
+    Args:
+        method (str): 'arctan2' or 'arctan', same meaning as in isoclinic_phase()
+        tile_rows (int): Number of image rows processed per block
+        dtype: Floating point type of the output maps and scratch buffers
+    """
+
+    def __init__(self, method='arctan2', tile_rows=64, dtype=np.float32):
+        if method not in ('arctan2', 'arctan'):
+            raise ValueError(f"Invalid method: {method}")
+        if tile_rows < 1:
+            raise ValueError("tile_rows must be at least 1")
+        self.method = method
+        self.tile_rows = int(tile_rows)
+        self.dtype = np.dtype(dtype)
+        self._scratch = None
+
+    def allocate(self, image_shape):
+        """
+        Allocate output buffers for images of shape (H, W).
+
+        Returns:
+            tuple: (iso_phase, isochrom_phase) empty arrays that can be passed to compute()
+        """
+        iso_phase = np.empty(image_shape, dtype=self.dtype)
+        isochrom_phase = np.empty(image_shape, dtype=self.dtype)
+        return iso_phase, isochrom_phase
+
+    def _get_scratch(self, width):
+        shape = (4, self.tile_rows, width)
+        if self._scratch is None or self._scratch.shape != shape:
+            self._scratch = np.empty(shape, dtype=self.dtype)
+        return self._scratch
+
+    def compute(self, stack, out=None):
+        """
+        Calculate both phase maps from a stack of the ten phase-stepped images.
+
+        Args:
+            stack (numpy.ndarray): Array of shape (10, H, W) ordered I1..I10
+            out (tuple, optional): (iso_phase, isochrom_phase) buffers of shape (H, W),
+                                   e.g. from allocate(). Reused between datasets.
+
+        Returns:
+            tuple: (iso_phase, isochrom_phase)
+        """
+        if stack.ndim != 3 or stack.shape[0] != 10:
+            raise ValueError(f"Expected a stack of shape (10, H, W), got {stack.shape}")
+        iso_out, isochrom_out = self._outputs(stack, out)
+
+        scratch = self._get_scratch(stack.shape[2])
+        for r0, r1 in self._tiles(stack.shape[1]):
+            tile_scratch = scratch[:, : r1 - r0]
+            self._isoclinic_tile(stack[:4, r0:r1], iso_out[r0:r1], tile_scratch)
+            self._isochromatic_tile(stack[4:, r0:r1], iso_out[r0:r1], isochrom_out[r0:r1], tile_scratch)
+        return iso_out, isochrom_out
+
+    def compute_isoclinic(self, stack, out=None):
+        """
+        Isoclinic phase alone, from I1-I4. stack may hold just those four images
+        or all ten, so it can run before I5-I10 have been taken.
+        """
+        if stack.ndim != 3 or stack.shape[0] not in (4, 10):
+            raise ValueError(f"Expected a stack of shape (4, H, W) or (10, H, W), got {stack.shape}")
+        iso_out = np.empty(stack.shape[1:], dtype=self.dtype) if out is None else out
+        scratch = self._get_scratch(stack.shape[2])
+        for r0, r1 in self._tiles(stack.shape[1]):
+            self._isoclinic_tile(stack[:4, r0:r1], iso_out[r0:r1], scratch[:, : r1 - r0])
+        return iso_out
+
+    def compute_isochromatic(self, stack, iso_phase, out=None):
+        """
+        Isochromatic phase from I5-I10 and an isoclinic phase from compute_isoclinic().
+        stack may hold just I5-I10 or all ten images.
+        """
+        if stack.ndim != 3 or stack.shape[0] not in (6, 10):
+            raise ValueError(f"Expected a stack of shape (6, H, W) or (10, H, W), got {stack.shape}")
+        isochrom_out = np.empty(stack.shape[1:], dtype=self.dtype) if out is None else out
+        scratch = self._get_scratch(stack.shape[2])
+        for r0, r1 in self._tiles(stack.shape[1]):
+            self._isochromatic_tile(stack[-6:, r0:r1], iso_phase[r0:r1], isochrom_out[r0:r1],
+                                    scratch[:, : r1 - r0])
+        return isochrom_out
+
+    def compute_modulation(self, stack, iso_phase, out=None):
+        """
+        fringe_modulation() from I5-I10 and the isoclinic phase, in the same tiles.
+        stack may hold just I5-I10 or all ten images. iso_phase must be the arctan2
+        isoclinic phase: the arctan one is off by multiples of pi/4 (and NaN where
+        I4 == I1), which mixes up the two components of the fringe signal.
+        """
+        if stack.ndim != 3 or stack.shape[0] not in (6, 10):
+            raise ValueError(f"Expected a stack of shape (6, H, W) or (10, H, W), got {stack.shape}")
+        modulation_out = np.empty(stack.shape[1:], dtype=self.dtype) if out is None else out
+        scratch = self._get_scratch(stack.shape[2])
+        for r0, r1 in self._tiles(stack.shape[1]):
+            tile, tile_scratch = stack[-6:, r0:r1], scratch[:, : r1 - r0]
+            self._numerator_tile(tile, iso_phase[r0:r1], tile_scratch)
+            np.subtract(tile[0], tile[1], out=tile_scratch[1], dtype=self.dtype)
+            np.hypot(tile_scratch[0], tile_scratch[1], out=modulation_out[r0:r1])
+        return modulation_out
+
+    def _outputs(self, stack, out):
+        height, width = stack.shape[1:]
+        if out is None:
+            out = self.allocate((height, width))
+        iso_out, isochrom_out = out
+        if iso_out.shape != (height, width) or isochrom_out.shape != (height, width):
+            raise ValueError("Output buffers must have the same shape as the images")
+        return iso_out, isochrom_out
+
+    def _tiles(self, height):
+        for r0 in range(0, height, self.tile_rows):
+            yield r0, min(r0 + self.tile_rows, height)
+
+    def _isoclinic_tile(self, tile, iso, scratch):
+        I1, I2, I3, I4 = tile
+        a, b = scratch[0], scratch[1]
+        dtype = self.dtype
+
+        # isoclinic: 0.25 * arctan2(I3 - I2, I4 - I1)
+        np.subtract(I3, I2, out=a, dtype=dtype)
+        np.subtract(I4, I1, out=b, dtype=dtype)
+        if self.method == 'arctan2':
+            np.arctan2(a, b, out=iso)
+        else:
+            np.divide(a, b, out=iso)
+            np.arctan(iso, out=iso)
+        np.multiply(iso, 0.25, out=iso)
+
+    def _numerator_tile(self, tile, iso, scratch):
+        I5, I6, I7, I8, I9, I10 = tile
+        a, b, c, d = scratch
+        dtype = self.dtype
+
+        # isochromatic numerator, into a: (I9 - I7) * sin(2 iso) + (I8 - I10) * cos(2 iso)
+        np.multiply(iso, 2, out=c)
+        np.cos(c, out=d)
+        np.sin(c, out=c)
+        np.subtract(I9, I7, out=a, dtype=dtype)
+        np.multiply(a, c, out=a)
+        np.subtract(I8, I10, out=b, dtype=dtype)
+        np.multiply(b, d, out=b)
+        np.add(a, b, out=a)
+
+    def _isochromatic_tile(self, tile, iso, isochrom, scratch):
+        I5, I6 = tile[:2]
+        a, b = scratch[0], scratch[1]
+        self._numerator_tile(tile, iso, scratch)
+
+        # isochromatic denominator: I5 - I6
+        np.subtract(I5, I6, out=b, dtype=self.dtype)
+        if self.method == 'arctan2':
+            np.arctan2(a, b, out=isochrom)
+        else:
+            np.divide(a, b, out=isochrom)
+            np.arctan(isochrom, out=isochrom)
 
 if __name__ == "__main__":
+    from modules.phase_unwrap import unwrap_phase
+
     folder = Path('R:/Pockels_data/STRESS IMAGING/Polariscope-Test')
-    I1 = png_to_array(folder / 'I1.png')
-    I2 = png_to_array(folder / 'I2.png')
-    I3 = png_to_array(folder / 'I3.png')
-    I4 = png_to_array(folder / 'I4.png')
-    I5 = png_to_array(folder / 'I5.png')
-    I6 = png_to_array(folder / 'I6.png')
-    I7 = png_to_array(folder / 'I7.png')
-    I8 = png_to_array(folder / 'I8.png')
-    I9 = png_to_array(folder / 'I9.png')
-    I10 = png_to_array(folder / 'I10.png')
+    stack = load_image_stack([folder / f'I{i}.png' for i in range(1, 11)])
+    I1, I2, I3, I4, I5, I6, I7, I8, I9, I10 = stack
 
 
     # phase1 = isoclinic_phase(I1, I2, I3, I4, method='arctan')
@@ -48,12 +299,10 @@ if __name__ == "__main__":
     # phase1_unwrap = np.unwrap(phase1_unwrap, axis=1)
 
     phase2 = isoclinic_phase(I1, I2, I3, I4, method='arctan2')
-    phase2_unwrap = np.unwrap(phase2, axis=0, period=np.pi)
-    phase2_unwrap = np.unwrap(phase2_unwrap, axis=1, period=np.pi)
+    phase2_unwrap = unwrap_phase(phase2, method='quality_guided', period=ISOCLINIC_PERIOD).unwrapped
 
     delta = isochromatic_phase(phase2, I5, I6, I7, I8, I9, I10, method='arctan2')
-    delta_unwrap = np.unwrap(delta, axis=0)
-    delta_unwrap = np.unwrap(delta_unwrap, axis=1)
+    delta_unwrap = unwrap_phase(delta, method='quality_guided', period=ISOCHROMATIC_PERIOD).unwrapped
 
     fig, axs = plt.subplots(2, 2, figsize=(10, 10))
 
@@ -0,0 +1,156 @@
+"""
+Denoising filters for wrapped phase maps.
+
+Blurring the phase values directly is wrong wherever the map wraps: a pixel at
++period/2 next to one at -period/2 averages to 0 instead of staying at the wrap.
+These filters map the phase onto the unit circle (one turn per period), smooth the
+sine and cosine and convert back:
+
+    filtered = atan2(smooth(w sin a), smooth(w cos a)) * period / 2pi,  a = 2pi phase / period
+
+with optional per-pixel weights w (e.g. a modulation map, so dark pixels do not pull
+their neighbours) and a mask (w = 0 outside it). The smoothing is a running-sum box
+filter (cv2.boxFilter), O(1) per pixel whatever the size; 'gaussian' is three box
+passes. The length of the smoothed vector over the summed weights is the phase
+coherence in [0, 1], a reliability map for unwrap_quality_guided(quality=...).
+
+'median' is a windowed circular median: the median of the neighbours' phase
+differences to the local circular mean, added back to that mean. It costs
+size**2 per pixel and is meant for small windows against impulsive noise.
+
+    filtered = filter_phase(iso_phase, ISOCLINIC_PERIOD, method="gaussian", size=2.0)
+    unwrapped = unwrap_phase(filtered.phase, period=ISOCLINIC_PERIOD, quality=filtered.coherence)
+"""
+import warnings
+from typing import NamedTuple
+import numpy as np
+import cv2
+from numpy.lib.stride_tricks import sliding_window_view
+
+FILTER_METHODS = ("box", "gaussian", "median")
+BOX_PASSES = 3  # box passes that approximate one Gaussian
+
+
+class FilteredPhase(NamedTuple):
+    phase: np.ndarray       # filtered wrapped phase, in [-period/2, period/2]
+    coherence: np.ndarray   # |weighted mean unit vector| in [0, 1], 0 outside the mask
+
+
+def box_sum(image, size):
+    """
+    Sum over a size x size window around every pixel (size odd), zero outside the
+    image, with running sums so the cost does not depend on size.
+    """
+    if size < 1 or size % 2 == 0:
+        raise ValueError(f"size must be a positive odd number, got {size}")
+    return cv2.boxFilter(image, -1, (size, size), normalize=False, borderType=cv2.BORDER_CONSTANT)
+
+
+def gaussian_box_sizes(sigma, passes=BOX_PASSES):
+    """
+    Odd box sizes whose repeated application approximates a Gaussian of sigma
+    (Wells, 1986): the variances of the boxes add up to sigma**2.
+    """
+    ideal = np.sqrt(12 * sigma ** 2 / passes + 1)
+    lower = int(np.floor(ideal))
+    if lower % 2 == 0:
+        lower -= 1
+    lower = max(lower, 1)
+    upper = lower + 2
+    # number of passes with the smaller box so the total variance matches best
+    n_lower = round((12 * sigma ** 2 - passes * lower ** 2 - 4 * passes * lower - 3 * passes) / (-4 * lower - 4))
+    n_lower = min(max(n_lower, 0), passes)
+    return [lower] * n_lower + [upper] * (passes - n_lower)
+
+
+def _smooth(image, method, size):
+    if method == "box":
+        return box_sum(image, size)
+    for box in gaussian_box_sizes(size):
+        image = box_sum(image, box)
+    return image
+
+
+def filter_phase(phase, period=2 * np.pi, method="gaussian", size=3, weights=None, mask=None):
+    """
+    Smooth a wrapped phase map on the unit circle.
+
+    Args:
+        phase (numpy.ndarray): Wrapped phase map
+        period (float): Wrap period of the map, from phase_periods() of its phase method
+        method (str): One of FILTER_METHODS
+        size: Window size in pixels for 'box' and 'median' (odd), sigma for 'gaussian'
+        weights (numpy.ndarray, optional): Per-pixel weights >= 0, e.g. the modulation
+        mask (numpy.ndarray, optional): True for valid pixels; the others neither
+            contribute nor change. NaN and inf pixels are always treated as invalid
+
+    Returns:
+        FilteredPhase
+    """
+    if method not in FILTER_METHODS:
+        raise ValueError(f"Invalid method: {method}")
+    phase = np.asarray(phase)
+    dtype = phase.dtype if phase.dtype in (np.float32, np.float64) else np.dtype(np.float32)
+    to_angle = 2 * np.pi / period
+    angle = phase.astype(dtype) * dtype.type(to_angle)
+    finite = np.isfinite(angle)
+    if not finite.all():
+        # e.g. the NaN of the arctan method where the denominator is 0
+        mask = finite if mask is None else np.asarray(mask, dtype=bool) & finite
+        angle[~finite] = 0
+
+    weight = np.ones(phase.shape, dtype=dtype) if weights is None else np.asarray(weights, dtype=dtype).copy()
+    if mask is not None:
+        weight[~mask] = 0
+    sin = np.sin(angle) * weight
+    cos = np.cos(angle) * weight
+
+    smooth_method = "box" if method == "median" else method
+    smooth_size = 3 if method == "median" else size
+    sin_sum = _smooth(sin, smooth_method, smooth_size)
+    cos_sum = _smooth(cos, smooth_method, smooth_size)
+    weight_sum = _smooth(weight, smooth_method, smooth_size)
+    mean = np.arctan2(sin_sum, cos_sum)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        coherence = np.where(weight_sum > 0, np.hypot(sin_sum, cos_sum) / weight_sum, 0).astype(dtype)
+
+    if method == "median":
+        mean = _circular_median(angle, mean, weight > 0, size)
+    filtered = mean * dtype.type(1 / to_angle)
+    if mask is not None:
+        filtered = np.where(mask, filtered, phase)
+        coherence[~mask] = 0
+    return FilteredPhase(filtered.astype(dtype, copy=False), np.clip(coherence, 0, 1))
+
+
+def _circular_median(angle, reference, valid, size, tile_rows=64):
+    """
+    Median of the window's wrapped differences to reference, plus reference.
+    Invalid pixels are left out of the windows.
+    """
+    if size < 1 or size % 2 == 0:
+        raise ValueError(f"size must be a positive odd number, got {size}")
+    radius = size // 2
+    all_valid = bool(valid.all())
+    # mirrored at the image edges, NaN (left out) at invalid pixels
+    padded = np.pad(np.where(valid, angle, np.nan), radius, mode="reflect")
+    out = np.empty_like(reference)
+    height = angle.shape[0]
+    for r0 in range(0, height, tile_rows):
+        r1 = min(r0 + tile_rows, height)
+        windows = sliding_window_view(padded[r0:r1 + 2 * radius], (size, size))
+        windows = windows.reshape(r1 - r0, angle.shape[1], size * size)
+        differences = windows - reference[r0:r1, :, None]
+        differences += np.pi
+        differences %= 2 * np.pi
+        differences -= np.pi
+        if all_valid:
+            median = np.median(differences, axis=2)
+        else:
+            with warnings.catch_warnings():
+                # windows without any valid pixel
+                warnings.simplefilter("ignore", RuntimeWarning)
+                median = np.nan_to_num(np.nanmedian(differences, axis=2))
+        out[r0:r1] = reference[r0:r1] + median
+    # back into [-pi, pi)
+    return ((out + np.pi) % (2 * np.pi) - np.pi).astype(reference.dtype, copy=False)
@@ -0,0 +1,140 @@
+"""
+Phase-stepping solver for any angle table.
+
+isoclinic_phase() and isochromatic_phase() are the closed forms of one ten-step
+scheme. Through the polariscope model (modules/polariscope_model.py) every step is
+linear in the sample's Mueller elements, and those depend on the isoclinic angle
+theta and the retardation delta only through
+
+    x = I0 * [1, cos d, (1 - cos d) cos 4t, (1 - cos d) sin 4t, sin 2t sin d, cos 2t sin d]
+
+so a table of N steps gives I = A x with a fixed (N, 6) matrix A. Its pseudo-inverse
+is computed once; each pixel's x is then one matmul over the (N, H, W) stack,
+redundant steps simply average down the noise, and the fit residual and the fringe
+modulation (see phase_analysis.fringe_modulation) come for free.
+The phases follow the same conventions as phase_analysis:
+
+    isoclinic    = atan2(x3, x2) / 4                                 in (-pi/4, pi/4]
+    isochromatic = atan2(x4 sin 2iso + x5 cos 2iso, x1)              in (-pi, pi]
+
+    solver = PhaseStepSolver(load_angle_table(config, "angles_Ramesh"))
+    solution = solver.solve(stack)      # stack in the order of solver.steps
+"""
+from typing import NamedTuple
+import numpy as np
+from modules.polariscope_model import SAMPLE_ELEMENTS, step_coefficients
+
+PARAMETERS = ("intensity", "cos_delta", "cos_4theta", "sin_4theta", "sin_2theta_sin_delta",
+              "cos_2theta_sin_delta")
+
+# intensity coefficient + SAMPLE_ELEMENTS coefficients -> PARAMETERS, from the Mueller
+# matrix of a linear retarder: M11 = (1 + cos d)/2 + (1 - cos d)/2 cos 4t, M12 = M21 =
+# (1 - cos d)/2 sin 4t, M13 = -M31 = -sin 2t sin d, M23 = -M32 = cos 2t sin d, ...
+_ELEMENT_PARAMETERS = {
+    (1, 1): (0.5, 0.5, 0.5, 0, 0, 0),
+    (1, 2): (0, 0, 0, 0.5, 0, 0),
+    (1, 3): (0, 0, 0, 0, -1, 0),
+    (2, 1): (0, 0, 0, 0.5, 0, 0),
+    (2, 2): (0.5, 0.5, -0.5, 0, 0, 0),
+    (2, 3): (0, 0, 0, 0, 0, 1),
+    (3, 1): (0, 0, 0, 0, 1, 0),
+    (3, 2): (0, 0, 0, 0, 0, -1),
+    (3, 3): (0, 1, 0, 0, 0, 0),
+}
+_BASIS = np.array([(1, 0, 0, 0, 0, 0)] + [_ELEMENT_PARAMETERS[element] for element in SAMPLE_ELEMENTS],
+                  dtype=np.float64)
+
+
+class PhaseSolution(NamedTuple):
+    iso_phase: np.ndarray
+    isochrom_phase: np.ndarray
+    intensity: np.ndarray    # I0, the light level of the pixel
+    residual: np.ndarray     # rms of the fit residual over the steps, in image units
+    modulation: np.ndarray   # hypot of the isochromatic atan2 arguments, I0 sin/cos d
+
+
+def measurement_matrix(angle_table, fit_background=False):
+    """
+    (N, 6) matrix A of I = A x for the steps of an angle table, {step: [polarizer,
+    qwp1, qwp2, analyzer] in degrees, None for a removed QWP}. With fit_background
+    a column of ones is added for a constant background (dark level, stray light).
+    """
+    rows = []
+    for step, angles in angle_table.items():
+        polarizer, qwp1, qwp2, analyzer = [None if angle is None else np.radians(angle) for angle in angles]
+        rows.append(step_coefficients(polarizer, qwp1, qwp2, analyzer))
+    matrix = np.array(rows) @ _BASIS
+    if fit_background:
+        matrix = np.column_stack([matrix, np.ones(len(rows))])
+    return matrix
+
+
+class PhaseStepSolver:
+    """
+    Least-squares isoclinic and isochromatic phases from the steps of an angle table.
+
+    Args:
+        angle_table (dict): From load_angle_table() or load_angle_csv()
+        dark_level (float): Subtracted from every image first
+        fit_background (bool): Also fit a constant background per pixel; needs a table
+            that can tell it apart from the light level
+        tile_rows (int): Rows solved at a time, bounds the working memory
+        dtype: Floating point type of the outputs and the working buffers
+    """
+    def __init__(self, angle_table, dark_level=0.0, fit_background=False, tile_rows=64, dtype=np.float32):
+        self.steps = list(angle_table)
+        self.matrix = measurement_matrix(angle_table, fit_background)
+        self.rank = int(np.linalg.matrix_rank(self.matrix))
+        if self.rank < self.matrix.shape[1]:
+            raise ValueError(f"The angle table determines only {self.rank} of the {self.matrix.shape[1]} "
+                             f"parameters; add steps that separate them")
+        self.condition = float(np.linalg.cond(self.matrix))
+        self.dark_level = dark_level
+        self.tile_rows = tile_rows
+        self.dtype = np.dtype(dtype)
+        self._solve = np.linalg.pinv(self.matrix).astype(self.dtype)
+        self._matrix = self.matrix.astype(self.dtype)
+
+    def solve(self, stack, out=None):
+        """
+        Args:
+            stack (numpy.ndarray): (N, H, W) images in the order of self.steps
+            out (PhaseSolution, optional): Preallocated (H, W) outputs
+
+        Returns:
+            PhaseSolution
+        """
+        n_steps = len(self.steps)
+        if stack.ndim != 3 or stack.shape[0] != n_steps:
+            raise ValueError(f"Expected a stack of shape ({n_steps}, H, W), got {stack.shape}")
+        height, width = stack.shape[1:]
+        if out is None:
+            out = PhaseSolution(*(np.empty((height, width), dtype=self.dtype) for _ in PhaseSolution._fields))
+        for r0 in range(0, height, self.tile_rows):
+            r1 = min(r0 + self.tile_rows, height)
+            self._solve_tile(stack[:, r0:r1], [array[r0:r1] for array in out])
+        return out
+
+    def _solve_tile(self, tile, out):
+        iso, isochrom, intensity, residual, modulation = (array.reshape(-1) for array in out)
+        images = tile.reshape(tile.shape[0], -1).astype(self.dtype)
+        if self.dark_level:
+            images -= self.dtype.type(self.dark_level)
+        x = self._solve @ images
+        images -= self._matrix @ x
+        np.square(images, out=images)
+        np.sqrt(images.mean(axis=0), out=residual)
+
+        np.copyto(intensity, x[0])
+        np.arctan2(x[3], x[2], out=iso)
+        iso *= 0.25
+        # numerator (sin 2t sin d) sin 2iso + (cos 2t sin d) cos 2iso, reusing x[2] and x[3]
+        double = x[2]
+        np.multiply(iso, 2, out=double)
+        np.cos(double, out=x[3])
+        np.sin(double, out=double)
+        x[4] *= double
+        x[5] *= x[3]
+        x[4] += x[5]
+        np.arctan2(x[4], x[1], out=isochrom)
+        np.hypot(x[4], x[1], out=modulation)
@@ -0,0 +1,323 @@
+import heapq
+from typing import NamedTuple
+
+import numpy as np
+
+UNWRAP_METHODS = ("rows_cols", "quality_guided", "least_squares")
+
+
+def wrap(phase, period=2 * np.pi):
+    """
+    Wrap phase values into [-period/2, period/2).
+    """
+    return (phase + period / 2) % period - period / 2
+
+
+def residue_map(wrapped, period=2 * np.pi):
+    """
+    Residues of a wrapped phase map: the sum of wrapped differences around every
+    2x2 loop of pixels, in units of period. Non-zero entries (+1 / -1) are points
+    where path-following unwrapping becomes path dependent.
+
+    Returns:
+        numpy.ndarray: int8 array of shape (H-1, W-1)
+    """
+    dx_top = wrap(np.diff(wrapped[:-1], axis=1), period)
+    dy_right = wrap(np.diff(wrapped[:, 1:], axis=0), period)
+    dx_bottom = wrap(np.diff(wrapped[1:], axis=1), period)
+    dy_left = wrap(np.diff(wrapped[:, :-1], axis=0), period)
+    loop_sum = dx_top + dy_right - dx_bottom - dy_left
+    return np.rint(loop_sum / period).astype(np.int8)
+
+
+def count_residues(wrapped, period=2 * np.pi, mask=None):
+    """
+    Number of residues (positive and negative) in a wrapped phase map; with a mask,
+    only in the 2x2 loops whose four pixels are valid.
+    """
+    residues = residue_map(wrapped, period)
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        residues = residues[mask[:-1, :-1] & mask[:-1, 1:] & mask[1:, :-1] & mask[1:, 1:]]
+    return int(np.count_nonzero(residues))
+
+
+def phase_quality(wrapped, period=2 * np.pi):
+    """
+    Reliability of every pixel from the wrapped second differences to its neighbours
+    (horizontal, vertical and both diagonals). Smooth regions get high values, noisy
+    pixels and pixels next to a residue get low values. Border pixels get 0.
+    """
+    p = np.asarray(wrapped, dtype=np.float64)
+    centre = p[1:-1, 1:-1]
+
+    def second_difference(before, after):
+        return wrap(before - centre, period) - wrap(centre - after, period)
+
+    squared = second_difference(p[1:-1, :-2], p[1:-1, 2:]) ** 2
+    squared += second_difference(p[:-2, 1:-1], p[2:, 1:-1]) ** 2
+    squared += second_difference(p[:-2, :-2], p[2:, 2:]) ** 2
+    squared += second_difference(p[:-2, 2:], p[2:, :-2]) ** 2
+
+    quality = np.zeros(p.shape, dtype=np.float64)
+    quality[1:-1, 1:-1] = 1.0 / (np.sqrt(squared) + 1e-12)
+    return quality
+
+
+def unwrap_rows_cols(wrapped, period=2 * np.pi, mask=None):
+    """
+    Sequential 1D unwrapping along axis 0 then axis 1 (the original approach).
+    Fast, but a single noisy pixel spreads errors along its whole row or column.
+    Pixels outside mask are NaN in the result, but the rows and columns still run
+    through them.
+    """
+    unwrapped = np.unwrap(wrapped, axis=0, period=period)
+    unwrapped = np.unwrap(unwrapped, axis=1, period=period)
+    if mask is not None:
+        unwrapped = np.where(mask, unwrapped, np.nan)
+    return unwrapped
+
+
+def unwrap_quality_guided(wrapped, period=2 * np.pi, quality=None, mask=None):
+    """
+    Quality-guided flood-fill unwrapping.
+
+    Starting from the most reliable pixel, the pixel with the highest quality on the
+    border of the unwrapped region is always unwrapped next (kept in a heap), relative
+    to the neighbour that first reached it. Noisy pixels are therefore reached last and
+    their errors don't propagate into good regions.
+
+    Args:
+        wrapped (numpy.ndarray): 2D wrapped phase map
+        period (float): Phase period, e.g. ISOCLINIC_PERIOD or ISOCHROMATIC_PERIOD
+        quality (numpy.ndarray, optional): Per-pixel quality, higher is better.
+                                           Defaults to phase_quality(wrapped, period).
+        mask (numpy.ndarray, optional): Boolean array, False for pixels to skip.
+                                        Skipped pixels are NaN in the result.
+
+    Returns:
+        numpy.ndarray: Unwrapped phase (float64)
+    """
+    height, width = wrapped.shape
+    if quality is None:
+        quality = phase_quality(wrapped, period)
+    valid = np.ones(wrapped.shape, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+    n_pixels = height * width
+    w = np.asarray(wrapped, dtype=np.float64).ravel().tolist()
+    # Heap entries are single ints, rank * 4 + direction, where rank orders the valid
+    # pixels by decreasing quality and direction says which neighbour queued the pixel.
+    # Integer comparisons keep the heap operations cheap.
+    valid_idx = np.flatnonzero(valid)
+    order = valid_idx[np.argsort(-np.asarray(quality, dtype=np.float64).ravel()[valid_idx], kind="stable")]
+    rank4 = np.zeros(n_pixels, dtype=np.int64)
+    rank4[order] = np.arange(order.size) * 4
+    order, rank4 = order.tolist(), rank4.tolist()
+    # offset from a pixel to the neighbour that queued it, per direction
+    ref_offset = (1, -1, width, -width)
+
+    # Pixels are queued once, by the first of their neighbours to be unwrapped, and
+    # later unwrapped relative to that neighbour. Masked pixels start out as queued
+    # so they are never visited.
+    queued = bytearray((~valid).ravel().tobytes())
+    unwrapped = [float("nan")] * n_pixels
+    push, pop = heapq.heappush, heapq.heappop
+
+    # Seeds in order of decreasing quality, one per connected region of valid pixels
+    for seed in order:
+        if queued[seed]:
+            continue
+        queued[seed] = 1
+        unwrapped[seed] = w[seed]
+        heap = []
+        idx = seed
+        while True:
+            col = idx % width
+            n = idx - 1
+            if col > 0 and not queued[n]:
+                queued[n] = 1
+                push(heap, rank4[n])  # queued by its right neighbour
+            n = idx + 1
+            if col < width - 1 and not queued[n]:
+                queued[n] = 1
+                push(heap, rank4[n] + 1)  # queued by its left neighbour
+            n = idx - width
+            if n >= 0 and not queued[n]:
+                queued[n] = 1
+                push(heap, rank4[n] + 2)  # queued by the pixel below
+            n = idx + width
+            if n < n_pixels and not queued[n]:
+                queued[n] = 1
+                push(heap, rank4[n] + 3)  # queued by the pixel above
+            if not heap:
+                break
+
+            key = pop(heap)
+            idx = order[key >> 2]
+            ref = idx + ref_offset[key & 3]
+            d = w[idx] - w[ref]
+            unwrapped[idx] = unwrapped[ref] + d - period * round(d / period)
+
+    return np.array(unwrapped, dtype=np.float64).reshape(height, width)
+
+
+def _solve_poisson_neumann(rho):
+    """
+    Solve the discrete Poisson equation laplacian(phi) = rho with Neumann boundary
+    conditions. Equivalent to the DCT-II method: the mirrored (even) extension of rho
+    is periodic, so the Laplacian is diagonal in its Fourier basis.
+    """
+    height, width = rho.shape
+    extended = np.concatenate([rho, rho[::-1]], axis=0)
+    extended = np.concatenate([extended, extended[:, ::-1]], axis=1)
+    spectrum = np.fft.rfft2(extended)
+
+    ky = np.arange(2 * height)[:, None]
+    kx = np.arange(spectrum.shape[1])[None, :]
+    eigenvalues = (2 * np.cos(np.pi * ky / height) - 2) + (2 * np.cos(np.pi * kx / width) - 2)
+    eigenvalues[0, 0] = 1.0  # the mean is undetermined, pin it to 0
+    spectrum /= eigenvalues
+    spectrum[0, 0] = 0.0
+    return np.fft.irfft2(spectrum, s=extended.shape)[:height, :width]
+
+
+def _divergence(dx, dy):
+    """Divergence of a gradient field given as forward differences (zero at the far edges)."""
+    rho = dx.copy()
+    rho[:, 1:] -= dx[:, :-1]
+    rho += dy
+    rho[1:] -= dy[:-1]
+    return rho
+
+
+def _solve_poisson_masked(rho, wx, wy, tol=1e-4, max_iter=100):
+    """
+    Solve div(w grad phi) = rho, w being 0/1 weights of the horizontal (wx) and
+    vertical (wy) pixel links, by conjugate gradients preconditioned with the
+    unweighted solver (Ghiglia & Romero's weighted least squares). Converges in a
+    few dozen iterations; pixels without links are left at arbitrary values.
+    """
+    def operator(phi):
+        dx = np.zeros_like(phi)
+        dy = np.zeros_like(phi)
+        dx[:, :-1] = wx * np.diff(phi, axis=1)
+        dy[:-1] = wy * np.diff(phi, axis=0)
+        return _divergence(dx, dy)
+
+    phi = np.zeros_like(rho)
+    residual = rho.copy()
+    norm = np.linalg.norm(rho)
+    if norm == 0:
+        return phi
+    z = _solve_poisson_neumann(residual)
+    direction = z.copy()
+    rz = np.vdot(residual, z)
+    for _ in range(max_iter):
+        q = operator(direction)
+        alpha = rz / np.vdot(direction, q)
+        phi += alpha * direction
+        residual -= alpha * q
+        if np.linalg.norm(residual) < tol * norm:
+            break
+        z = _solve_poisson_neumann(residual)
+        rz, rz_old = np.vdot(residual, z), rz
+        direction *= rz / rz_old
+        direction += z
+    return phi
+
+
+def unwrap_least_squares(wrapped, period=2 * np.pi, congruent=True, mask=None):
+    """
+    Unweighted least-squares unwrapping (Ghiglia & Romero).
+
+    Finds the surface whose gradients best match the wrapped gradients of the input,
+    solved in one step with a DCT-based Poisson solver. Errors spread smoothly instead
+    of along lines, at the cost of slightly biasing the result near residues.
+
+    Args:
+        wrapped (numpy.ndarray): 2D wrapped phase map
+        period (float): Phase period
+        congruent (bool): Shift every pixel by whole periods so the result wraps back
+                          to exactly the input
+        mask (numpy.ndarray, optional): Boolean array, False for pixels to skip. Only the
+                                        gradients between valid pixels are fitted, by
+                                        iterating the DCT solver; skipped pixels are NaN.
+
+    Returns:
+        numpy.ndarray: Unwrapped phase (float64)
+    """
+    p = np.asarray(wrapped, dtype=np.float64)
+    dy = np.zeros_like(p)
+    dx = np.zeros_like(p)
+    dy[:-1] = wrap(np.diff(p, axis=0), period)
+    dx[:, :-1] = wrap(np.diff(p, axis=1), period)
+
+    if mask is None:
+        unwrapped = _solve_poisson_neumann(_divergence(dx, dy))
+        reference = 0
+    else:
+        mask = np.asarray(mask, dtype=bool)
+        # only gradients between two valid pixels
+        wx = mask[:, :-1] & mask[:, 1:]
+        wy = mask[:-1] & mask[1:]
+        dx[:, :-1] *= wx
+        dy[:-1] *= wy
+        unwrapped = _solve_poisson_masked(_divergence(dx, dy), wx, wy)
+        valid = np.flatnonzero(mask)
+        reference = valid[0] if valid.size else 0
+    if congruent:
+        unwrapped += wrap(p - unwrapped, period)
+    else:
+        unwrapped += p.flat[reference] - unwrapped.flat[reference]
+    if mask is not None:
+        unwrapped[~mask] = np.nan
+    return unwrapped
+
+
+class UnwrapResult(NamedTuple):
+    unwrapped: np.ndarray
+    n_residues: int
+    method: str
+
+
+def unwrap_phase(wrapped, method="quality_guided", period=2 * np.pi, mask=None, **kwargs):
+    """
+    Unwrap a 2D phase map with one of UNWRAP_METHODS.
+
+    mask (False for pixels to skip, NaN in the result) works with every method, which
+    then only runs over the bounding box of the valid pixels; NaN and inf pixels of
+    wrapped are always skipped. Extra keyword arguments are passed to the method,
+    e.g. quality= for 'quality_guided'.
+
+    Returns:
+        UnwrapResult: (unwrapped, n_residues, method), where n_residues is the number
+                      of residues in the wrapped input, inside the mask
+    """
+    finite = np.isfinite(wrapped)
+    if not finite.all():
+        # e.g. the NaN of the arctan method where the denominator is 0
+        mask = finite if mask is None else np.asarray(mask, dtype=bool) & finite
+        wrapped = np.where(finite, wrapped, 0)
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+        if rows.size == 0:
+            return UnwrapResult(np.full(mask.shape, np.nan), 0, method)
+        box = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+        if box[0].stop - box[0].start < mask.shape[0] or box[1].stop - box[1].start < mask.shape[1]:
+            kwargs = {key: value[box] if isinstance(value, np.ndarray) and value.shape == mask.shape else value
+                      for key, value in kwargs.items()}
+            result = unwrap_phase(np.asarray(wrapped)[box], method, period, mask[box], **kwargs)
+            unwrapped = np.full(mask.shape, np.nan)
+            unwrapped[box] = result.unwrapped
+            return UnwrapResult(unwrapped, result.n_residues, method)
+
+    if method == "rows_cols":
+        unwrapped = unwrap_rows_cols(wrapped, period=period, mask=mask)
+    elif method == "quality_guided":
+        unwrapped = unwrap_quality_guided(wrapped, period=period, mask=mask, **kwargs)
+    elif method == "least_squares":
+        unwrapped = unwrap_least_squares(wrapped, period=period, mask=mask, **kwargs)
+    else:
+        raise ValueError(f"Invalid method: {method}")
+    return UnwrapResult(unwrapped, count_residues(wrapped, period, mask), method)
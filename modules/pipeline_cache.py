@@ -0,0 +1,149 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_hash(data):
+    """
+    Hash of a file's content. Accepts bytes, a path-like or a file-like object
+    (e.g. a Streamlit UploadedFile).
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        raw = bytes(data)
+    elif hasattr(data, "getvalue"):
+        raw = data.getvalue()
+    elif hasattr(data, "read"):
+        position = data.tell()
+        raw = data.read()
+        data.seek(position)
+    else:
+        with open(data, "rb") as f:
+            raw = f.read()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def make_key(stage, *parts):
+    """
+    Build a cache key from a stage name and any repr()-able parts
+    (content hashes, upstream keys, parameters).
+    """
+    text = repr((stage,) + tuple(parts))
+    return f"{stage}:{hashlib.blake2b(text.encode(), digest_size=16).hexdigest()}"
+
+
+def sizeof(value):
+    """
+    Approximate size in bytes of a cached value: the nbytes of every numpy array
+    it holds, looking inside tuples, lists and dicts.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sum(sizeof(v) for v in value.values())
+    return 0
+
+
+class StageStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {"hits": self.hits, "misses": self.misses, "time_ms": self.seconds * 1e3}
+
+
+class PipelineCache:
+    """
+    Content-addressed LRU cache for the stages of the analysis pipeline
+    (decode, bad pixel repair, crop, phase, unwrap).
+
+    Values are looked up by key (see make_key) and evicted least recently used first
+    once their total size exceeds max_mb. Hits, misses and time spent are counted per
+    stage, both for the current run (reset by start_run) and in total.
+
+    Cached arrays are shared between runs, so callers must not modify them in place.
+    """
+
+    def __init__(self, max_mb=1024):
+        self.max_bytes = int(max_mb * 1e6)
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self.run_stats = {}
+        self.total_stats = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def start_run(self):
+        """
+        Reset the per-run statistics, e.g. at the top of every Streamlit rerun.
+        """
+        self.run_stats = {}
+
+    def _record(self, stage, hit, seconds):
+        for stats in (self.run_stats, self.total_stats):
+            stage_stats = stats.setdefault(stage, StageStats())
+            if hit:
+                stage_stats.hits += 1
+            else:
+                stage_stats.misses += 1
+            stage_stats.seconds += seconds
+
+    def get_or_compute(self, stage, key, func, *args, **kwargs):
+        """
+        Return the cached value for key, or compute it with func(*args, **kwargs),
+        store it and return it.
+        """
+        t0 = time.perf_counter()
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            value = self._entries[key][0]
+            self._record(stage, True, time.perf_counter() - t0)
+            return value
+
+        value = func(*args, **kwargs)
+        self.put(key, value)
+        self._record(stage, False, time.perf_counter() - t0)
+        return value
+
+    def set_max_mb(self, max_mb):
+        """
+        Change the size bound, evicting entries if the cache is now over it.
+        """
+        self.max_bytes = int(max_mb * 1e6)
+        self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+
+    def put(self, key, value):
+        if key in self._entries:
+            self.current_bytes -= self._entries.pop(key)[1]
+        size = sizeof(value)
+        if size > self.max_bytes:
+            # larger than the whole cache, don't evict everything else for it
+            return
+        self._entries[key] = (value, size)
+        self.current_bytes += size
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats_table(self, which="run"):
+        """
+        Per-stage statistics as a list of dicts, for st.dataframe / st.table.
+        """
+        stats = self.run_stats if which == "run" else self.total_stats
+        return [{"stage": stage, **stage_stats.as_dict()} for stage, stage_stats in stats.items()]
@@ -2,23 +2,80 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 import plotly.express as px
-import plotly.figure_factory as ff
+import plotly.graph_objects as go
+from matplotlib.collections import LineCollection
 import os
 import streamlit as st
+from modules.downsample import block_extreme
+from modules.image_stats import image_stats, color_range as color_range_of
+
+
+# Default bound on the number of heatmap cells sent to the browser per figure
+DEFAULT_MAX_PIXELS = 512 * 512
+# Screen pixels between neighbouring arrows of a direction field
+DEFAULT_ARROW_SPACING = 16
+
+
+def display_tile(img_array, max_pixels=None, viewport=None):
+    """
+    Cut the region of an image that a figure should show and decimate it so it has
+    at most max_pixels cells. Decimation uses block_extreme() so hot spots stay visible.
+
+    Args:
+        img_array (numpy.ndarray): 2D image array
+        max_pixels (int, optional): Bound on the number of cells, None for full resolution
+        viewport (tuple, optional): (x0, y0, x1, y1) region to show, None for the whole image
+
+    Returns:
+        tuple: (tile, x, y) where x and y are the pixel coordinates of the tile's
+               columns and rows in the original image
+    """
+    height, width = img_array.shape[:2]
+    x0, y0, x1, y1 = viewport if viewport is not None else (0, 0, width, height)
+    x0, x1 = int(np.clip(x0, 0, width)), int(np.clip(x1, 0, width))
+    y0, y1 = int(np.clip(y0, 0, height)), int(np.clip(y1, 0, height))
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError(f"Empty viewport {viewport} for image of shape {img_array.shape}")
+    tile = img_array[y0:y1, x0:x1]
+
+    factor = 1
+    if max_pixels is not None and tile.size > max_pixels:
+        factor = int(np.ceil(np.sqrt(tile.size / max_pixels)))
+    if factor > 1:
+        # pad to whole blocks so edge pixels are not dropped
+        pad_y = -tile.shape[0] % factor
+        pad_x = -tile.shape[1] % factor
+        if pad_y or pad_x:
+            tile = np.pad(tile, ((0, pad_y), (0, pad_x)), mode="edge")
+        tile = block_extreme(tile, factor)
+
+    # centre of each block in original pixel coordinates
+    x = x0 + np.arange(tile.shape[1]) * factor + (factor - 1) / 2
+    y = y0 + np.arange(tile.shape[0]) * factor + (factor - 1) / 2
+    return tile, x, y
 
 
 def create_plotly_figure(img_array, 
                          title="Image Colormap", 
                          cmap='jet', 
-                         color_range=None,):
+                         color_range=None,
+                         max_pixels=None,
+                         viewport=None):
     """
     Create a Plotly figure for an image array.
+
+    With max_pixels set, the browser only receives a decimated preview of at most
+    max_pixels cells; with viewport=(x0, y0, x1, y1) only that region is sent, at
+    full resolution if it fits in max_pixels. Axes keep the original pixel coordinates.
     """
 
     if color_range is None:
-        color_range = [np.min(img_array), np.max(img_array)]
+        color_range = color_range_of(img_array)
 
-    fig = px.imshow(img_array, 
+    tile, x, y = display_tile(img_array, max_pixels=max_pixels, viewport=viewport)
+    fig = px.imshow(tile, 
+                    x=x,
+                    y=y,
                     color_continuous_scale=cmap,
                     range_color=color_range,
                     labels=dict(x="x", y="y", color="value"))
@@ -27,22 +84,27 @@ def create_plotly_figure(img_array,
 
     return fig
 
-def plot_histogram(img_array, title="Histogram"):
+def plot_histogram(img_array, title="Histogram", bins=256, mask=None, stats=None):
     """
-    Plot a histogram of the image array.
+    Plot a histogram of the image array. It is binned here in one pass
+    (image_stats) and the figure only gets the bin counts.
+
+    Args:
+        stats (ImageStats, optional): From image_stats(), instead of reading the image again
     """
-    # flatten the image array into a 1D array
-    img_array_1D = img_array.flatten()
-    # print(f"img_array_1D shape: {img_array_1D.shape}")
-    fig = px.histogram(img_array_1D, nbins=256, title=title)
+    if stats is None:
+        stats = image_stats(img_array, mask=mask)
+    counts, edges = stats.histogram(bins)
+    fig = px.bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, title=title, labels=dict(x="value", y="count"))
+    fig.update_layout(bargap=0)
     return fig
 
-def image_array_statistics(img_array):
+def image_array_statistics(img_array, mask=None):
     """
-    Calculate the statistics of the image array.
+    Calculate the statistics of the image array, over the pixels where mask is True if given.
     """
-    img_array_1D = img_array.flatten()
-    return np.mean(img_array_1D), np.std(img_array_1D), np.min(img_array_1D), np.max(img_array_1D)
+    stats = image_stats(img_array, mask=mask)
+    return stats.mean, stats.std, stats.minimum, stats.maximum
 
 def save_plotly_figure(fig, filename, save_dir=None):
     """
@@ -100,10 +162,13 @@ def heatmap_plot_with_bounding_box(
     fig_height=800,
     fig_width=800,
     bounding_box=None,
+    max_pixels=None,
+    viewport=None,
 ):
     
     fig = create_plotly_figure(
-        image_array, title=title, cmap=color_map, color_range=color_range
+        image_array, title=title, cmap=color_map, color_range=color_range,
+        max_pixels=max_pixels, viewport=viewport
     )
     if bounding_box:
         # Check if bounding box dimensions exceed image array dimensions
@@ -148,37 +213,104 @@ def quiver_plot(isoclinic_phase, image_array):
                   )
     )
     return fig
-def quiver_plot_plotly(isoclinic_phase):
-    x, y = np.meshgrid(np.arange(isoclinic_phase.shape[1]), np.arange(isoclinic_phase.shape[0]))
-    u = np.cos(isoclinic_phase)
-    v = np.sin(isoclinic_phase)
-    fig = ff.create_quiver(x, y, u, v, 
-                           scale=0.1, arrow_scale=0.4, line_width=0.5)
+def arrow_step(shape, fig_width, fig_height=None, spacing=DEFAULT_ARROW_SPACING):
+    """
+    Image pixels between the arrows of a direction field, so that they are about
+    spacing screen pixels apart when an image of shape (H, W) is drawn fig_width
+    (and fig_height) pixels large. The number of arrows then depends on the figure
+    size, not on the size of the image.
+    """
+    height, width = shape[:2]
+    zoom = fig_width / width if fig_height is None else min(fig_width / width, fig_height / height)
+    return max(1, int(round(spacing / zoom)))
+
+
+def direction_field(phase, step, mask=None):
+    """
+    Sample a direction map at the centres of step x step cells. Only strided views
+    of the map are read, so the cost grows with the number of arrows, not pixels.
+
+    Returns:
+        tuple: (x, y, angle) 1D arrays, without masked and NaN samples
+    """
+    offset = step // 2
+    angle = np.asarray(phase)[offset::step, offset::step]
+    y, x = np.mgrid[offset:phase.shape[0]:step, offset:phase.shape[1]:step]
+    valid = np.isfinite(angle)
+    if mask is not None:
+        valid &= np.asarray(mask, dtype=bool)[offset::step, offset::step]
+    return x[valid], y[valid], angle[valid].astype(np.float64)
+
+
+def direction_segments(x, y, angle, length):
+    """
+    Line segments of the given length centred on (x, y) along angle, in image
+    coordinates (y down), as one (N, 2, 2) array of [[x0, y0], [x1, y1]].
+    The angle turns counter-clockwise on screen, as in the quiver plots.
+    """
+    half_dx = 0.5 * length * np.cos(angle)
+    half_dy = -0.5 * length * np.sin(angle)   # y points down
+    return np.stack([np.stack([x - half_dx, y - half_dy], axis=-1),
+                     np.stack([x + half_dx, y + half_dy], axis=-1)], axis=1)
+
+
+def quiver_plot_plotly(isoclinic_phase, fig_width=800, fig_height=None, spacing=DEFAULT_ARROW_SPACING,
+                       mask=None, length=0.8, cmap='jet', color_range=None, max_pixels=DEFAULT_MAX_PIXELS,
+                       background=True, line_color='white', title=" "):
+    """
+    Isoclinic direction field as one WebGL line trace: every arrow is a segment
+    centred on its sample, separated from the next by a NaN gap, so the browser gets
+    three points per arrow. With background, drawn over the (decimated) phase map.
+
+    Args:
+        isoclinic_phase (numpy.ndarray): Isoclinic angle map in radians
+        fig_width, fig_height (int): Figure size in pixels, fig_height from the aspect ratio by default
+        spacing (float): Screen pixels between arrows
+        mask (numpy.ndarray, optional): True where arrows may be drawn
+        length (float): Arrow length as a fraction of the arrow spacing
+    """
+    height, width = isoclinic_phase.shape
+    if fig_height is None:
+        fig_height = int(fig_width * height / width)
+    step = arrow_step(isoclinic_phase.shape, fig_width, fig_height, spacing)
+    x, y, angle = direction_field(isoclinic_phase, step, mask)
+    points = np.full((len(angle), 3, 2), np.nan)
+    points[:, :2] = direction_segments(x, y, angle, length * step)
+
+    if background:
+        fig = create_plotly_figure(isoclinic_phase, title=title, cmap=cmap, color_range=color_range,
+                                   max_pixels=max_pixels)
+    else:
+        fig = go.Figure(layout=dict(title=title))
+        fig.update_xaxes(range=[-0.5, width - 0.5])
+        fig.update_yaxes(range=[height - 0.5, -0.5], scaleanchor="x")
+    fig.add_trace(go.Scattergl(x=points[..., 0].ravel(), y=points[..., 1].ravel(), mode="lines",
+                               line=dict(color=line_color, width=1), hoverinfo="skip",
+                               name="stress direction", showlegend=False))
+    fig.update_layout(width=fig_width, height=fig_height)
     return fig
 
-def quiver_plot_matplotlib(isoclinic_phase, scale=0.1, vector_scale=0.5, cmap='jet'):
+def quiver_plot_matplotlib(isoclinic_phase, fig_width=15, spacing=DEFAULT_ARROW_SPACING, mask=None,
+                           length=0.8, cmap='jet', dpi=100, linewidth=1.0):
+    """
+    Isoclinic direction field as one LineCollection of centred segments coloured
+    by the angle, about spacing screen pixels apart on a fig_width inch figure.
+    """
     image_shape = isoclinic_phase.shape
-    fig_width = 15
-    x, y = np.meshgrid(np.arange(isoclinic_phase.shape[1]), 
-                       np.arange(isoclinic_phase.shape[0]))
-    u = np.cos(isoclinic_phase) * vector_scale
-    v = np.sin(isoclinic_phase) * vector_scale
-    fig, ax = plt.subplots(figsize=(fig_width, fig_width*image_shape[0]/image_shape[1]))
-    # Use C parameter for colormap-based coloring
-    Q = ax.quiver(x, y, u, v, isoclinic_phase,
-              scale=scale,
-              pivot='mid',
-              width=0.001,
-              alpha=0.8,
-              cmap=cmap
-              )
-    
+    fig, ax = plt.subplots(figsize=(fig_width, fig_width*image_shape[0]/image_shape[1]), dpi=dpi)
+    step = arrow_step(image_shape, fig_width * dpi, spacing=spacing)
+    x, y, angle = direction_field(isoclinic_phase, step, mask)
+    lines = LineCollection(direction_segments(x, y, angle, length * step), array=angle, cmap=cmap,
+                           linewidths=linewidth, alpha=0.8)
+    ax.add_collection(lines)
+    ax.set_xlim(-0.5, image_shape[1] - 0.5)
+    ax.set_ylim(image_shape[0] - 0.5, -0.5)
+
     # Add colorbar
-    plt.colorbar(Q, ax=ax, label='Phase (radians)')
+    plt.colorbar(lines, ax=ax, label='Phase (radians)')
     # Set aspect ratio to equal to ensure points are evenly spaced
     ax.grid(True, which='both', linestyle='--', linewidth=0.5, color='gray', alpha=0.5)
     ax.set_aspect('equal')
-    ax.invert_yaxis()
     return fig
 
 
@@ -186,7 +318,7 @@ if __name__ == "__main__":
     # image = "C:/Code/Stress-Imaging/SAMPLE_DATA/compressed_image_27_180.npy"
     image = "C:/Code/Stress-Imaging/SAMPLE_DATA/isoclinic_phase_55_361.npy"
     image_array = np.load(image)
-    fig = quiver_plot_matplotlib(image_array, scale = 1/0.05, vector_scale=0.2)
+    fig = quiver_plot_matplotlib(image_array)
     plt.show()
     # fig = quiver_plot_plotly(image_array)
     # fig.show()
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Mueller calculus model of the polariscope: polarizer -> QWP1 -> sample -> QWP2 -> analyzer.
+
+The sample is a linear retarder with fast axis at the isoclinic angle theta and
+retardation delta (the isochromatic phase), both per pixel. Everything before the
+sample reduces to the Stokes vector that enters it and everything after it to the
+first row of the analyzer side Mueller matrix, so one image is
+
+    I = intensity * (a . M_sample(theta, delta) . s)
+
+which is linear in the elements of M_sample. All angles are in radians, measured
+the same way as in phase_analysis; a QWP angle of None means the plate is removed.
+With the I1-I10 angles of config/angles_Ramesh.csv, isoclinic_phase() and
+isochromatic_phase() recover theta and delta from these images.
+"""
+import numpy as np
+
+# elements of the sample retarder's Mueller matrix that affect the intensity,
+# as (row, column); the rest are 1 (M00) or 0
+SAMPLE_ELEMENTS = ((1, 1), (1, 2), (1, 3), (2, 1), (2, 2), (2, 3), (3, 1), (3, 2), (3, 3))
+
+
+def linear_polarizer(angle):
+    c, s = np.cos(2 * angle), np.sin(2 * angle)
+    return 0.5 * np.array([[1, c, s, 0],
+                           [c, c * c, c * s, 0],
+                           [s, c * s, s * s, 0],
+                           [0, 0, 0, 0]])
+
+
+def linear_retarder(angle, retardation):
+    """
+    Mueller matrix of a linear retarder; angle and retardation may be arrays, in
+    which case the result has shape (4, 4) + their broadcast shape.
+    """
+    c, s = np.cos(2 * angle), np.sin(2 * angle)
+    cd, sd = np.cos(retardation), np.sin(retardation)
+    c, s, cd, sd = np.broadcast_arrays(c, s, cd, sd)
+    one, zero = np.ones_like(c), np.zeros_like(c)
+    return np.array([[one, zero, zero, zero],
+                     [zero, c * c + s * s * cd, c * s * (1 - cd), -s * sd],
+                     [zero, c * s * (1 - cd), s * s + c * c * cd, c * sd],
+                     [zero, s * sd, -c * sd, cd]])
+
+
+def quarter_wave_plate(angle):
+    return linear_retarder(angle, np.pi / 2)
+
+
+def input_stokes(polarizer, qwp1=None):
+    """Stokes vector entering the sample, for unpolarized light of unit intensity."""
+    stokes = linear_polarizer(polarizer) @ np.array([1.0, 0.0, 0.0, 0.0])
+    if qwp1 is not None:
+        stokes = quarter_wave_plate(qwp1) @ stokes
+    return stokes
+
+
+def analyzer_row(analyzer, qwp2=None):
+    """First row of the Mueller matrix of everything after the sample."""
+    matrix = linear_polarizer(analyzer)
+    if qwp2 is not None:
+        matrix = matrix @ quarter_wave_plate(qwp2)
+    return matrix[0]
+
+
+def step_coefficients(polarizer, qwp1, qwp2, analyzer):
+    """
+    Coefficients of one phase step: I = c0 + sum(c_k * M_k) over SAMPLE_ELEMENTS.
+
+    Returns:
+        numpy.ndarray: (1 + len(SAMPLE_ELEMENTS),) array
+    """
+    s = input_stokes(polarizer, qwp1)
+    a = analyzer_row(analyzer, qwp2)
+    return np.array([a[0] * s[0]] + [a[i] * s[j] for i, j in SAMPLE_ELEMENTS])
+
+
+def sample_elements(theta, delta, dtype=np.float64):
+    """
+    The SAMPLE_ELEMENTS of the sample retarder's Mueller matrix, stacked to shape
+    (len(SAMPLE_ELEMENTS),) + theta.shape. Worth keeping when rendering many
+    images of the same sample.
+    """
+    sample = linear_retarder(theta, delta)
+    return np.stack([sample[i, j] for i, j in SAMPLE_ELEMENTS]).astype(dtype, copy=False)
+
+
+def intensity_from_elements(elements, polarizer, qwp1, qwp2, analyzer, intensity=1.0):
+    """
+    Image seen through the polariscope, from sample_elements().
+    """
+    coefficients = step_coefficients(polarizer, qwp1, qwp2, analyzer)
+    image = np.full(elements.shape[1:], coefficients[0], dtype=elements.dtype)
+    for coefficient, element in zip(coefficients[1:], elements):
+        if abs(coefficient) > 1e-12:
+            image += coefficient * element
+    image *= intensity
+    return image
+
+
+def polariscope_intensity(theta, delta, polarizer, qwp1, qwp2, analyzer, intensity=1.0):
+    """
+    Image seen through the polariscope, for per-pixel isoclinic angle theta and
+    retardation delta.
+    """
+    elements = sample_elements(np.asarray(theta, dtype=np.float64), delta)
+    return intensity_from_elements(elements, polarizer, qwp1, qwp2, analyzer, intensity)
+
+
+def stress_to_optics(sxx, syy, sxy, fringe_value, thickness):
+    """
+    Isoclinic angle and retardation of a plane stress field (stress-optic law).
+
+    Args:
+        sxx, syy, sxy: Stress components in MPa
+        fringe_value (float): Material stress fringe value in N/mm/fringe
+        thickness (float): Sample thickness in mm
+
+    Returns:
+        tuple: (theta, delta) in radians; theta is the direction of the larger
+               principal stress
+    """
+    theta = 0.5 * np.arctan2(2 * sxy, sxx - syy)
+    principal_difference = np.sqrt((sxx - syy) ** 2 + 4 * sxy ** 2)
+    delta = 2 * np.pi * thickness * principal_difference / fringe_value
+    return theta, delta
+
+
+def disc_under_compression(shape, radius, load, thickness, center=None):
+    """
+    Plane stress in a disc loaded by two opposite point forces along its vertical
+    diameter (the classic photoelastic calibration specimen).
+
+    Args:
+        shape (tuple): (H, W) of the image
+        radius (float): Disc radius in pixels (1 pixel = 1 mm)
+        load (float): Compressive force in N
+        thickness (float): Disc thickness in mm
+        center (tuple, optional): (x, y) of the disc centre, defaults to the image centre
+
+    Returns:
+        tuple: (sxx, syy, sxy, inside) in MPa, inside is the disc mask
+    """
+    height, width = shape
+    cx, cy = ((width - 1) / 2, (height - 1) / 2) if center is None else center
+    y, x = np.mgrid[0:height, 0:width].astype(np.float64)
+    x -= cx
+    y -= cy
+    inside = x ** 2 + y ** 2 < radius ** 2
+    # distances to the two load points; kept away from zero at the contacts
+    r1 = np.maximum(x ** 2 + (radius - y) ** 2, 1.0) ** 2
+    r2 = np.maximum(x ** 2 + (radius + y) ** 2, 1.0) ** 2
+    k = -2 * load / (np.pi * thickness)
+    sxx = k * ((radius - y) * x ** 2 / r1 + (radius + y) * x ** 2 / r2 - 1 / (2 * radius))
+    syy = k * ((radius - y) ** 3 / r1 + (radius + y) ** 3 / r2 - 1 / (2 * radius))
+    sxy = -k * ((radius - y) ** 2 * x / r1 - (radius + y) ** 2 * x / r2)
+    for component in (sxx, syy, sxy):
+        component[~inside] = 0
+    return sxx, syy, sxy, inside
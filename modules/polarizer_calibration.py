@@ -0,0 +1,212 @@
+"""
+Analyse the analyzer sweeps of polarizer_calib_routine.py.
+
+With the QWPs and the sample out of the beam, each pixel follows Malus' law as the
+analyzer turns:
+
+    I(beta) = a + b cos(2 beta) + c sin(2 beta)
+
+which is linear in (a, b, c), so every pixel of a sweep is fitted at once with one
+pseudo-inverse of the (angles, 3) design matrix instead of a curve_fit per pixel.
+From the fit:
+
+    transmission axis   beta_max = atan2(c, b) / 2, the analyzer position of the maximum
+    extinction ratio    (a + A) / (a - A), A = hypot(b, c), after subtracting the dark level
+
+The analyzer passes the most light when its axis is parallel to the polarizer's, so
+beta_max - polarizer position is the offset of the analyzer's zero from the
+polarizer's. The polarizer offset in config.toml is the reference; the sweeps give
+the analyzer offset relative to it (modulo 180 degrees, picked nearest the current
+value), and the angle error map is how far each pixel is from that single offset.
+
+    python -m modules.polarizer_calibration SAMPLE_DATA/polarizer_calib_w_CZT --write-config
+"""
+import re
+import time
+from pathlib import Path
+from typing import NamedTuple
+import numpy as np
+from modules.image_process import load_image_stack
+
+SWEEP_FILE = re.compile(r"polarizer_(?P<polarizer>-?[\d.]+)_analyzer_(?P<analyzer>-?[\d.]+)_CZT\.png$")
+
+
+class MalusFit(NamedTuple):
+    mean: np.ndarray        # a, counts
+    amplitude: np.ndarray   # hypot(b, c), counts
+    max_angle: np.ndarray   # analyzer position of the maximum in [0, 180) degrees
+    residual: np.ndarray    # rms of the fit residual, counts
+
+
+class SweepCalibration(NamedTuple):
+    analyzer_offset: float    # degrees, estimated from all sweeps
+    fits: dict                # polarizer position -> MalusFit
+    offset_maps: dict         # polarizer position -> per-pixel analyzer offset, degrees
+    extinction_maps: dict     # polarizer position -> per-pixel extinction ratio
+    angle_error_maps: dict    # polarizer position -> offset map minus analyzer_offset, degrees
+
+
+def find_sweeps(folder):
+    """
+    Sweep images in a folder, as {polarizer position: [(analyzer position, path), ...]}
+    sorted by analyzer position.
+    """
+    sweeps = {}
+    for path in Path(folder).iterdir():
+        match = SWEEP_FILE.match(path.name)
+        if match:
+            sweeps.setdefault(float(match["polarizer"]), []).append((float(match["analyzer"]), path))
+    if not sweeps:
+        raise FileNotFoundError(f"No polarizer_*_analyzer_*_CZT.png files in {folder}")
+    return {polarizer: sorted(images) for polarizer, images in sorted(sweeps.items())}
+
+
+def load_sweep(images, crop_box=None):
+    """
+    Load one sweep from find_sweeps() as (analyzer angles, (angles, H, W) uint16 stack).
+    """
+    angles = np.array([angle for angle, _ in images])
+    stack = load_image_stack([path for _, path in images], crop_box=crop_box, dtype=np.uint16)
+    return angles, stack
+
+
+def fit_malus(stack, angles, tile_rows=32):
+    """
+    Fit I = a + b cos(2 beta) + c sin(2 beta) to every pixel by linear least squares.
+
+    Args:
+        stack (numpy.ndarray): (angles, H, W) sweep
+        angles (array-like): Analyzer positions in degrees, at least 3 distinct modulo 180
+        tile_rows (int): Rows fitted at a time, bounds the float32 working memory
+
+    Returns:
+        MalusFit
+    """
+    beta = np.radians(np.asarray(angles, dtype=np.float64))
+    if stack.ndim != 3 or stack.shape[0] != beta.size:
+        raise ValueError(f"Expected a stack of shape ({beta.size}, H, W), got {stack.shape}")
+    design = np.stack([np.ones_like(beta), np.cos(2 * beta), np.sin(2 * beta)], axis=1)
+    if np.linalg.matrix_rank(design) < 3:
+        raise ValueError("Need at least 3 distinct analyzer angles (modulo 180 degrees)")
+    solve = np.linalg.pinv(design).astype(np.float32)
+    design = design.astype(np.float32)
+
+    height, width = stack.shape[1:]
+    coefficients = np.empty((3, height, width), dtype=np.float32)
+    residual = np.empty((height, width), dtype=np.float32)
+    for r0 in range(0, height, tile_rows):
+        r1 = min(r0 + tile_rows, height)
+        tile = stack[:, r0:r1].reshape(len(beta), -1).astype(np.float32)
+        tile_coefficients = solve @ tile
+        tile -= design @ tile_coefficients
+        coefficients[:, r0:r1] = tile_coefficients.reshape(3, r1 - r0, width)
+        np.square(tile, out=tile)
+        residual[r0:r1] = np.sqrt(tile.mean(axis=0)).reshape(r1 - r0, width)
+
+    a, b, c = coefficients
+    max_angle = np.degrees(0.5 * np.arctan2(c, b)) % 180.0
+    return MalusFit(a, np.hypot(b, c), max_angle, residual)
+
+
+def extinction_ratio(fit, dark_level=0.0):
+    """Maximum over minimum transmitted intensity; inf where the minimum is not above dark."""
+    maximum = fit.mean + fit.amplitude - dark_level
+    minimum = fit.mean - fit.amplitude - dark_level
+    with np.errstate(divide="ignore"):
+        return np.where(minimum > 0, maximum / np.maximum(minimum, 1e-12), np.inf)
+
+
+def wrap_angle(angle, period=180.0):
+    """Wrap degrees into [-period/2, period/2)."""
+    return (np.asarray(angle) + period / 2) % period - period / 2
+
+
+def calibrate_sweeps(sweeps, polarizer_offset=90.0, analyzer_offset=90.0, dark_level=0.0, crop_box=None):
+    """
+    Fit every sweep and estimate the analyzer offset.
+
+    Args:
+        sweeps (dict): From find_sweeps()
+        polarizer_offset, analyzer_offset (float): Current [mount_offsets] values; the
+            polarizer's is the reference, the analyzer's picks the 180 degree branch
+        dark_level (float): Camera counts with no light, for the extinction ratio
+        crop_box (ROI or tuple, optional): Region of the sensor to fit
+
+    Returns:
+        SweepCalibration
+    """
+    fits, offset_maps, extinction_maps = {}, {}, {}
+    # amplitude weighted mean of the doubled angles: the axis is only defined modulo 180
+    axis_sum = 0j
+    for polarizer, images in sweeps.items():
+        angles, stack = load_sweep(images, crop_box)
+        fit = fit_malus(stack, angles)
+        del stack
+        offset = analyzer_offset + wrap_angle(fit.max_angle - polarizer + polarizer_offset - analyzer_offset)
+        fits[polarizer] = fit
+        offset_maps[polarizer] = offset
+        extinction_maps[polarizer] = extinction_ratio(fit, dark_level)
+        axis_sum += np.sum(fit.amplitude * np.exp(2j * np.radians(offset)))
+    estimate = np.degrees(np.angle(axis_sum)) / 2
+    estimate = float(analyzer_offset + wrap_angle(estimate - analyzer_offset))
+    angle_error_maps = {polarizer: wrap_angle(offset - estimate) for polarizer, offset in offset_maps.items()}
+    return SweepCalibration(estimate, fits, offset_maps, extinction_maps, angle_error_maps)
+
+
+def update_mount_offsets(config_path, offsets):
+    """
+    Write offsets ({mount: degrees}) into the [mount_offsets] table of config.toml,
+    keeping the rest of the file and its comments as they are.
+    """
+    config_path = Path(config_path)
+    lines = config_path.read_text().splitlines(keepends=True)
+    start = next((i for i, line in enumerate(lines) if line.strip() == "[mount_offsets]"), None)
+    if start is None:
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+        lines += ["\n", "[mount_offsets]\n"]
+        start = len(lines) - 1
+    end = next((i for i in range(start + 1, len(lines)) if lines[i].lstrip().startswith("[")), len(lines))
+    remaining = dict(offsets)
+    for i in range(start + 1, end):
+        match = re.match(r"(\s*)(\w+)(\s*=\s*)[-\d.eE+]+(.*)", lines[i], re.DOTALL)
+        if match and match[2] in remaining:
+            lines[i] = f"{match[1]}{match[2]}{match[3]}{remaining.pop(match[2]):.2f}{match[4]}"
+    # mounts the table did not have yet go at its end, before any blank lines
+    while end > start + 1 and not lines[end - 1].strip():
+        end -= 1
+    lines[end:end] = [f"{mount} = {offset:.2f}\n" for mount, offset in remaining.items()]
+    config_path.write_text("".join(lines))
+
+
+if __name__ == "__main__":
+    import argparse
+    import tomllib
+    from modules.acquisition_planner import load_mount_offsets, MOUNT_KEYS
+
+    parser = argparse.ArgumentParser(description="Fit the polarizer calibration sweeps")
+    parser.add_argument("folder", help="Folder with the polarizer_*_analyzer_*_CZT.png images")
+    parser.add_argument("--config", default=str(Path(__file__).parent.parent / "config.toml"))
+    parser.add_argument("--dark-level", type=float, default=0.0, help="Camera counts with no light")
+    parser.add_argument("--crop", type=int, nargs=4, metavar=("X0", "Y0", "X1", "Y1"))
+    parser.add_argument("--write-config", action="store_true",
+                        help="Store the new analyzer offset in [mount_offsets] of the config")
+    args = parser.parse_args()
+
+    with open(args.config, "rb") as f:
+        offsets = dict(zip(MOUNT_KEYS, load_mount_offsets(tomllib.load(f))))
+
+    t0 = time.perf_counter()
+    sweeps = find_sweeps(args.folder)
+    calibration = calibrate_sweeps(sweeps, offsets["polarizer"], offsets["analyzer"], args.dark_level, args.crop)
+    print(f"Fitted {sum(len(images) for images in sweeps.values())} images in {time.perf_counter() - t0:.1f} s")
+    for polarizer, fit in calibration.fits.items():
+        error = calibration.angle_error_maps[polarizer]
+        print(f"Polarizer at {polarizer:g}: analyzer offset {np.median(calibration.offset_maps[polarizer]):.2f} deg, "
+              f"angle error p5..p95 {np.percentile(error, 5):.2f}..{np.percentile(error, 95):.2f} deg, "
+              f"extinction ratio median {np.median(calibration.extinction_maps[polarizer]):.0f}, "
+              f"residual median {np.median(fit.residual):.1f} counts")
+    print(f"Analyzer offset: {calibration.analyzer_offset:.2f} deg (was {offsets['analyzer']:.2f})")
+    if args.write_config:
+        update_mount_offsets(args.config, {"analyzer": calibration.analyzer_offset})
+        print(f"Updated [mount_offsets] in {args.config}")
@@ -0,0 +1,267 @@
+"""
+Single-file, chunked and compressed container for the results of one dataset.
+
+Layout of a .sir file:
+    8 bytes   magic, b"SIRSTORE"
+    8 bytes   little-endian offset of the JSON header
+    ...       chunk data
+    ...       JSON header: attributes, and for every array its dtype, shape,
+              chunk shape, compression and the (offset, length) of every chunk
+
+Every array is split into chunks (by default one frame x 256 x 256 pixels) that are
+compressed on their own, so reading a region of interest only touches the chunks
+it overlaps. The file is memory-mapped for reading: uncompressed chunks are used
+without copying and only the needed compressed bytes are read from disk.
+
+Arrays can be saved under a validity mask: chunks without a valid pixel are not
+written at all (an empty entry in the index) and read back as the fill value, so
+when the specimen covers a small part of the frame only that part takes space.
+The raw stack is never masked.
+"""
+import itertools
+import json
+import mmap
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"SIRSTORE"
+FILE_EXTENSION = ".sir"
+DEFAULT_CHUNK = 256
+_PREFIX = struct.Struct("<8sQ")
+
+# Conventional names for the arrays of a phase-stepping dataset
+RAW_STACK = "raw_stack"
+ISOCLINIC = "isoclinic_phase"
+ISOCHROMATIC = "isochromatic_phase"
+ISOCLINIC_UNWRAPPED = "isoclinic_phase_unwrapped"
+ISOCHROMATIC_UNWRAPPED = "isochromatic_phase_unwrapped"
+ISOCLINIC_VARIANCE = "isoclinic_phase_variance"
+ISOCHROMATIC_VARIANCE = "isochromatic_phase_variance"
+FIT_RESIDUAL = "phase_fit_residual"
+MODULATION = "modulation"
+VALID_MASK = "valid_mask"
+
+
+def _default_chunks(shape, chunk=DEFAULT_CHUNK):
+    # whole frames along leading axes are split one by one, the image axes in tiles
+    leading = (1,) * (len(shape) - 2)
+    return leading + tuple(min(chunk, n) for n in shape[-2:]) if len(shape) >= 2 else (min(chunk, shape[0]),)
+
+
+def _shuffle(chunk):
+    """
+    Group the bytes of every element by significance (like the HDF5 shuffle filter),
+    which makes float data compress much better.
+    """
+    raw = np.ascontiguousarray(chunk).view(np.uint8).reshape(-1, chunk.dtype.itemsize)
+    return raw.T.tobytes()
+
+
+def _unshuffle(data, dtype, shape):
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1)
+    return np.ascontiguousarray(raw.T).view(dtype).reshape(shape)
+
+
+def _chunk_slices(shape, chunks):
+    """
+    Yield (chunk grid index, tuple of slices) for every chunk in row-major order.
+    """
+    grid = [range(0, n, c) for n, c in zip(shape, chunks)]
+    for starts in itertools.product(*grid):
+        yield tuple(slice(s, min(s + c, n)) for s, c, n in zip(starts, chunks, shape))
+
+
+def _fill_value(dtype):
+    """What masked pixels read back as: NaN for floats, 0 (False) otherwise."""
+    return float("nan") if np.issubdtype(dtype, np.inexact) else 0
+
+
+def save_dataset(path, arrays, attrs=None, chunks=None, compression="zlib", level=1, mask=None, masked=None):
+    """
+    Save a dict of numpy arrays plus JSON-serialisable attributes to one .sir file.
+
+    Args:
+        path (str | Path): Output file, FILE_EXTENSION is appended if missing
+        arrays (dict): name -> numpy array
+        attrs (dict, optional): Parameters, crop box, source files, ...
+        chunks (int | tuple, optional): Tile size of the image axes, or a full chunk shape
+        compression (str): 'zlib' or 'none'
+        level (int): zlib compression level
+        mask (numpy.ndarray, optional): (H, W) boolean validity mask. In the masked
+            arrays, chunks without a valid pixel are skipped and invalid pixels are
+            stored as the fill value (NaN, or 0 for integer arrays)
+        masked (iterable, optional): Names of the arrays the mask applies to, by
+            default every array whose last two axes have the mask's shape except
+            RAW_STACK; the raw frames are always kept whole, so a threshold can be
+            chosen again later
+
+    Returns:
+        Path: The written file
+    """
+    if compression not in ("zlib", "none"):
+        raise ValueError(f"Invalid compression: {compression}")
+    path = Path(path)
+    if path.suffix != FILE_EXTENSION:
+        path = path.with_name(path.name + FILE_EXTENSION)
+
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+    header = {"attrs": attrs or {}, "arrays": {}}
+    with open(path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, 0))
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            if isinstance(chunks, tuple):
+                array_chunks = chunks
+            else:
+                array_chunks = _default_chunks(array.shape, chunks or DEFAULT_CHUNK)
+            if mask is None:
+                apply_mask = False
+            elif masked is None:
+                apply_mask = name != RAW_STACK and array.shape[-2:] == mask.shape
+            else:
+                apply_mask = name in masked and name != RAW_STACK
+            fill_value = _fill_value(array.dtype)
+            index = []
+            for slices in _chunk_slices(array.shape, array_chunks):
+                chunk = array[slices]
+                if apply_mask:
+                    chunk_mask = mask[slices[-2:]]
+                    if not chunk_mask.any():
+                        index.append([f.tell(), 0])
+                        continue
+                    if not chunk_mask.all():
+                        chunk = np.where(chunk_mask, chunk, np.array(fill_value, dtype=array.dtype))
+                if compression == "zlib":
+                    data = zlib.compress(_shuffle(chunk), level)
+                else:
+                    data = np.ascontiguousarray(chunk).tobytes()
+                index.append([f.tell(), len(data)])
+                f.write(data)
+            header["arrays"][name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "chunks": list(array_chunks),
+                "compression": compression,
+                "index": index,
+            }
+            if apply_mask:
+                header["arrays"][name]["fill_value"] = fill_value
+        header_offset = f.tell()
+        f.write(json.dumps(header).encode())
+        f.seek(0)
+        f.write(_PREFIX.pack(MAGIC, header_offset))
+    return path
+
+
+class DatasetReader:
+    """
+    Read arrays, or regions of them, from a .sir file.
+
+        with DatasetReader("sample.sir") as dataset:
+            roi = dataset.read("isochromatic_phase", (slice(100, 200), slice(50, 150)))
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_offset = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a results store file")
+        header = json.loads(self._mmap[header_offset:])
+        self.attrs = header["attrs"]
+        self._arrays = header["arrays"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    @property
+    def names(self):
+        return list(self._arrays)
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def shape(self, name):
+        return tuple(self._arrays[name]["shape"])
+
+    def dtype(self, name):
+        return np.dtype(self._arrays[name]["dtype"])
+
+    def _read_chunk(self, info, chunk_number, chunk_shape):
+        offset, length = info["index"][chunk_number]
+        if length == 0:
+            # skipped under the validity mask
+            return np.full(chunk_shape, info.get("fill_value", 0), dtype=info["dtype"])
+        if info["compression"] == "zlib":
+            return _unshuffle(zlib.decompress(self._mmap[offset:offset + length]), info["dtype"], chunk_shape)
+        # uncompressed chunks are views into the memory map
+        count = int(np.prod(chunk_shape))
+        return np.frombuffer(self._mmap, dtype=info["dtype"], count=count, offset=offset).reshape(chunk_shape)
+
+    def read(self, name, roi=None):
+        """
+        Read an array, or the region roi (a tuple of slices, one per leading axis as
+        in array[roi]) of it. Only the chunks overlapping roi are read.
+        """
+        info = self._arrays[name]
+        shape = tuple(info["shape"])
+        chunks = tuple(info["chunks"])
+        if roi is None:
+            roi = ()
+        if not isinstance(roi, tuple):
+            roi = (roi,)
+        roi = roi + (slice(None),) * (len(shape) - len(roi))
+        bounds = []
+        for s, n in zip(roi, shape):
+            if not isinstance(s, slice) or s.step not in (None, 1):
+                raise ValueError("roi must be a tuple of contiguous slices")
+            bounds.append(s.indices(n)[:2])
+
+        out = np.empty([max(stop - start, 0) for start, stop in bounds], dtype=info["dtype"])
+        if out.size == 0:
+            return out
+        grid_shape = [-(-n // c) for n, c in zip(shape, chunks)]
+        chunk_ranges = [range(start // c, (stop - 1) // c + 1) for (start, stop), c in zip(bounds, chunks)]
+        for grid_index in itertools.product(*chunk_ranges):
+            chunk_number = int(np.ravel_multi_index(grid_index, grid_shape))
+            chunk_start = [g * c for g, c in zip(grid_index, chunks)]
+            chunk_shape = [min(c, n - s) for c, n, s in zip(chunks, shape, chunk_start)]
+            chunk = self._read_chunk(info, chunk_number, chunk_shape)
+
+            src, dst = [], []
+            for (start, stop), s0, size in zip(bounds, chunk_start, chunk_shape):
+                lo, hi = max(start, s0), min(stop, s0 + size)
+                src.append(slice(lo - s0, hi - s0))
+                dst.append(slice(lo - start, hi - start))
+            out[tuple(dst)] = chunk[tuple(src)]
+        return out
+
+    def read_all(self):
+        return {name: self.read(name) for name in self.names}
+
+
+def load_dataset(path):
+    """
+    Read every array and the attributes of a .sir file.
+
+    Returns:
+        tuple: (arrays dict, attrs dict)
+    """
+    with DatasetReader(path) as dataset:
+        return dataset.read_all(), dataset.attrs
@@ -0,0 +1,87 @@
+from typing import NamedTuple
+
+
+class ROI(NamedTuple):
+    """
+    Immutable rectangular region of interest in pixel coordinates, (x0, y0, x1, y1)
+    with x1 and y1 exclusive. Unpacks like the bounding_box lists used elsewhere.
+
+    apply() returns a view of the region, so one ROI can be applied to a whole
+    (N, H, W) stack, the bad pixel mask and the phase maps without copying.
+    """
+    x0: int
+    y0: int
+    x1: int
+    y1: int
+
+    @classmethod
+    def from_bounding_box(cls, bounding_box):
+        x0, y0, x1, y1 = (int(v) for v in bounding_box)
+        return cls(x0, y0, x1, y1)
+
+    @classmethod
+    def from_ranges(cls, crop_range_x, crop_range_y):
+        return cls(int(crop_range_x[0]), int(crop_range_y[0]), int(crop_range_x[1]), int(crop_range_y[1]))
+
+    @classmethod
+    def full(cls, shape):
+        """ROI covering a whole image of shape (..., H, W)."""
+        return cls(0, 0, int(shape[-1]), int(shape[-2]))
+
+    @classmethod
+    def from_sensor_edges(cls, sensor_edges, top_margin=0, bottom_margin=0, left_margin=0, right_margin=0):
+        """
+        ROI from find_sensor_edges() output. Margins are added to the edge
+        coordinates, as in plot_edge_detection_pipeline(), so a positive top/left
+        margin and a negative bottom/right margin shrink the region.
+        """
+        return cls(int(sensor_edges.left_edge + left_margin),
+                   int(sensor_edges.top_edge + top_margin),
+                   int(sensor_edges.right_edge + right_margin),
+                   int(sensor_edges.bottom_edge + bottom_margin))
+
+    @property
+    def width(self):
+        return self.x1 - self.x0
+
+    @property
+    def height(self):
+        return self.y1 - self.y0
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    @property
+    def bounding_box(self):
+        return (self.x0, self.y0, self.x1, self.y1)
+
+    def clip(self, shape):
+        """
+        Clip to an image of shape (..., H, W). An ROI fully outside the image
+        becomes empty rather than wrapping around.
+        """
+        height, width = int(shape[-2]), int(shape[-1])
+        x0 = min(max(self.x0, 0), width)
+        y0 = min(max(self.y0, 0), height)
+        x1 = min(max(self.x1, x0), width)
+        y1 = min(max(self.y1, y0), height)
+        return ROI(x0, y0, x1, y1)
+
+    def slices(self, shape=None):
+        """
+        (row slice, column slice), clipped to shape if given.
+        """
+        roi = self if shape is None else self.clip(shape)
+        return slice(roi.y0, roi.y1), slice(roi.x0, roi.x1)
+
+    def apply(self, array):
+        """
+        View of the region in the last two axes of array, e.g. an image (H, W)
+        or a stack (N, H, W). The ROI is clipped to the array first.
+        """
+        rows, cols = self.slices(array.shape)
+        return array[..., rows, cols]
+
+    def to_dict(self):
+        return self._asdict()
@@ -1,41 +1,57 @@
-from Devices.thorlabs_rotation_mount import RotationMount
-from Devices.camera_automation import CameraAutomation
-from Devices.LED_control import LEDController
+from Devices.bench import open_bench
+from modules.acquisition_planner import load_mount_offsets, MOUNT_KEYS
+from modules.polarizer_calibration import find_sweeps, calibrate_sweeps, update_mount_offsets
 
-# import asyncio
+import argparse
 from pathlib import Path
 import tomllib
+import numpy as np
+
+parser = argparse.ArgumentParser(description="Capture analyzer sweeps for the polarizer calibration")
+parser.add_argument("--simulate", action="store_true",
+                    help="Run on simulated mounts, LED and camera instead of the hardware")
+parser.add_argument("--time-scale", type=float, default=1.0,
+                    help="Simulated seconds per real second of motion and exposure (0 for instant)")
+parser.add_argument("--save-path", default="C:/Code/Stress-Imaging/SAMPLE_DATA/polarizer_calib_w_CZT/")
+parser.add_argument("--analyze", action="store_true",
+                    help="Fit the sweeps afterwards and store the analyzer offset in config.toml")
+parser.add_argument("--dark-level", type=float, default=100.0, help="Camera counts with no light")
+args = parser.parse_args()
 
 config_path = Path(__file__).parent / "config.toml"
 with open(config_path, "rb") as f:
     config = tomllib.load(f)
 
-image_save_path = Path("C:/Code/Stress-Imaging/SAMPLE_DATA/polarizer_calib_w_CZT/")
-cam = CameraAutomation()
-led = LEDController()
+image_save_path = Path(args.save_path)
+bench = open_bench(config, simulate=args.simulate, mounts=("polarizer", "analyzer"),
+                   time_scale=args.time_scale)
+cam = bench.camera
+led = bench.led
 led.set_current(800)
 led.turn_on()
 
-polarizer = RotationMount(config["polarizer_SN"], label="Polarizer", mirror=False)
-analyzer = RotationMount(config["analyzer_SN"], label="Analyzer", mirror=True)
-
-rotation_mounts = [polarizer, analyzer]
-for mount in rotation_mounts:
-    mount.open_device()
-    mount.setup_conversion()
+polarizer = bench.polarizer
+analyzer = bench.analyzer
+bench.set_qwps("removed")
+bench.set_sample(False)
 
 polarizer_angles = [0, 45, 90]
 for alpha in polarizer_angles:
     polarizer.move_to_position(alpha)
-    for beta in range(0, 360, 11.25):
+    for beta in np.arange(0, 360, 11.25):
         analyzer.move_to_position(beta)
         if beta == 0:
-            cam.save_image_png_typewrite(f"polarizer_{alpha}_analyzer_{beta}_CZT.png", 
+            cam.save_image_png_typewrite(f"polarizer_{alpha}_analyzer_{beta:g}_CZT.png", 
                                         save_path=str(image_save_path))
         else:
-            cam.save_image_png_typewrite(f"polarizer_{alpha}_analyzer_{beta}_CZT.png")
+            cam.save_image_png_typewrite(f"polarizer_{alpha}_analyzer_{beta:g}_CZT.png")
 
 ### SHUTDOWN ###
-led.turn_off()
-for mount in rotation_mounts:
-    mount.close_device()
\ No newline at end of file
+bench.close()
+
+if args.analyze:
+    offsets = dict(zip(MOUNT_KEYS, load_mount_offsets(config)))
+    calibration = calibrate_sweeps(find_sweeps(image_save_path), offsets["polarizer"], offsets["analyzer"],
+                                   dark_level=args.dark_level)
+    print(f"Analyzer offset: {calibration.analyzer_offset:.2f} deg (was {offsets['analyzer']:.2f})")
+    update_mount_offsets(config_path, {"analyzer": calibration.analyzer_offset})